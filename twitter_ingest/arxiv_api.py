@@ -0,0 +1,69 @@
+import logging
+import xml.etree.ElementTree as ET
+from time import sleep
+from typing import Dict, Iterable, List, Optional
+
+import requests
+
+from paper_ids import extract_arxiv_id
+from scrape_arxiv import ArxivPaper
+
+logger = logging.getLogger(__name__)
+
+API_URL = "http://export.arxiv.org/api/query"
+
+# Ids per export API request, kept small enough for a GET query string
+CHUNK_SIZE = 50
+
+# arXiv asks API clients to wait 3 seconds between requests
+REQUEST_DELAY = 3
+
+ATOM = "{http://www.w3.org/2005/Atom}"
+
+
+def _text(entry: ET.Element, tag: str) -> str:
+    return " ".join((entry.findtext(ATOM + tag) or "").split())
+
+
+def parse_atom_feed(xml_data: bytes) -> Dict[str, ArxivPaper]:
+    """
+    Parses an export API Atom response into papers keyed by arXiv id.
+    """
+    papers = {}
+    root = ET.fromstring(xml_data)
+    for entry in root.iter(ATOM + "entry"):
+        arxiv_id = extract_arxiv_id(entry.findtext(ATOM + "id") or "")
+        if not arxiv_id:
+            # The API reports errors as an entry without a paper id
+            logger.warning(f"Skipping arXiv API entry: {_text(entry, 'summary')}")
+            continue
+
+        authors = [_text(a, "name") for a in entry.iter(ATOM + "author")]
+        papers[arxiv_id] = ArxivPaper(title=_text(entry, "title"),
+                                      abstract=_text(entry, "summary"),
+                                      authors=", ".join(authors))
+    return papers
+
+
+def fetch_arxiv_metadata(arxiv_ids: Iterable[str], session: Optional[requests.Session] = None,
+                         chunk_size: int = CHUNK_SIZE) -> Dict[str, ArxivPaper]:
+    """
+    Fetches metadata for all ids with one export API request per chunk.
+    Ids that fail to fetch are missing from the result.
+    """
+    session = session or requests.Session()
+    ids: List[str] = sorted(set(arxiv_ids))
+    papers = {}
+    for i in range(0, len(ids), chunk_size):
+        if i:
+            sleep(REQUEST_DELAY)
+        chunk = ids[i:i + chunk_size]
+        logger.info(f"Fetching metadata for {len(chunk)} papers from the arXiv API")
+        try:
+            response = session.get(API_URL, params={"id_list": ",".join(chunk), "max_results": len(chunk)},
+                                   timeout=30)
+            response.raise_for_status()
+            papers.update(parse_atom_feed(response.content))
+        except Exception as e:
+            logger.warning(f"Failed fetching metadata from the arXiv API: {e}")
+    return papers
@@ -0,0 +1,184 @@
+"""
+Crawls every day in a date range, one search job per day, across a pool of
+worker processes sharing one Twitter rate limit budget. Finished days are
+recorded, so rerunning the same range only crawls what is missing.
+
+    python backfill.py USERNAME PASSWORD 2023-08-01 2023-08-24 --processes 3
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import sqlite3
+from datetime import date, datetime, timedelta
+from multiprocessing.util import Finalize
+from time import time
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from checkpoint import CrawlCheckpoint
+from ingest_scrape import (PROFILE_DIR, DriverPool, Throttled, copy_profile, create_driver, day_range,
+                           day_searches, export_snapshots, ingest_searches, log_in)
+from rate_limit import SharedRateLimiter
+from related import update_related_papers
+from resolver import UrlResolver
+
+logger = logging.getLogger(__name__)
+
+# Where finished days are recorded between runs
+BACKFILL_PATH = "/tmp/ingest_backfill.db"
+
+# Passes over the days left, so throttled or failed days are retried
+MAX_ATTEMPTS = 3
+
+
+class BackfillLog:
+    """
+    Days of a backfill and how they went
+    """
+
+    def __init__(self, path: Optional[str] = BACKFILL_PATH):
+        self.conn = sqlite3.connect(path or ":memory:")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS days "
+                          "(day text primary key, status text not null, papers integer, updated_at real not null)")
+        self.conn.commit()
+
+    def done(self) -> set:
+        return {row[0] for row in self.conn.execute("SELECT day FROM days WHERE status = 'done'")}
+
+    def record(self, day: str, status: str, papers: int) -> None:
+        self.conn.execute("INSERT OR REPLACE INTO days VALUES (?, ?, ?, ?)", (day, status, papers, time()))
+        self.conn.commit()
+
+    def clear(self) -> None:
+        self.conn.execute("DELETE FROM days")
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def days_between(start: date, end: date) -> List[str]:
+    return [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range((end - start).days + 1)]
+
+
+# State of each worker process, set up by _init_worker
+_limiter: Optional[SharedRateLimiter] = None
+_pool: Optional[DriverPool] = None
+_resolver: Optional[UrlResolver] = None
+_checkpoint: Optional[CrawlCheckpoint] = None
+
+
+def _init_worker(limiter: SharedRateLimiter, next_index) -> None:
+    """
+    Starts a browser on this worker's own copy of the logged in profile
+    """
+    global _limiter, _pool, _resolver, _checkpoint
+    with next_index.get_lock():
+        index = next_index.value
+        next_index.value += 1
+
+    _limiter = limiter
+    driver = create_driver(copy_profile(index))
+    driver.limiter = limiter
+    _pool = DriverPool([driver])
+    _resolver = UrlResolver()
+    _checkpoint = CrawlCheckpoint()
+    Finalize(None, _close_worker, exitpriority=10)
+
+
+def _close_worker() -> None:
+    _pool.quit()
+    _resolver.close()
+    _checkpoint.close()
+
+
+def _ingest_day(day: str) -> Tuple[str, str, int]:
+    """
+    Crawls one day, crediting its papers to that day exactly as the daily
+    ingest does. Returns the day, how it went and the papers written.
+    """
+    current_time, y_str, t_str = day_range(datetime.strptime(day, "%Y-%m-%d").date())
+    try:
+        pipeline = ingest_searches(_pool, _resolver, current_time, day_searches(y_str, t_str),
+                                   checkpoint=_checkpoint)
+    except Throttled:
+        delay = _limiter.backoff()
+        logger.warning(f"Twitter throttled {day}, pausing all workers for {delay:.0f}s")
+        return day, "throttled", 0
+    except Exception:
+        logger.exception(f"Failed backfilling {day}")
+        return day, "failed", 0
+    _limiter.succeeded()
+    return day, "done", pipeline.written
+
+
+def backfill_days(days: List[str], log: BackfillLog,
+                  imap: Callable[[Callable, List[str]], Iterable[Tuple[str, str, int]]] = map) -> List[str]:
+    """
+    Crawls days with _ingest_day through imap, recording how each went, and
+    passes over the days that did not finish again, up to MAX_ATTEMPTS times.
+    Returns the days left.
+    """
+    for attempt in range(MAX_ATTEMPTS):
+        retry = []
+        for day, status, written in imap(_ingest_day, days):
+            log.record(day, status, written)
+            logger.info(f"Backfill of {day}: {status}, {written} papers written")
+            if status != "done":
+                retry.append(day)
+        days = sorted(retry)
+        if not days:
+            break
+        logger.info(f"Retrying {len(days)} days")
+    return days
+
+
+def _main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("username")
+    parser.add_argument("password")
+    parser.add_argument("start", type=lambda day: datetime.strptime(day, "%Y-%m-%d").date(), help="first day, YYYY-MM-DD")
+    parser.add_argument("end", type=lambda day: datetime.strptime(day, "%Y-%m-%d").date(), help="last day, YYYY-MM-DD")
+    parser.add_argument("--processes", type=int, default=int(os.getenv("BACKFILL_PROCESSES", "2")),
+                        help="days crawled in parallel, each in its own browser")
+    parser.add_argument("--per-minute", type=float, default=30, help="Twitter page loads per minute, all processes")
+    parser.add_argument("--burst", type=int, default=5, help="page loads allowed at once before the rate applies")
+    parser.add_argument("--restart", action="store_true", help="crawl days recorded as done again")
+    args = parser.parse_args()
+
+    log = BackfillLog()
+    if args.restart:
+        log.clear()
+    done = log.done()
+    days = [day for day in days_between(args.start, args.end) if day not in done]
+    logger.info(f"Backfilling {len(days)} days, {len(done)} done already")
+    if not days:
+        return
+
+    # Log in once with the main profile, which the workers then copy
+    driver = create_driver(PROFILE_DIR)
+    try:
+        log_in(driver, args.username, args.password)
+    finally:
+        driver.quit()
+
+    limiter = SharedRateLimiter(args.per_minute, args.burst)
+    next_index = multiprocessing.Value("i", 0)
+    with multiprocessing.Pool(min(args.processes, len(days)), _init_worker, (limiter, next_index)) as pool:
+        days = backfill_days(days, log, pool.imap_unordered)
+        pool.close()
+        pool.join()
+
+    if days:
+        logger.warning(f"Days left to backfill: {', '.join(days)}")
+    # Once for the whole range, the index is not safe to update from several processes
+    update_related_papers()
+    export_snapshots()
+    log.close()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    _main()
@@ -0,0 +1,114 @@
+"""
+Benchmarks the ingest parsers against a corpus recorded with
+`python ingest_scrape.py USER PASS --capture DIR`, without a browser or
+network. Defaults to the small corpus checked in with the tests, so runs
+are comparable across changes; pass a larger capture for stable numbers.
+
+Timed with perf_counter rounds rather than pytest-benchmark, which is not
+among the ingest requirements, and printed one line per benchmark.
+
+    python bench_ingest.py [DIR]
+"""
+import argparse
+import logging
+import os
+import statistics
+from datetime import datetime
+from time import perf_counter
+from typing import Callable, List, Sequence
+
+from arxiv_api import parse_atom_feed
+from checkpoint import CrawlCheckpoint
+from ingest_scrape import Driver, DriverPool, TWEETS_READY, crawl_tweets, ingest_searches, replay_database, replay_searches
+from metadata_cache import MetadataCache
+from paper_ids import canonical_paper
+from replay import Corpus, ReplayResolver, ReplaySession, ReplayWebDriver
+from scrape_arxiv import scrape_arxiv_abstract, scrape_meta_abstract
+from tweets import parse_tweet, parse_views
+
+ARXIV_SOURCES = ["arxiv.org", "ai.meta.com/research/publications", "huggingface.co"]
+
+# Recorded search and show more pages, arXiv API responses and an abs page
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests", "corpus")
+
+
+def bench(name: str, fn: Callable, items: Sequence, rounds: int, unit: str) -> List[float]:
+    """
+    Times fn over all items for each round and prints per item statistics
+    """
+    if not items:
+        print(f"{name:<28} no {unit}s in corpus")
+        return []
+
+    times = []
+    for _ in range(rounds):
+        start = perf_counter()
+        for item in items:
+            fn(item)
+        times.append((perf_counter() - start) / len(items))
+
+    print(f"{name:<28} {len(items):>6} {unit}s  min {min(times) * 1e6:10.1f} us  "
+          f"mean {statistics.mean(times) * 1e6:10.1f} us  {1 / statistics.mean(times):12.1f} {unit}s/sec")
+    return times
+
+
+def _main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpus", nargs="?", default=CORPUS_DIR)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    logging.getLogger("ingest_scrape").setLevel(logging.WARNING)
+
+    corpus = Corpus(args.corpus)
+    resolver = ReplayResolver(corpus.resolved())
+    # The crawl skips promoted tweets before parsing
+    articles = [a for a in corpus.all_articles() if len(a.text.split("\n")) > 1 and not a.text.endswith("Promoted")]
+    searches = [url for url in corpus.index if "twitter.com/search" in url]
+    abs_pages = [url for url in corpus.index if "arxiv.org/abs/" in url]
+    meta_pages = [url for url in corpus.index if "ai.meta.com/research/publications" in url]
+    feeds = [corpus.read(corpus.index[url][0]["html"]).encode("utf-8") for url in corpus.index if "api/query" in url]
+
+    bench("parse_views", lambda a: parse_views(a.text.split("\n"), True), articles, args.rounds, "article")
+    bench("parse_tweet", lambda a: parse_tweet(a, ARXIV_SOURCES, True, resolver), articles, args.rounds, "article")
+    bench("canonical_paper", canonical_paper, [link for a in articles for link in a.links], args.rounds, "url")
+
+    tweets = []
+
+    def crawl(url: str) -> None:
+        driver = Driver(ReplayWebDriver(corpus))
+        driver.go_link(url, 1, TWEETS_READY)
+        tweets.extend(crawl_tweets(driver, ARXIV_SOURCES, resolver))
+
+    start = perf_counter()
+    bench("crawl_tweets", crawl, searches, 1, "search page")
+    elapsed = perf_counter() - start
+    if tweets:
+        print(f"{'crawl throughput':<28} {len(tweets):>6} tweets  {len(tweets) / elapsed:12.1f} tweets/sec")
+
+    def scrape(scraper: Callable) -> Callable:
+        def run(url: str) -> None:
+            driver = Driver(ReplayWebDriver(corpus))
+            scraper(driver, url)
+        return run
+
+    def ingest(searches) -> None:
+        # A fresh database and metadata cache each round, so every paper is fetched
+        pool = DriverPool([Driver(ReplayWebDriver(corpus))])
+        with replay_database() as client:
+            ingest_searches(pool, resolver, datetime(2023, 8, 1), searches, ReplaySession(corpus),
+                            CrawlCheckpoint(None), client, MetadataCache(None))
+
+    times = bench("ingest pipeline", ingest, [replay_searches(corpus)], args.rounds, "run")
+    if times and tweets:
+        print(f"{'ingest throughput':<28} {len(tweets):>6} tweets  {len(tweets) / min(times):12.1f} tweets/sec")
+
+    bench("scrape_arxiv_abstract", scrape(scrape_arxiv_abstract), abs_pages, args.rounds, "paper")
+    bench("scrape_meta_abstract", scrape(scrape_meta_abstract), meta_pages, args.rounds, "paper")
+    papers = sum(len(parse_atom_feed(feed)) for feed in feeds)
+    times = bench("parse_atom_feed", parse_atom_feed, feeds, args.rounds, "feed")
+    if papers:
+        print(f"{'arXiv API metadata':<28} {papers:>6} papers  {statistics.mean(times) * len(feeds) / papers * 1e6:10.1f} us/paper")
+
+
+if __name__ == "__main__":
+    _main()
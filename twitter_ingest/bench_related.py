@@ -0,0 +1,88 @@
+"""
+Benchmarks the related papers index on synthetic abstracts: a full build, an
+incremental update with one day of new papers, loading the index and looking
+up one paper's related papers the way the website does.
+
+    python bench_related.py --papers 100000 --new 300
+"""
+import argparse
+import random
+import sqlite3
+import tempfile
+from statistics import median
+from time import perf_counter
+
+import numpy as np
+
+from db import CREATE_RELATED_PAPERS_SQL, related_statements
+from related import RelatedIndex
+
+# Topics each paper mostly draws its words from, over a shared background vocabulary
+TOPICS = 500
+TOPIC_WORDS = 40
+VOCABULARY = 30000
+WORDS_PER_PAPER = 160
+
+
+def fake_abstracts(count: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    topics = rng.integers(0, VOCABULARY, size=(TOPICS, TOPIC_WORDS))
+    # Background words are Zipf distributed, like real text
+    background = np.minimum(rng.zipf(1.3, size=(count, WORDS_PER_PAPER // 2)), VOCABULARY) - 1
+    assigned = rng.integers(0, TOPICS, size=count)
+    topical = topics[assigned[:, None], rng.integers(0, TOPIC_WORDS, size=(count, WORDS_PER_PAPER // 2))]
+    words = np.concatenate([background, topical], axis=1)
+    return [" ".join(f"w{word}" for word in row) for row in words]
+
+
+def timed(name: str, fn):
+    start = perf_counter()
+    result = fn()
+    print(f"{name:>22}: {(perf_counter() - start) * 1000:10.1f} ms")
+    return result
+
+
+def _main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--papers", type=int, default=100000)
+    parser.add_argument("--new", type=int, default=300, help="papers added by the incremental update")
+    parser.add_argument("--lookups", type=int, default=1000)
+    args = parser.parse_args()
+
+    texts = fake_abstracts(args.papers + args.new)
+    links = [f"https://arxiv.org/abs/{i}" for i in range(len(texts))]
+    path = tempfile.mkdtemp()
+
+    index = RelatedIndex(f"{path}/index")
+    timed(f"build {args.papers}", lambda: index.add(range(1, args.papers + 1), links[:args.papers],
+                                                   texts[:args.papers]))
+    timed("save", index.save)
+    index = timed("load (memory mapped)", lambda: RelatedIndex(f"{path}/index"))
+    changed = timed(f"add {args.new}", lambda: index.add(range(args.papers + 1, len(texts) + 1),
+                                                         links[args.papers:], texts[args.papers:]))
+    print(f"{'rows changed':>22}: {len(changed):10d}")
+
+    lookups = random.sample(range(index.rows), args.lookups)
+    start = perf_counter()
+    for row in lookups:
+        index.related(row)
+    print(f"{'index lookup':>22}: {(perf_counter() - start) / args.lookups * 1000:10.3f} ms per paper")
+
+    # The website reads the precomputed neighbors from the related_papers table
+    conn = sqlite3.connect(f"{path}/papers.db")
+    conn.execute(CREATE_RELATED_PAPERS_SQL)
+    for sql, params in related_statements((index.links[row], index.related(row)) for row in range(index.rows)):
+        conn.execute(sql, params)
+    conn.commit()
+    timings = []
+    for row in lookups:
+        start = perf_counter()
+        conn.execute("SELECT related_link, score FROM related_papers WHERE paper_link = ? ORDER BY rank",
+                     [index.links[row]]).fetchall()
+        timings.append(perf_counter() - start)
+    print(f"{'table lookup':>22}: {median(timings) * 1000:10.3f} ms per paper (median), "
+          f"{max(timings) * 1000:.3f} ms max")
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,60 @@
+"""
+Benchmarks the batched upsert writer against the per-row insert loop using a
+local SQLite stand-in for Turso.
+
+    python bench_write.py --tweets 50 --latency 0.05
+"""
+import argparse
+from datetime import datetime
+from time import perf_counter
+from types import SimpleNamespace
+
+from db import SCHEMA_PATH, LocalClient, paper_params, write_papers_batch
+
+
+def fake_tweets(count: int):
+    return [SimpleNamespace(
+        user=f"user{i}",
+        paper_url=f"https://arxiv.org/abs/2308.{i:05d}",
+        canonical_id=f"arxiv:2308.{i:05d}",
+        key=f"https://twitter.com/user{i}/status/{i}",
+        profile_image_url="https://pbs.twimg.com/profile_images/x.jpg",
+        views=1000 + i,
+        source="arxiv.org",
+        metadata=SimpleNamespace(title=f"Paper {i}", abstract="Abstract " * 50, authors="A. Author, B. Author"),
+    ) for i in range(count)]
+
+
+def write_per_row(client, tweets, current_time: datetime) -> None:
+    for tweet in tweets:
+        client.execute(
+            "INSERT OR IGNORE INTO papers (user, profile_image, paper_link, canonical_id, views, source, abstract, "
+            "authors, title, created_at) "
+            "VALUES (:user, :profile_image, :link, :canonical_id, :views, :source, :abstract, :authors, :title, "
+            ":created_at)",
+            paper_params(tweet, current_time))
+
+
+def run(name: str, write, tweets, latency: float) -> None:
+    with LocalClient(latency=latency) as client, open(SCHEMA_PATH) as f:
+        client.executescript(f.read())
+        start = perf_counter()
+        write(client, tweets, datetime.now())
+        elapsed = perf_counter() - start
+        rows = client.execute("SELECT count(*) FROM papers")[0][0]
+        print(f"{name:>8}: {elapsed * 1000:8.1f} ms, {client.round_trips} round trips, {rows} rows")
+
+
+def _main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tweets", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated seconds per round trip")
+    args = parser.parse_args()
+
+    tweets = fake_tweets(args.tweets)
+    run("per-row", write_per_row, tweets, args.latency)
+    run("batch", write_papers_batch, tweets, args.latency)
+
+
+if __name__ == "__main__":
+    _main()
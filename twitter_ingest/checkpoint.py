@@ -0,0 +1,142 @@
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from dataclasses import asdict
+from time import time
+from typing import Iterable, Iterator, List, Optional, Set
+
+from tweets import Tweet
+
+# Where crawl progress is kept between runs
+CHECKPOINT_PATH = "/tmp/ingest_checkpoint.db"
+
+# Searches untouched for this long are dropped, searches are per day anyway
+CHECKPOINT_AGE = 7 * 24 * 60 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS searches (
+    search text primary key, count integer not null default 0, done integer not null default 0,
+    updated_at real not null);
+CREATE TABLE IF NOT EXISTS articles (search text not null, key text not null, primary key (search, key));
+CREATE TABLE IF NOT EXISTS show_more (
+    search text not null, link text not null, done integer not null default 0, primary key (search, link));
+CREATE TABLE IF NOT EXISTS tweets (
+    key text primary key, search text not null, data text not null, written integer not null default 0);
+"""
+
+
+class SearchProgress:
+    """
+    Progress of one search page: the articles processed, the show more tweets
+    still to visit and the crawled tweets not written yet. Every change is
+    committed as it happens, so a crashed crawl resumes from its last batch.
+    """
+
+    def __init__(self, checkpoint: "CrawlCheckpoint", search: str, count: int, done: bool, seen: Set[str],
+                 show_more: Set[str], unwritten: List[Tweet]):
+        self.checkpoint = checkpoint
+        self.search = search
+        self.count = count
+        self.done = done
+        self.seen = seen
+        self.show_more = show_more
+        self.unwritten = unwritten
+
+    def record_batch(self, keys: Iterable[str], tweets: List[Tweet], show_more: Iterable[str],
+                     count: Optional[int] = None) -> None:
+        """
+        Records the articles of one scroll batch, with the tweets parsed from
+        them and the show more tweets found. count is the number of search
+        results crawled so far, if this batch is from the search page.
+        """
+        show_more = list(show_more)
+        self.show_more.update(show_more)
+        if count is not None:
+            self.count = count
+        with self.checkpoint.transaction() as conn:
+            conn.executemany("INSERT OR IGNORE INTO articles VALUES (?, ?)", [(self.search, key) for key in keys])
+            conn.executemany("INSERT OR IGNORE INTO show_more (search, link) VALUES (?, ?)",
+                             [(self.search, link) for link in show_more])
+            conn.executemany("INSERT OR IGNORE INTO tweets (key, search, data) VALUES (?, ?, ?)",
+                             [(tweet.key, self.search, json.dumps(asdict(tweet))) for tweet in tweets])
+            self._touch(conn)
+
+    def finish_show_more(self, link: str) -> None:
+        self.show_more.discard(link)
+        with self.checkpoint.transaction() as conn:
+            conn.execute("UPDATE show_more SET done = 1 WHERE search = ? AND link = ?", (self.search, link))
+            self._touch(conn)
+
+    def finish(self) -> None:
+        self.done = True
+        with self.checkpoint.transaction() as conn:
+            self._touch(conn)
+
+    def _touch(self, conn: sqlite3.Connection) -> None:
+        conn.execute("UPDATE searches SET count = ?, done = ?, updated_at = ? WHERE search = ?",
+                     (self.count, int(self.done), time(), self.search))
+
+
+class CrawlCheckpoint:
+    """
+    Local store of crawl progress per search url, so a rerun after a crash
+    skips the articles, show more tweets and searches it finished, and hands
+    the tweets crawled but never written to the pipeline again. Short links and
+    metadata are already kept by the resolver and metadata caches.
+    """
+
+    def __init__(self, path: Optional[str] = CHECKPOINT_PATH, max_age: int = CHECKPOINT_AGE):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM searches WHERE updated_at < ?", (time() - max_age,))
+            self._delete_orphans(conn)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Serializes access across crawler threads and commits on success
+        """
+        with self.lock:
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+
+    @staticmethod
+    def _delete_orphans(conn: sqlite3.Connection) -> None:
+        for table in ("articles", "show_more", "tweets"):
+            conn.execute(f"DELETE FROM {table} WHERE search NOT IN (SELECT search FROM searches)")
+
+    def search(self, search: str) -> SearchProgress:
+        """
+        Returns the progress of a search url, starting it if it is new
+        """
+        with self.transaction() as conn:
+            conn.execute("INSERT OR IGNORE INTO searches (search, updated_at) VALUES (?, ?)", (search, time()))
+            count, done = conn.execute("SELECT count, done FROM searches WHERE search = ?", (search,)).fetchone()
+            seen = {row[0] for row in conn.execute("SELECT key FROM articles WHERE search = ?", (search,))}
+            show_more = {row[0] for row in conn.execute(
+                "SELECT link FROM show_more WHERE search = ? AND done = 0", (search,))}
+            unwritten = [Tweet(**json.loads(row[0])) for row in conn.execute(
+                "SELECT data FROM tweets WHERE search = ? AND written = 0", (search,))]
+        return SearchProgress(self, search, count, bool(done), seen, show_more, unwritten)
+
+    def mark_written(self, keys: Iterable[str]) -> None:
+        with self.transaction() as conn:
+            conn.executemany("UPDATE tweets SET written = 1 WHERE key = ?", [(key,) for key in keys])
+
+    def clear(self) -> None:
+        """
+        Forgets all progress, so the next crawl starts over
+        """
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM searches")
+            self._delete_orphans(conn)
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,292 @@
+import os
+import sqlite3
+from datetime import datetime
+from time import sleep
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+# Tables and indexes of the papers database
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")
+
+# Tweets per batch request. Each batch is executed by libsql as a single
+# transaction, so a chunk of tweets lands completely or not at all. A write of
+# more tweets is split into several batches to stay under the request size
+# limit, and can land partially: the chunks committed before a failure stay.
+# Rewriting them is harmless, every statement is an upsert.
+BATCH_SIZE = 200
+
+# Every tweet linking a paper is kept with its own views, so seeing the same
+# tweet again (from another search or a later crawl) never double counts it.
+UPSERT_TWEET_SQL = """
+INSERT INTO paper_tweets (tweet, canonical_id, user, profile_image, views)
+VALUES (:tweet, :canonical_id, :user, :profile_image, :views)
+ON CONFLICT (tweet) DO UPDATE SET views = excluded.views
+WHERE excluded.views > paper_tweets.views
+"""
+
+# Papers are stored once per canonical id, whichever url variant was seen first
+INSERT_PAPER_SQL = """
+INSERT INTO papers (user, profile_image, paper_link, canonical_id, views, source, abstract, authors, title, created_at)
+VALUES (:user, :profile_image, :link, :canonical_id, :views, :source, :abstract, :authors, :title, :created_at)
+ON CONFLICT DO NOTHING
+"""
+
+# A paper's views are the sum over its tweets, and the most viewed tweet is
+# the credited one.
+UPDATE_PAPER_VIEWS_SQL = """
+UPDATE papers SET
+    views = (SELECT sum(views) FROM paper_tweets WHERE canonical_id = :canonical_id),
+    (user, profile_image) = (SELECT user, profile_image FROM paper_tweets
+                             WHERE canonical_id = :canonical_id ORDER BY views DESC LIMIT 1)
+WHERE canonical_id = :canonical_id
+"""
+
+CREATE_PAPER_TWEETS_SQL = """
+CREATE TABLE IF NOT EXISTS paper_tweets (
+    tweet text primary key,
+    canonical_id text not null,
+    user text not null,
+    profile_image text,
+    views integer default 0
+)
+"""
+
+CREATE_PAPER_TWEETS_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS idx_paper_tweets_canonical_id ON paper_tweets (canonical_id, views)
+"""
+
+CREATE_CANONICAL_ID_INDEX_SQL = """
+CREATE UNIQUE INDEX IF NOT EXISTS idx_papers_canonical_id ON papers (canonical_id)
+"""
+
+# Precomputed by related.py, rank 0 is the most similar paper
+CREATE_RELATED_PAPERS_SQL = """
+CREATE TABLE IF NOT EXISTS related_papers (
+    paper_link text not null,
+    rank integer not null,
+    related_link text not null,
+    score real not null,
+    primary key (paper_link, rank)
+)
+"""
+
+# Full-text index over papers for the website's /search, kept in sync by
+# triggers. Databases created before it are migrated by migrate_fts.py.
+CREATE_PAPERS_FTS_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5(
+        title, abstract, authors,
+        content='papers', content_rowid='rowid'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS papers_fts_insert AFTER INSERT ON papers BEGIN
+        INSERT INTO papers_fts(rowid, title, abstract, authors) VALUES (new.rowid, new.title, new.abstract, new.authors);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS papers_fts_delete AFTER DELETE ON papers BEGIN
+        INSERT INTO papers_fts(papers_fts, rowid, title, abstract, authors)
+        VALUES ('delete', old.rowid, old.title, old.abstract, old.authors);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS papers_fts_update AFTER UPDATE OF title, abstract, authors ON papers BEGIN
+        INSERT INTO papers_fts(papers_fts, rowid, title, abstract, authors)
+        VALUES ('delete', old.rowid, old.title, old.abstract, old.authors);
+        INSERT INTO papers_fts(rowid, title, abstract, authors) VALUES (new.rowid, new.title, new.abstract, new.authors);
+    END
+    """,
+]
+
+Statement = Tuple[str, Union[Dict[str, Any], Sequence]]
+
+
+def to_db_time(current_time: datetime) -> int:
+    """
+    The website reads created_at as milliseconds since epoch
+    """
+    return int(current_time.timestamp() * 1000)
+
+
+def tweet_params(tweet) -> Dict[str, Any]:
+    return {
+        "tweet": tweet.key,
+        "canonical_id": tweet.canonical_id,
+        "user": tweet.user,
+        "profile_image": tweet.profile_image_url,
+        "views": tweet.views,
+    }
+
+
+def paper_params(tweet, current_time: datetime) -> Dict[str, Any]:
+    return {
+        "canonical_id": tweet.canonical_id,
+        "user": tweet.user,
+        "profile_image": tweet.profile_image_url,
+        "views": tweet.views,
+        "link": tweet.paper_url,
+        "source": tweet.source,
+        "abstract": tweet.metadata.abstract,
+        "title": tweet.metadata.title,
+        "authors": tweet.metadata.authors,
+        "created_at": to_db_time(current_time),
+    }
+
+
+def chunks(items: Sequence, size: int) -> Iterable[Sequence]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def paper_statements(tweets: Sequence, current_time: datetime) -> List[Statement]:
+    """
+    Records every tweet, inserts the papers that come with metadata, then
+    refreshes the aggregated views of each paper touched.
+    """
+    statements = [(UPSERT_TWEET_SQL, tweet_params(tweet)) for tweet in tweets]
+    statements += [(INSERT_PAPER_SQL, paper_params(tweet, current_time))
+                   for tweet in tweets if tweet.metadata is not None]
+    canonical_ids = dict.fromkeys(tweet.canonical_id for tweet in tweets)
+    statements += [(UPDATE_PAPER_VIEWS_SQL, {"canonical_id": c}) for c in canonical_ids]
+    return statements
+
+
+def write_papers_batch(client, tweets: List, current_time: datetime, batch_size: int = BATCH_SIZE) -> int:
+    """
+    Writes all tweets with one batch round trip per chunk of batch_size tweets.
+    Each chunk commits on its own, so a failure keeps the chunks before it.
+    Tweets without metadata are papers stored already, or claimed by another
+    tweet of this run, and only add their views.
+    Returns the number of batches sent.
+    """
+    batches = 0
+    for chunk in chunks(tweets, batch_size):
+        client.batch(paper_statements(chunk, current_time))
+        batches += 1
+    return batches
+
+
+def related_statements(related: Iterable[Tuple[str, List[Tuple[str, float]]]]) -> List[Statement]:
+    """
+    Replaces the related papers of each paper link with the given links and scores
+    """
+    statements: List[Statement] = []
+    for link, papers in related:
+        statements.append(("DELETE FROM related_papers WHERE paper_link = ?", [link]))
+        statements += [("INSERT INTO related_papers VALUES (?, ?, ?, ?)", [link, rank, related_link, score])
+                       for rank, (related_link, score) in enumerate(papers)]
+    return statements
+
+
+def fetch_known_papers(client) -> Dict[str, str]:
+    """
+    Returns the paper_link of every stored paper keyed by canonical id, in one
+    query.
+    """
+    rows = client.execute("SELECT canonical_id, paper_link FROM papers WHERE canonical_id IS NOT NULL")
+    return {row[0]: row[1] for row in rows}
+
+
+def migrate_canonical_ids(client, canonical_paper: Callable[[str], Tuple[str, str]]) -> int:
+    """
+    Brings a database created before canonical ids up to date: adds the
+    canonical_id column and paper_tweets table, merges papers stored under
+    several url variants into the most viewed row, stored under the canonical
+    url like new papers, keeps each old row's views as a legacy tweet and adds
+    the unique index. Only rows without a canonical id are touched, so it is
+    safe to run again.
+    Returns the number of duplicate rows removed.
+    """
+    columns = [row[1] for row in client.execute("PRAGMA table_info(papers)")]
+    statements: List[Union[str, Statement]] = []
+    if "canonical_id" in columns:
+        stored = fetch_known_papers(client)
+        rows = client.execute("SELECT rowid, paper_link, user, profile_image, views FROM papers "
+                              "WHERE canonical_id IS NULL")
+    else:
+        stored = {}
+        statements.append("ALTER TABLE papers ADD COLUMN canonical_id text")
+        rows = client.execute("SELECT rowid, paper_link, user, profile_image, views FROM papers")
+    statements += [CREATE_PAPER_TWEETS_SQL, CREATE_PAPER_TWEETS_INDEX_SQL]
+
+    keepers: Dict[str, Tuple[int, int, str]] = {}
+    for rowid, link, user, profile_image, views in rows:
+        paper_id, paper_link = canonical_paper(link)
+        views = views or 0
+        statements.append(("INSERT OR IGNORE INTO paper_tweets (tweet, canonical_id, user, profile_image, views) "
+                           "VALUES (?, ?, ?, ?, ?)", ["legacy:" + link, paper_id, user, profile_image, views]))
+        keeper = keepers.get(paper_id)
+        if paper_id not in stored and (keeper is None or views > keeper[1]):
+            keepers[paper_id] = (rowid, views, paper_link)
+
+    kept = {rowid for rowid, _, _ in keepers.values()}
+    removed = [row[0] for row in rows if row[0] not in kept]
+    # Removed first, a duplicate may be stored under the canonical url already
+    statements += [("DELETE FROM papers WHERE rowid = ?", [rowid]) for rowid in removed]
+    statements += [("UPDATE papers SET canonical_id = ?, paper_link = ? WHERE rowid = ?", [paper_id, paper_link, rowid])
+                   for paper_id, (rowid, _, paper_link) in keepers.items()]
+    touched = dict.fromkeys(canonical_paper(row[1])[0] for row in rows)
+    statements += [(UPDATE_PAPER_VIEWS_SQL, {"canonical_id": paper_id}) for paper_id in touched]
+    statements.append(CREATE_CANONICAL_ID_INDEX_SQL)
+    client.batch(statements)
+    return len(removed)
+
+
+def migrate_fts(client) -> int:
+    """
+    Adds the full-text index and its triggers to a database created before
+    them, and indexes every stored paper. Rebuilding the index from the papers
+    makes it safe to run again.
+    Returns the number of papers indexed.
+    """
+    client.batch(CREATE_PAPERS_FTS_SQL + ["INSERT INTO papers_fts(papers_fts) VALUES ('rebuild')"])
+    return client.execute("SELECT count(*) FROM papers")[0][0]
+
+
+class LocalClient:
+    """
+    Local SQLite stand-in for the libsql sync client, exposing the execute and
+    batch calls we use. latency adds a fixed delay per call to simulate the
+    network round trip to Turso.
+    """
+
+    def __init__(self, path: str = ":memory:", latency: float = 0.0):
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.latency = latency
+        self.round_trips = 0
+
+    def _round_trip(self) -> None:
+        self.round_trips += 1
+        if self.latency:
+            sleep(self.latency)
+
+    def execute(self, sql: str, args: Optional[Union[Dict[str, Any], Sequence]] = None) -> List[sqlite3.Row]:
+        self._round_trip()
+        return self.conn.execute(sql, args or ()).fetchall()
+
+    def executescript(self, script: str) -> None:
+        self.conn.executescript(script)
+
+    def batch(self, stmts: List[Union[str, Statement]]) -> List[List[sqlite3.Row]]:
+        self._round_trip()
+        results = []
+        self.conn.execute("BEGIN")
+        try:
+            for stmt in stmts:
+                sql, args = (stmt, ()) if isinstance(stmt, str) else stmt
+                results.append(self.conn.execute(sql, args).fetchall())
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+        return results
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
@@ -1,34 +1,90 @@
+import argparse
+import json
 import logging
 import os
+import shutil
 import sys
-from dataclasses import dataclass
-from datetime import datetime, timedelta
-from time import sleep
-from typing import List, Optional
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from queue import Empty, Full, Queue
+from time import perf_counter, sleep
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 from urllib.parse import urljoin, urlparse
 
 import libsql_client
+import psutil
 import requests
 from dotenv import load_dotenv
-from requests.adapters import HTTPAdapter
 from selenium import webdriver
-from selenium.common.exceptions import StaleElementReferenceException
+from selenium.common.exceptions import StaleElementReferenceException, TimeoutException
 from selenium.webdriver import Chrome
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.remote.webelement import WebElement
-from urllib3 import Retry
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
 from webdriver_manager.chrome import ChromeDriverManager
 
-from scrape_arxiv import ArxivPaper, scrape_arxiv_abstract, scrape_meta_abstract
+from arxiv_api import fetch_arxiv_metadata
+from checkpoint import CHECKPOINT_PATH, CrawlCheckpoint, SearchProgress
+from db import SCHEMA_PATH, LocalClient, fetch_known_papers, write_papers_batch
+from instrumentation import PROM_PATH, REPORT_PATH, metrics, write_report
+from metadata_cache import MetadataCache
+from paper_ids import extract_arxiv_id
+from related import update_related_papers
+from replay import Corpus, Recorder, RecordingSession, ReplayResolver, ReplaySession, ReplayWebDriver
+from resolver import UrlResolver
+from scrape_arxiv import scrape_arxiv_abstract, scrape_meta_abstract
+from tweets import EXTRACT_ARTICLES_JS, LAST_ARTICLE_JS, Article, Tweet, parse_tweet, parse_views
 
 ## CONSTANTS
 
 # Maximum tweets to crawl each page
 MAX_TWEETS = 50
 
+# Chrome profile holding the logged in Twitter session
+PROFILE_DIR = "/tmp/ingest_profile"
+
+# Seconds to wait for each login step
+LOGIN_TIMEOUT = 15
+
+# Seconds to wait for new articles to render after scrolling
+SCROLL_TIMEOUT = 5
+
+# Most scroll batches crawled per page, however many articles keep loading
+MAX_SCROLLS = 100
+
+# Requests the browser never makes: images, video and fonts
+BLOCKED_URLS = [
+    "*pbs.twimg.com/*", "*video.twimg.com/*",
+    "*.jpg*", "*.jpeg*", "*.png*", "*.gif*", "*.webp*", "*.svg*", "*.ico*",
+    "*.mp4*", "*.m3u8*", "*.m4s*", "*.webm*",
+    "*.woff*", "*.ttf*", "*.otf*",
+]
+
+# Pages a browser loads, or bytes of memory it uses, before it is relaunched
+RECYCLE_PAGES = 100
+RECYCLE_RSS = 1536 * 2 ** 20
+
+# Tweets buffered between ingest pipeline stages before the producer blocks
+QUEUE_SIZE = 100
+
+# Tweets per metadata lookup and per database write in the pipeline
+METADATA_BATCH = 20
+WRITE_BATCH = 20
+
+# Seconds a pipeline stage waits for more tweets before flushing a partial batch
+FLUSH_INTERVAL = 2
+
+# Paper sources looked for on every search of a replayed corpus
+REPLAY_SOURCES = ["arxiv.org", "ai.meta.com/research/publications", "huggingface.co"]
+
+# Marks the end of a pipeline queue
+PIPELINE_END = object()
+
 logging.basicConfig(
     format='%(asctime)s %(levelname)-8s %(message)s',
     level=logging.INFO,
@@ -39,145 +95,136 @@ stdout.setLevel(logging.DEBUG)
 logger.addHandler(stdout)
 logger.setLevel(logging.DEBUG)
 
+# Page readiness conditions for Driver.go_link
+TWEETS_READY = EC.presence_of_element_located((By.TAG_NAME, "article"))
+LOGIN_OR_TWEETS_READY = EC.any_of(TWEETS_READY, EC.presence_of_element_located((By.TAG_NAME, "input")))
+
+
+def url_pattern(url: str) -> str:
+    """
+    Groups urls by host and first path segment, e.g. twitter.com/search
+    """
+    parsed = urlparse(url)
+    return parsed.netloc + "/" + parsed.path[1:].split("/")[0]
+
+
 class Driver:
-    def __init__(self, driver: Chrome):
+    """
+    A browser and the page it is on. Browsers started with launch are
+    measured as they go, and relaunched on the same profile once they have
+    loaded RECYCLE_PAGES pages or grown past RECYCLE_RSS, so memory doesn't
+    grow for the whole run.
+    """
+
+    def __init__(self, driver: Chrome, recorder: Optional[Recorder] = None,
+                 launch: Optional[Callable[[], Chrome]] = None):
         self.driver = driver
         self.last_link = None
+        self.recorder = recorder
+        self.launch = launch
+        # Shared budget of Twitter page loads, when several processes crawl
+        self.limiter = None
+        self.pages = 0
+        self.rss = 0
+        # Observed seconds until ready, per url pattern
+        self.ready_times: Dict[str, List[float]] = defaultdict(list)
+
+    def _browser_rss(self) -> int:
+        """
+        Resident memory of chromedriver and every browser process under it
+        """
+        try:
+            process = psutil.Process(self.driver.service.process.pid)
+            return sum(p.memory_info().rss for p in [process, *process.children(recursive=True)])
+        except (AttributeError, psutil.Error):
+            return 0
+
+    def sample(self) -> None:
+        """
+        Records the bytes the browser downloaded and the requests it blocked
+        since the last sample, and its current memory
+        """
+        if not self.launch:
+            return
 
-    def go_link(self, url: str, sleep_time: int):
+        downloaded = 0
+        blocked = 0
+        for entry in self.driver.get_log("performance"):
+            message = json.loads(entry["message"])["message"]
+            if message["method"] == "Network.loadingFinished":
+                downloaded += message["params"].get("encodedDataLength", 0)
+            elif message["method"] == "Network.loadingFailed" and message["params"].get("blockedReason"):
+                blocked += 1
+        metrics.count("browser_bytes", int(downloaded))
+        metrics.count("browser_requests_blocked", blocked)
+
+        self.rss = self._browser_rss()
+        metrics.maximum("browser_peak_rss_bytes", self.rss)
+
+    def recycle(self) -> None:
+        """
+        Relaunches the browser on the same profile, keeping the logged in session
+        """
+        logger.info(f"Recycling browser after {self.pages} pages at {self.rss / 2 ** 20:.0f} MiB")
+        self.driver.quit()
+        self.driver = self.launch()
+        self.pages = 0
+        self.last_link = None
+        metrics.count("browser_recycles")
+
+    def quit(self) -> None:
+        self.sample()
+        self.driver.quit()
+
+    def throttle(self) -> None:
+        """
+        Waits for the rate limit budget before loading more from Twitter
+        """
+        if self.limiter:
+            self.limiter.acquire()
+
+    def go_link(self, url: str, timeout: int, ready: Optional[Callable] = None):
+        """
+        Navigates to url and returns as soon as the ready condition holds, or
+        after timeout seconds. Without a condition it sleeps for timeout.
+        """
         if self.last_link == url:
             return
 
-        logger.info(f"Navigating to {url} with sleep {sleep_time}")
+        self.sample()
+        if self.launch and (self.pages >= RECYCLE_PAGES or self.rss >= RECYCLE_RSS):
+            self.recycle()
+        if urlparse(url).netloc.endswith("twitter.com"):
+            self.throttle()
+
+        logger.info(f"Navigating to {url} with timeout {timeout}")
+        start = perf_counter()
         self.driver.get(url)
-        sleep(sleep_time)
+        if ready:
+            try:
+                WebDriverWait(self.driver, timeout).until(ready)
+            except TimeoutException:
+                logger.warning(f"Page {url} not ready after {timeout}s")
+        else:
+            sleep(timeout)
+        elapsed = perf_counter() - start
+        self.ready_times[url_pattern(url)].append(elapsed)
+        metrics.observe("navigation", elapsed)
+        self.pages += 1
+        logger.debug(f"Page {url} ready in {elapsed:.2f}s")
         self.last_link = url
+        if self.recorder:
+            self.recorder.record_page(url, self.driver.page_source)
 
-@dataclass
-class Tweet:
-    text: str
-    profile_image_url: str
-    embedded_image_url: Optional[str]
-    paper_url: str
-    user: str
-    source: str
-    views: int
-    metadata: ArxivPaper
-
-
-def write_papers_to_db(tweets: List[Tweet], url: str, auth_token: str, current_time: datetime) -> None:
-    logger.info(f"Writing {len(tweets)} of papers to db")
-    with libsql_client.create_client_sync(url=url, auth_token=auth_token) as client:
-        for tweet in tweets:
-            client.execute(
-                "INSERT OR IGNORE INTO papers VALUES (:user, :profile_image, :link, :views, :source, :created_at, :title, :authors, :abstract)",
-                {
-                    "user": tweet.user,
-                    "link": tweet.paper_url,
-                    "profile_image": tweet.profile_image_url,
-                    "views": tweet.views,
-                    "source": tweet.source,
-                    "abstract": tweet.metadata.abstract,
-                    "title": tweet.metadata.title,
-                    "authors": tweet.metadata.authors,
-                    "created_at": current_time,
-                })
-
-
-def resolve_url(base_url):
-    adapter = HTTPAdapter(max_retries=
-                          Retry(total=2, backoff_factor=1, allowed_methods=None, status_forcelist=[429, 500, 502, 503, 504]))
-    s = requests.Session()
-    s.mount("http://", adapter)
-    s.mount("https://", adapter)
-    try:
-        r = s.get(base_url)
-    except Exception as e:
-        logger.warning(f"Cannot connect to {base_url}: {e}")
-
-        # Return the url if we cannot connect to it
-        return base_url
-
-    return r.url
-
-
-def parse_views(lines: List[str], list_view: bool) -> int:
-    view_str = lines[-1].strip()
-    if not str(view_str[0]).isdigit():
-        # In the per tweet status view, need to find the views line
-        found_views = False
-        for line in reversed(lines):
-            if found_views:
-                view_str = line
-                break
+    def log_ready_times(self) -> None:
+        for pattern, times in self.ready_times.items():
+            logger.info(f"Navigation to {pattern}: {len(times)} pages, "
+                        f"avg {sum(times) / len(times):.2f}s, max {max(times):.2f}s")
 
-            if line.strip() == "Views":
-                found_views = True
-
-    view_str = view_str.replace(",", "")
-    if view_str.endswith("K"):
-        # Replace decimal and append 00
-        view_str = view_str.replace(".", "")
-        view_str = view_str[0:-1] + "00"
-
-    if view_str.endswith("M"):
-        # Replace decimal and append 00
-        view_str = view_str.replace(".", "")
-        view_str = view_str[0:-1] + "00000"
-
-    return int(view_str)
-
-def has_enough_parts(url: str) -> bool:
-    parsed = urlparse(url)
-    return len(parsed.path[1:].split("/")) > 1
-
-
-def parse_tweet(element: WebElement, sources: List[str], list_view: bool) -> Optional[Tweet]:
-    text = element.text
-    lines = text.split("\n")
-    if len(lines) == 1:
-        logger.warn("Found a unexpected tweet: " + text)
-        return None
-
-    user = lines[1][1:]  # remove @
-    images = element.find_elements(By.TAG_NAME, "img")
-    profile_image = ""
-    if len(images) > 0:
-        profile_image = images[0].get_attribute("src")
-    embedded_image = None
-    if len(images) > 1:
-        embedded_image = images[1].get_attribute("src")
-
-    paper_url = None
-    found_source = None
-
-    for u in element.find_elements(By.TAG_NAME, "a"):
-        url = u.get_attribute("href")
-        if "t.co" in url:
-            url = resolve_url(url)
-
-        for source in sources:
-            if source in url and has_enough_parts(url):
-                paper_url = url
-                found_source = source
-                break
-
-    if not paper_url:
-        return None
-
-    views = parse_views(lines, list_view)
-
-    return Tweet(text=element.text,
-                 user=user,
-                 views=views,
-                 paper_url=paper_url,
-                 profile_image_url=profile_image,
-                 source=found_source,
-                 embedded_image_url=embedded_image,
-                 metadata=None)
-
-
-def login(driver: Chrome, username: str, password: str) -> None:
+def login(driver: Chrome, username: str, password: str) -> bool:
+    """
+    Logs in if the current page asks for it, returning whether it did.
+    """
     spans = driver.find_elements(By.TAG_NAME, "span")
     required_login = False
     for span in spans:
@@ -185,152 +232,267 @@ def login(driver: Chrome, username: str, password: str) -> None:
             required_login = True
 
     if not required_login:
-        return
+        return False
 
     login_box = driver.find_element(By.TAG_NAME, "input")
     login_box.send_keys(username)
     actions = ActionChains(driver)
     actions.send_keys(Keys.ENTER).perform()
-    sleep(3)
+    password_box = WebDriverWait(driver, LOGIN_TIMEOUT).until(
+        EC.element_to_be_clickable((By.NAME, "password")))
 
-    driver.switch_to.active_element.send_keys(password)
+    password_box.send_keys(password)
     actions = ActionChains(driver)
     actions.send_keys(Keys.ENTER).perform()
-    sleep(3)
+    WebDriverWait(driver, LOGIN_TIMEOUT).until(EC.invisibility_of_element_located((By.NAME, "password")))
+    return True
 
 
 def date_ranges() -> (datetime, str, str):
     """
     Returns date range for twitter query and db time
     """
-    t = datetime.now().date()
-    y = (datetime.now() - timedelta(days=1)).date()
-    return (datetime(year=y.year, month=y.month, day=y.day), y.strftime("%Y-%m-%d"), t.strftime("%Y-%m-%d"))
+    return day_range((datetime.now() - timedelta(days=1)).date())
 
 
-def normalize_arxiv_url(url: str) -> str:
-    prefixes = [
-         "https://huggingface.co/papers/",
-         "https://arxiv.org/pdf/"
-     ]
+def day_range(day: date) -> (datetime, str, str):
+    """
+    Returns the db time of day and the twitter query range covering it
+    """
+    t = day + timedelta(days=1)
+    return (datetime(year=day.year, month=day.month, day=day.day), day.strftime("%Y-%m-%d"), t.strftime("%Y-%m-%d"))
 
-    for p in prefixes:
-        if url.startswith(p):
-            return "https://arxiv.org/abs/" + url[len(p):]
 
-    return url
+def day_searches(y_str: str, t_str: str) -> List[Tuple[str, List[str]]]:
+    """
+    Returns the search urls crawled for one day, with the paper sources each
+    one looks for. Every search is bounded to the day, so a backfilled day
+    never picks up the papers of the days after it.
+    """
+    arxiv_sources = ["arxiv.org", "ai.meta.com/research/publications"]
+    return [
+        (f"https://twitter.com/search?q=llms%20filter%3Alinks%20until%3A{t_str}%20since%3A{y_str}&src=typed_query&f=top",
+         arxiv_sources),
+        (f"https://twitter.com/search?q=llm%20until%3A{t_str}%20since%3A{y_str}%20filter%3Alinks&src=typed_query&f=top",
+         arxiv_sources),
+        (f"https://twitter.com/search?q=gpt4%20filter%3Alinks%20until%3A{t_str}%20since%3A{y_str}%20&src=typed_query&f=top",
+         arxiv_sources),
+        # Crawl huggingface papers from Twitter
+        (f"https://twitter.com/search?q=huggingface.co%2Fpapers%20filter%3Alinks%20until%3A{t_str}%20since%3A{y_str}&src=typed_query&f=top",
+         ["huggingface.co"]),
+    ]
+
 
-def fetch_paper_metadata(driver: Chrome, tweet: Tweet) -> None:
+def fetch_paper_metadata(driver: Driver, tweet: Tweet) -> None:
     """
-    Populates the metadata object
+    Populates the metadata object, retrying once if the page re-rendered
+    while it was read
     """
-    url = normalize_arxiv_url(tweet.paper_url)
-    if "ai.meta.com/research/publications" in url:
-        metadata = scrape_meta_abstract(driver, url)
-    else:
-        metadata = scrape_arxiv_abstract(driver, url)
+    url = tweet.paper_url
+    scrape = scrape_meta_abstract if tweet.canonical_id.startswith("meta:") else scrape_arxiv_abstract
+    with metrics.time("fetch_metadata"):
+        try:
+            metadata = scrape(driver, url)
+        except StaleElementReferenceException:
+            metrics.count("stale_elements")
+            driver.last_link = None
+            metadata = scrape(driver, url)
     tweet.metadata = metadata
 
 
-def detect_show_more(article: WebElement) -> Optional[str]:
+def metadata_key(url: str) -> str:
     """
-    Finds if there is a "Show More" link in the tweet, which can cause us
-    not able to crawl the tweet properly.
-    In this case, get the tweet link so we can crawl those later.
+    Metadata cache key of a paper: the arXiv id, or the canonical url elsewhere
     """
-    spans = article.find_elements(By.TAG_NAME, "span")
-    is_show_more = False
-    for span in spans:
-        if span.text.strip() == "Show more":
-            is_show_more = True
-            break
-
-    link = None
-    if is_show_more:
-        logger.debug(f"Attempting to find link in show more tweet")
-        # Find the status link since this is a Tweet with "show more"
-        time_element = article.find_element(By.TAG_NAME, "time")
-        link_element = time_element.find_element(By.XPATH, "parent::*")
-        link = link_element.get_attribute("href")
-        logger.debug(f"Found show more tweet with link {link}")
-
-    return link
-
-
-def crawl_tweets(driver: Driver, sources: List[str]) -> List[Tweet]:
-    action = ActionChains(driver.driver)
-    tweets: List[Tweet] = []
-    show_more_links = set()
-    ids = set()
-    # We track the last batch of ids, so when we get the exact same ones we know we're at the end.
-    last_batch_ids = set()
-
-    def parse_article(article: WebElement, override_views: int = 0) -> bool:
-        if article.id not in ids:
-            ids.add(article.id)
-            if article.text.endswith("Promoted"):
-                # Skip promoted tweets
-                return False
+    return extract_arxiv_id(url) or url
 
-            try:
-                show_more_link = detect_show_more(article)
-            except StaleElementReferenceException as e:
-                logger.warn("Detected stale element in finding show more, skipping")
-                return False
-
-            if show_more_link:
-                logger.info(f"Adding article {article.id} to show more")
-                show_more_links.add(show_more_link)
-                # Skip show more tweets, as we'll crawl them later
-                return False
-
-            tweet = parse_tweet(article, sources, True)
-            if tweet:
-                tweet.views = max(tweet.views, override_views)
-                tweets.append(tweet)
-
-        return True
-
-    def scroll_and_crawl(count: int, override_views: int = 0):
-        articles = driver.driver.find_elements(By.TAG_NAME, "article")
-        article_ids = set(a.id for a in articles)
-        if last_batch_ids == article_ids:
-            return
 
-        last_batch_ids.clear()
-        for a in article_ids: last_batch_ids.add(a)
+def prefetch_metadata(tweets: List[Tweet], known: Dict[str, str], cache: MetadataCache,
+                      session: Optional[requests.Session] = None) -> Tuple[List[Tweet], int]:
+    """
+    Populates the metadata of new papers that don't need a browser. Papers
+    already in the database are pointed at their stored link and left without
+    metadata, cached papers are filled from the cache and arXiv papers are
+    fetched in bulk from the export API.
+    Returns the tweets that still need scraping and the number of metadata
+    fetches avoided.
+    """
+    start = perf_counter()
+    pending = []
+    for tweet in tweets:
+        stored_link = known.get(tweet.canonical_id)
+        if stored_link:
+            tweet.paper_url = stored_link
+        else:
+            pending.append(tweet)
+
+    keys = {id(tweet): metadata_key(tweet.paper_url) for tweet in pending}
+    cached = cache.get_many(keys.values())
+    # Keys that are not urls are arXiv ids
+    arxiv_ids = {key for key in keys.values() if key not in cached and not key.startswith("http")}
+    papers = fetch_arxiv_metadata(arxiv_ids, session)
+    cache.put_many(papers)
+
+    scrape = []
+    for tweet in pending:
+        key = keys[id(tweet)]
+        metadata = cached.get(key) or papers.get(key)
+        if metadata:
+            tweet.metadata = metadata
+        else:
+            scrape.append(tweet)
+
+    cache_hits = sum(1 for tweet in pending if keys[id(tweet)] in cached)
+    avoided = len(tweets) - len(pending) + cache_hits
+    metrics.count("known_papers", len(tweets) - len(pending))
+    metrics.count("metadata_cache_hits", cache_hits)
+    metrics.count("metadata_api_fetched", len(papers))
+    metrics.observe("prefetch_metadata", perf_counter() - start)
+    logger.info(f"Avoided {avoided} of {len(tweets)} metadata fetches")
+    return scrape, avoided
+
+
+def scrape_metadata(pool: "DriverPool", tweets: List[Tweet], cache: MetadataCache) -> None:
+    """
+    Scrapes the metadata of tweets across all browsers
+    """
+    pool.map(fetch_paper_metadata, tweets)
+    cache.put_many({metadata_key(tweet.paper_url): tweet.metadata for tweet in tweets})
 
-        logger.debug(f"Found {len(articles)} articles in scroll, {article_ids}")
 
-        for article in sorted(articles, key=lambda x: int(x.id.split("_")[-1])):
-            logger.debug(f"Processing article {article.id}")
-            if article.id not in ids:
-                try:
-                    action.move_to_element(article).perform()
-                    if parse_article(article=article, override_views=override_views):
-                        count += 1
-                except StaleElementReferenceException:
-                    logger.warn(f"Found stale element navigating to article {article.id}")
-                    break
+def extract_articles(driver: Driver, scroll: bool = False) -> List[Article]:
+    """
+    Extracts all visible articles in one round trip, optionally scrolling to
+    the last one afterwards
+    """
+    with metrics.time("extract_articles"):
+        articles = driver.driver.execute_script(EXTRACT_ARTICLES_JS, scroll)
+    if driver.recorder:
+        driver.recorder.record_page(driver.last_link, driver.driver.page_source, articles)
+    return [Article(**data) for data in articles]
+
+
+def wait_for_scroll(driver: Driver, keys: Set[str]) -> None:
+    """
+    Waits until scrolling rendered an article that wasn't in the last batch
+    """
+    start = perf_counter()
+    try:
+        WebDriverWait(driver.driver, SCROLL_TIMEOUT).until(
+            lambda d: d.execute_script(LAST_ARTICLE_JS) not in keys)
+    except TimeoutException:
+        logger.debug("No new articles after scrolling")
+        metrics.count("scroll_timeouts")
+    metrics.observe("scroll", perf_counter() - start)
+    driver.sample()
 
-        if count < MAX_TWEETS:
-            scroll_and_crawl(count)
 
-    scroll_and_crawl(0)
+def iter_tweets(driver: Driver, sources: List[str], resolver: UrlResolver,
+                progress: Optional[SearchProgress] = None) -> Iterator[Tweet]:
+    """
+    Crawls the current search page, yielding tweets after each scroll batch.
+    Each batch is recorded in progress, so a rerun of a stopped crawl skips the
+    articles and show more tweets it already handled and yields the tweets it
+    crawled but never wrote first.
+    """
+    if progress is None:
+        progress = CrawlCheckpoint(None).search(driver.last_link)
+    yield from progress.unwritten
+    progress.unwritten = []
+    if progress.done:
+        return
 
-    logger.info(f"Processing {len(show_more_links)} show more tweets")
+    ids = progress.seen
+
+    def crawl_page(count: int, focal_link: Optional[str] = None, focal_views: int = 0) -> Iterator[Tweet]:
+        """
+        Crawls the search page, or a show more status page when focal_link is
+        given, crediting that tweet with the views shown on its status page
+        """
+        search_page = focal_link is None
+        # We track the last batch of ids, so when we get the exact same ones we know we're at the end.
+        last_batch_ids: Set[str] = set()
+        for _ in range(MAX_SCROLLS):
+            driver.throttle()
+            articles = extract_articles(driver, scroll=True)
+            article_ids = set(a.key for a in articles)
+            if last_batch_ids == article_ids:
+                return
+            last_batch_ids = article_ids
+
+            logger.debug(f"Found {len(articles)} articles in scroll")
+            new_articles = list({a.key: a for a in articles if a.key not in ids}.values())
+
+            # Resolve every short link in this scroll batch concurrently up front,
+            # so parsing the articles below only hits the resolver cache.
+            with metrics.time("resolve_url"):
+                resolver.resolve_many(link for a in new_articles for link in a.links if "t.co" in link)
+
+            tweets = []
+            show_more = []
+            for article in new_articles:
+                logger.debug(f"Processing article {article.key}")
+                ids.add(article.key)
+                metrics.count("tweets_seen")
+                if article.text.endswith("Promoted"):
+                    # Skip promoted tweets
+                    metrics.count("promoted_skipped")
+                    continue
+
+                if article.show_more and article.status_link:
+                    # Find the status link since this is a Tweet with "show more",
+                    # which can cause us not able to crawl the tweet properly.
+                    logger.info(f"Adding article {article.status_link} to show more")
+                    # Skip show more tweets, as we'll crawl them later
+                    show_more.append(article.status_link)
+                    continue
+
+                count += 1
+                with metrics.time("parse_tweet"):
+                    tweet = parse_tweet(article, sources, True, resolver)
+                if tweet:
+                    metrics.count("paper_tweets")
+                    if article.key == focal_link:
+                        tweet.views = max(tweet.views, focal_views)
+                    tweets.append(tweet)
+
+            progress.record_batch((a.key for a in new_articles), tweets, show_more, count if search_page else None)
+            yield from tweets
+
+            if count >= MAX_TWEETS:
+                return
+            wait_for_scroll(driver, article_ids)
+
+        logger.warning(f"Stopped crawling {driver.last_link} after {MAX_SCROLLS} scrolls")
+
+    yield from crawl_page(progress.count)
+
+    logger.info(f"Processing {len(progress.show_more)} show more tweets")
     # Browse through all the show more tweets individually
-    show_more_links_copy = show_more_links.copy()
-    for show_more_link in show_more_links_copy:
-        driver.go_link(urljoin("https://twitter.com", show_more_link), 5)
-        articles = driver.driver.find_elements(By.TAG_NAME, "article")
+    for show_more_link in sorted(progress.show_more):
+        driver.go_link(urljoin("https://twitter.com", show_more_link), 10, TWEETS_READY)
+        metrics.count("show_more_followed")
+        articles = extract_articles(driver)
+        if not articles:
+            # Deleted, protected or throttled, the tweet is skipped rather
+            # than retried on every resumed run
+            logger.warning(f"No tweets on show more page {show_more_link}, skipping it")
+            metrics.count("show_more_missing")
+            progress.finish_show_more(show_more_link)
+            continue
         views = parse_views(articles[0].text.split("\n"), False)
-        scroll_and_crawl(0, views)
+        # The focal tweet was seen on the search page with its text cut short,
+        # so it must not be skipped as already crawled here
+        ids.discard(show_more_link)
+        yield from crawl_page(0, show_more_link, views)
+        progress.finish_show_more(show_more_link)
+
+    progress.finish()
 
-    for tweet in tweets:
-        fetch_paper_metadata(driver, tweet)
 
-    return tweets
+def crawl_tweets(driver: Driver, sources: List[str], resolver: UrlResolver,
+                 progress: Optional[SearchProgress] = None) -> List[Tweet]:
+    return list(iter_tweets(driver, sources, resolver, progress))
 
 
 def print_tweets(tweets: List[Tweet]) -> None:
@@ -341,55 +503,434 @@ def print_tweets(tweets: List[Tweet]) -> None:
         logger.debug(t.views)
 
 
-def _main() -> None:
-    """Main driver"""
+def launch_chrome(profile_dir: str) -> Chrome:
+    """
+    Starts headless Chrome that returns from navigation once the DOM is ready
+    and never downloads images, media or fonts, since the crawl only reads
+    text and src attributes.
+    """
     options = webdriver.ChromeOptions()
-    options.add_argument("--user-data-dir=/tmp/ingest_profile")
+    options.add_argument(f"--user-data-dir={profile_dir}")
     options.add_argument("--headless=new")
     options.add_argument("--no-sandbox")
     options.add_argument("--ignore-ssl-errors=true")
     options.add_argument("--ignore-certificate-errors")
+    options.page_load_strategy = "eager"
+    # Network events only, to measure the bytes downloaded
+    options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    options.add_experimental_option("perfLoggingPrefs", {"enableNetwork": True, "enablePage": False})
 
     driver = Chrome(options=options, service=Service(
         ChromeDriverManager().install()))
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URLS})
     driver.maximize_window()
-    driver = Driver(driver)
+    return driver
 
-    #date, y_str, t_str = date_ranges()
-    date, y_str, t_str = (datetime(year=2023, month=8, day=24), "2023-08-24", "2023-08-25")
 
-    arxiv_links = [
-        f"https://twitter.com/search?q=llms%20filter%3Alinks%20until%3A{t_str}%20since%3A{y_str}&src=typed_query&f=top",
-        f"https://twitter.com/search?q=llm%20until%3A{t_str}%20since%3A{y_str}%20filter%3Alinks&src=typed_query&f=top",
-        f"https://twitter.com/search?q=gpt4%20filter%3Alinks%20until%3A{t_str}%20since%3A{y_str}%20&src=typed_query&f=top"
-    ]
+def create_driver(profile_dir: str, recorder: Optional[Recorder] = None) -> Driver:
+    return Driver(launch_chrome(profile_dir), recorder, launch=lambda: launch_chrome(profile_dir))
+
+
+def copy_profile(index: int) -> str:
+    """
+    Copies the logged in profile for a worker, since Chrome can only run one
+    instance per profile directory.
+    """
+    profile_dir = f"{PROFILE_DIR}_{index}"
+    shutil.rmtree(profile_dir, ignore_errors=True)
+    shutil.copytree(PROFILE_DIR, profile_dir, ignore=shutil.ignore_patterns("Singleton*", "lockfile"))
+    return profile_dir
+
+
+class DriverPool:
+    """
+    Runs jobs across independent drivers, each driver running one job at a time.
+    """
+
+    def __init__(self, drivers: List[Driver]):
+        self.drivers = drivers
+        self.free: Queue = Queue()
+        for driver in drivers:
+            self.free.put(driver)
+        self.executor = ThreadPoolExecutor(max_workers=len(drivers), thread_name_prefix="driver")
+
+    def _run(self, fn: Callable, item):
+        driver = self.free.get()
+        try:
+            return fn(driver, item)
+        finally:
+            self.free.put(driver)
+
+    def map(self, fn: Callable, items: Iterable) -> List:
+        """
+        Returns fn(driver, item) for every item, in order
+        """
+        return list(self.executor.map(lambda item: self._run(fn, item), items))
+
+    def quit(self) -> None:
+        self.executor.shutdown()
+        for driver in self.drivers:
+            driver.quit()
+            driver.log_ready_times()
+
+
+def claim_papers(tweets: List[Tweet], claimed: Set[str]) -> Tuple[List[Tweet], List[Tweet]]:
+    """
+    Splits tweets into the first one seen for each paper, which gets its
+    metadata fetched, and repeats of papers claimed already, which only add
+    their views. Marks the new papers as claimed.
+    """
+    first, repeats = [], []
+    for tweet in tweets:
+        if tweet.canonical_id in claimed:
+            repeats.append(tweet)
+        else:
+            claimed.add(tweet.canonical_id)
+            first.append(tweet)
+    return first, repeats
+
+
+class PipelineStopped(Exception):
+    pass
+
+
+class Throttled(Exception):
+    """
+    Twitter refused to serve a search because of rate limiting
+    """
+
 
-    # Crawl arxiv papers from Twitter
-    driver.go_link(arxiv_links[0], 5)
+# What Twitter shows instead of results when it throttles
+THROTTLED_TEXTS = ["Rate limit exceeded", "Something went wrong. Try reloading."]
 
-    username = sys.argv[1]
-    password = sys.argv[2]
 
-    login(driver=driver.driver, username=username, password=password)
+def check_throttled(driver: Driver) -> None:
+    source = driver.driver.page_source
+    if "<article" not in source and any(text in source for text in THROTTLED_TEXTS):
+        metrics.count("throttled")
+        raise Throttled(driver.last_link)
 
-    for arxiv_link in arxiv_links:
-        driver.go_link(arxiv_link, 10)
 
-        arxiv_tweets = crawl_tweets(
-            driver, ["arxiv.org", "ai.meta.com/research/publications"])
-        write_papers_to_db(arxiv_tweets, os.getenv(
-            "TURSO_URL"), os.getenv("TURSO_AUTH_TOKEN"), date)
+class IngestPipeline:
+    """
+    Streams tweets from the crawl through metadata fetching into the database.
+
+    Crawlers put tweets on a bounded queue as each scroll batch is parsed. A
+    metadata stage fills them in small batches from the known papers, cache
+    and arXiv API, and a writer stage flushes them to the database in small
+    batches. Full queues block the stage feeding them, so memory stays bounded
+    and everything written before a failure stays written. Papers that need a
+    browser for metadata are scraped once the crawl has released the drivers.
+    Crawl progress is checkpointed, so a rerun picks up where a failed one
+    stopped.
+    """
+
+    def __init__(self, pool: DriverPool, resolver: UrlResolver, known: Dict[str, str], cache: MetadataCache,
+                 client, current_time: datetime, session: Optional[requests.Session] = None,
+                 checkpoint: Optional[CrawlCheckpoint] = None):
+        self.pool = pool
+        self.resolver = resolver
+        self.known = known
+        self.cache = cache
+        self.client = client
+        self.current_time = current_time
+        self.session = session
+        self.checkpoint = checkpoint or CrawlCheckpoint(None)
+        # Canonical ids of the papers whose metadata this run has fetched
+        self.claimed: Set[str] = set()
+
+        self.tweets: Queue = Queue(maxsize=QUEUE_SIZE)
+        self.ready: Queue = Queue(maxsize=QUEUE_SIZE)
+        self.stopped = threading.Event()
+        self.errors: List[BaseException] = []
+
+        self.crawled = 0
+        self.written = 0
+        self.avoided = 0
+        self.started = 0.0
+        self.first_write: Optional[float] = None
+
+    def _put(self, queue: Queue, item) -> None:
+        while not self.stopped.is_set():
+            try:
+                queue.put(item, timeout=FLUSH_INTERVAL)
+                return
+            except Full:
+                pass
+        raise PipelineStopped()
+
+    def _batches(self, queue: Queue, size: int) -> Iterator[List]:
+        """
+        Yields items from the queue in batches of up to size, flushing early
+        when nothing arrived for FLUSH_INTERVAL, until the end marker.
+        """
+        batch = []
+        while not self.stopped.is_set():
+            try:
+                item = queue.get(timeout=FLUSH_INTERVAL)
+            except Empty:
+                item = None
+            else:
+                if item is PIPELINE_END:
+                    break
+                batch.append(item)
+                if len(batch) < size:
+                    continue
+            if batch:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _stage(self, fn: Callable, *args) -> None:
+        try:
+            fn(*args)
+        except PipelineStopped:
+            pass
+        except BaseException as e:
+            logger.exception(f"Ingest stage {fn.__name__} failed")
+            self.errors.append(e)
+            self.stopped.set()
+
+    def _crawl(self, searches: List[Tuple[str, List[str]]]) -> None:
+        def crawl_search(driver: Driver, search) -> None:
+            url, sources = search
+            progress = self.checkpoint.search(url)
+            if progress.done:
+                logger.info(f"Skipping search finished by an earlier run: {url}")
+            else:
+                driver.go_link(url, 15, TWEETS_READY)
+                check_throttled(driver)
+            for tweet in iter_tweets(driver, sources, self.resolver, progress):
+                self.crawled += 1
+                self._put(self.tweets, tweet)
+
+        try:
+            self.pool.map(crawl_search, searches)
+        finally:
+            if not self.stopped.is_set():
+                self._put(self.tweets, PIPELINE_END)
+
+    def _fetch_metadata(self) -> None:
+        scrape = []
+        try:
+            for batch in self._batches(self.tweets, METADATA_BATCH):
+                tweets, repeats = claim_papers(batch, self.claimed)
+                for tweet in repeats:
+                    self._put(self.ready, tweet)
+                needs_browser, avoided = prefetch_metadata(tweets, self.known, self.cache, self.session)
+                self.avoided += avoided + len(repeats)
+                scrape.extend(needs_browser)
+                deferred = set(id(tweet) for tweet in needs_browser)
+                for tweet in tweets:
+                    if id(tweet) not in deferred:
+                        self._put(self.ready, tweet)
+
+            # The crawl is done, so the browsers are free for scraping
+            for i in range(0, len(scrape), METADATA_BATCH):
+                batch = scrape[i:i + METADATA_BATCH]
+                scrape_metadata(self.pool, batch, self.cache)
+                for tweet in batch:
+                    self._put(self.ready, tweet)
+        finally:
+            if not self.stopped.is_set():
+                self._put(self.ready, PIPELINE_END)
+
+    def _write(self) -> None:
+        for batch in self._batches(self.ready, WRITE_BATCH):
+            with metrics.time("write"):
+                write_papers_batch(self.client, batch, self.current_time)
+            self.checkpoint.mark_written(tweet.key for tweet in batch)
+            self.written += len(batch)
+            if self.first_write is None:
+                self.first_write = perf_counter() - self.started
+                logger.info(f"First papers written after {self.first_write:.1f}s")
+            # Later runs sharing the known papers only need to add views
+            for tweet in batch:
+                if tweet.metadata is not None:
+                    self.known.setdefault(tweet.canonical_id, tweet.paper_url)
+
+    def run(self, searches: List[Tuple[str, List[str]]]) -> None:
+        self.started = perf_counter()
+        threads = [threading.Thread(target=self._stage, args=(fn, *args), name=fn.__name__)
+                   for fn, args in [(self._crawl, (searches,)), (self._fetch_metadata, ()), (self._write, ())]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        logger.info(f"Crawled {self.crawled} tweets, wrote {self.written} papers "
+                    f"in {perf_counter() - self.started:.1f}s")
+        metrics.count("tweets_crawled", self.crawled)
+        metrics.count("papers_written", self.written)
+        metrics.count("metadata_fetches_avoided", self.avoided)
+        if self.first_write is not None:
+            metrics.observe("first_write", self.first_write)
+        if self.errors:
+            raise self.errors[0]
+
+
+def ingest_searches(pool: DriverPool, resolver: UrlResolver, current_time: datetime,
+                    searches: List[Tuple[str, List[str]]], session: Optional[requests.Session] = None,
+                    checkpoint: Optional[CrawlCheckpoint] = None, client=None,
+                    cache: Optional[MetadataCache] = None) -> IngestPipeline:
+    """
+    Crawls the searches into the database, crediting the papers to current_time.
+    Writes to Turso and caches metadata on disk, unless given another client
+    and cache.
+    """
+    if client is None:
+        with libsql_client.create_client_sync(url=os.getenv("TURSO_URL"),
+                                              auth_token=os.getenv("TURSO_AUTH_TOKEN")) as client:
+            return ingest_searches(pool, resolver, current_time, searches, session, checkpoint, client, cache)
+
+    known = fetch_known_papers(client)
+    logger.info(f"Loaded {len(known)} known papers")
+    owned_cache = cache is None
+    cache = cache or MetadataCache()
+    try:
+        pipeline = IngestPipeline(pool, resolver, known, cache, client, current_time, session, checkpoint)
+        pipeline.run(searches)
+        logger.info(f"Avoided {pipeline.avoided} metadata fetches for known papers this run")
+        return pipeline
+    finally:
+        if owned_cache:
+            cache.close()
+
+
+def replay_searches(corpus: Corpus) -> List[Tuple[str, List[str]]]:
+    """
+    Returns the searches recorded in a corpus, whatever day they were for
+    """
+    return [(url, REPLAY_SOURCES) for url in corpus.index if urlparse(url).path == "/search"]
+
+
+def replay_database() -> LocalClient:
+    """
+    Returns an empty in-memory papers database, so replays never write to Turso
+    """
+    client = LocalClient()
+    with open(SCHEMA_PATH) as f:
+        client.executescript(f.read())
+    return client
 
-    # Crawl huggingface papers from Twitter
-    driver.go_link(
-        f"https://twitter.com/search?q=huggingface.co%2Fpapers%20filter%3Alinks%20since%3A{date}&src=typed_query&f=top",
-        5)
 
-    hf_tweets = crawl_tweets(driver, ["huggingface.co"])
-    write_papers_to_db(hf_tweets, os.getenv(
-            "TURSO_URL"), os.getenv("TURSO_AUTH_TOKEN"), date)
+def export_snapshots() -> None:
+    """
+    Asks the website to re-export its /twitter snapshots with the new papers.
+    Off unless ARXIVY_SNAPSHOT_URL is set, and a failure only costs freshness
+    until the website's snapshots expire.
+    """
+    url = os.getenv("ARXIVY_SNAPSHOT_URL")
+    if not url:
+        return
+    try:
+        response = requests.post(url, headers={"Authorization": f"Bearer {os.getenv('ARXIVY_SNAPSHOT_TOKEN', '')}"},
+                                 timeout=60)
+        response.raise_for_status()
+        logger.info(f"Exported website snapshots {response.json()['exported']}")
+    except requests.RequestException as e:
+        # Reported as a counter, the papers are written all the same
+        metrics.count("snapshot_export_failures")
+        logger.warning(f"Failed exporting website snapshots: {e}")
+
 
-    driver.driver.quit()
+def log_in(driver: Driver, username: str, password: str) -> None:
+    """
+    Logs the driver's profile in to Twitter if it isn't already
+    """
+    search_url = day_searches(*date_ranges()[1:])[0][0]
+    driver.go_link(search_url, 10, LOGIN_OR_TWEETS_READY)
+    if login(driver=driver.driver, username=username, password=password):
+        # Logging in leaves the search page, so load it again
+        driver.last_link = None
+
+
+def _main() -> None:
+    """Main driver"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("username", nargs="?")
+    parser.add_argument("password", nargs="?")
+    parser.add_argument("--date", type=lambda day: datetime.strptime(day, "%Y-%m-%d").date(),
+                        help="day to crawl as YYYY-MM-DD, yesterday by default")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("INGEST_WORKERS", "1")),
+                        help="number of browsers crawling in parallel")
+    parser.add_argument("--capture", metavar="DIR", help="record page snapshots of this run into a corpus")
+    parser.add_argument("--replay", metavar="DIR",
+                        help="crawl a recorded corpus instead of live pages, into an in-memory database")
+    parser.add_argument("--restart", action="store_true", help="discard the progress checkpointed by earlier runs")
+    parser.add_argument("--report", default=os.getenv("INGEST_REPORT", REPORT_PATH),
+                        help="where to write the JSON run report")
+    parser.add_argument("--prom-file", default=os.getenv("INGEST_PROM_FILE", PROM_PATH),
+                        help="where to write the run metrics for the Prometheus textfile collector")
+    args = parser.parse_args()
+    if not args.replay and not (args.username and args.password):
+        parser.error("username and password are required unless replaying")
+
+    recorder = Recorder(args.capture) if args.capture else None
+    corpus = Corpus(args.replay) if args.replay else None
+    session = RecordingSession(recorder) if recorder else ReplaySession(corpus) if corpus else None
+
+    def new_driver(profile_dir: str) -> Driver:
+        if corpus:
+            return Driver(ReplayWebDriver(corpus))
+        return create_driver(profile_dir, recorder)
+
+    current_time, y_str, t_str = day_range(args.date) if args.date else date_ranges()
+    searches = replay_searches(corpus) if corpus else day_searches(y_str, t_str)
+
+    # Log in once with the main profile, which the workers then copy
+    driver = new_driver(PROFILE_DIR)
+    if not corpus:
+        log_in(driver, args.username, args.password)
+
+    if args.workers > 1 and not corpus:
+        driver.quit()
+        drivers = [new_driver(copy_profile(i)) for i in range(args.workers)]
+    else:
+        drivers = [driver]
+    pool = DriverPool(drivers)
+    resolver = ReplayResolver(corpus.resolved()) if corpus else UrlResolver()
+
+    # Replays always crawl their corpus from the start, and keep the papers
+    # and metadata in memory
+    checkpoint = CrawlCheckpoint(None if corpus else CHECKPOINT_PATH)
+    if args.restart:
+        checkpoint.clear()
+    client = replay_database() if corpus else None
+    cache = MetadataCache(None) if corpus else None
+
+    success = False
+    try:
+        pipeline = ingest_searches(pool, resolver, current_time, searches, session, checkpoint, client, cache)
+        if corpus:
+            papers = client.execute("SELECT count(*) FROM papers")[0][0]
+            logger.info(f"Replayed {pipeline.crawled} tweets into {papers} papers")
+        if not corpus:
+            with metrics.time("related_papers"):
+                update_related_papers()
+            with metrics.time("export_snapshots"):
+                export_snapshots()
+        success = True
+    finally:
+        pool.quit()
+        checkpoint.close()
+        if corpus:
+            client.close()
+            cache.close()
+        logger.info(f"Resolved short links with {resolver.hits} cache hits and {resolver.misses} misses")
+        if recorder:
+            recorder.record_resolved(resolver.memory)
+        resolver.close()
+
+        metrics.count("url_cache_hits", resolver.hits)
+        metrics.count("url_cache_misses", resolver.misses)
+        logger.info(f"Browsers downloaded {metrics.counters['browser_bytes'] / 2 ** 20:.1f} MiB, "
+                    f"blocked {metrics.counters['browser_requests_blocked']} requests, "
+                    f"peaked at {metrics.counters['browser_peak_rss_bytes'] / 2 ** 20:.0f} MiB")
+        write_report(metrics.report(success), args.report, args.prom_file)
+        logger.info(f"Wrote run report to {args.report} and {args.prom_file}")
 
 
 if __name__ == "__main__":
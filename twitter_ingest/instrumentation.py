@@ -0,0 +1,112 @@
+import json
+import os
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from time import perf_counter, time
+from typing import Any, Dict, Iterator
+
+# Where the run report of the last ingest is written
+REPORT_PATH = "/tmp/ingest_report.json"
+
+# Picked up by the node_exporter textfile collector when pointed at its directory
+PROM_PATH = "/tmp/ingest.prom"
+
+
+@dataclass
+class StageStats:
+    calls: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+
+
+class RunMetrics:
+    """
+    Time spent per ingest stage and counts of notable events for one run.
+    Stages running on several threads add up, so a stage's seconds is the
+    work it did rather than wall time.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages: Dict[str, StageStats] = defaultdict(StageStats)
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.started_at = time()
+        self.started = perf_counter()
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self.lock:
+            stats = self.stages[stage]
+            stats.calls += 1
+            stats.seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, perf_counter() - start)
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self.lock:
+            self.counters[name] += value
+
+    def maximum(self, name: str, value: int) -> None:
+        with self.lock:
+            self.counters[name] = max(self.counters[name], value)
+
+    def report(self, success: bool) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "started_at": self.started_at,
+                "duration_seconds": perf_counter() - self.started,
+                "success": success,
+                "stages": {name: asdict(stats) for name, stats in sorted(self.stages.items())},
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+
+def prometheus_text(report: Dict[str, Any]) -> str:
+    lines = [
+        "# HELP ingest_run_duration_seconds Wall time of the last ingest run.",
+        "# TYPE ingest_run_duration_seconds gauge",
+        f"ingest_run_duration_seconds {report['duration_seconds']:.3f}",
+        "# HELP ingest_run_success Whether the last ingest run completed.",
+        "# TYPE ingest_run_success gauge",
+        f"ingest_run_success {int(report['success'])}",
+        "# HELP ingest_run_timestamp_seconds Start time of the last ingest run.",
+        "# TYPE ingest_run_timestamp_seconds gauge",
+        f"ingest_run_timestamp_seconds {report['started_at']:.0f}",
+    ]
+    for field, help in [("seconds", "Seconds spent in each stage"), ("calls", "Calls of each stage"),
+                        ("max_seconds", "Slowest call of each stage")]:
+        name = f"ingest_stage_{field}"
+        lines += [f"# HELP {name} {help} in the last ingest run.", f"# TYPE {name} gauge"]
+        lines += [f'{name}{{stage="{stage}"}} {stats[field]:g}' for stage, stats in report["stages"].items()]
+    for counter, value in report["counters"].items():
+        lines += [f"# TYPE ingest_{counter} gauge", f"ingest_{counter} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+def write_atomic(path: str, content: str) -> None:
+    """
+    Writes through a temporary file so readers never see a partial report
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def write_report(report: Dict[str, Any], report_path: str = REPORT_PATH, prom_path: str = PROM_PATH) -> None:
+    if report_path:
+        write_atomic(report_path, json.dumps(report, indent=2) + "\n")
+    if prom_path:
+        write_atomic(prom_path, prometheus_text(report))
+
+
+# Metrics of the current run
+metrics = RunMetrics()
@@ -0,0 +1,41 @@
+import sqlite3
+from typing import Dict, Iterable, Optional
+
+from scrape_arxiv import ArxivPaper
+
+# Where fetched paper metadata is kept between runs
+CACHE_PATH = "/tmp/ingest_metadata_cache.db"
+
+
+class MetadataCache:
+    """
+    Local cache of paper metadata keyed by canonical arXiv id (or the
+    normalized url for papers outside arXiv), so a paper is only fetched once.
+    """
+
+    def __init__(self, path: Optional[str] = CACHE_PATH):
+        self.conn = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS metadata (key text primary key, title text, abstract text, authors text)")
+        self.conn.commit()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, ArxivPaper]:
+        keys = list(set(keys))
+        papers = {}
+        # Stay under SQLite's bound parameter limit
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT key, title, abstract, authors FROM metadata WHERE key IN ({','.join('?' * len(chunk))})",
+                chunk)
+            for key, title, abstract, authors in rows:
+                papers[key] = ArxivPaper(title=title, abstract=abstract, authors=authors)
+        return papers
+
+    def put_many(self, papers: Dict[str, ArxivPaper]) -> None:
+        self.conn.executemany("INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?)",
+                              [(key, p.title, p.abstract, p.authors) for key, p in papers.items()])
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,28 @@
+"""
+Adds canonical paper ids to a database created before them, merging papers
+stored under several url variants.
+
+    python migrate_canonical_ids.py
+"""
+import logging
+import os
+
+import libsql_client
+from dotenv import load_dotenv
+
+from db import migrate_canonical_ids
+from paper_ids import canonical_paper
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _main() -> None:
+    with libsql_client.create_client_sync(url=os.getenv("TURSO_URL"), auth_token=os.getenv("TURSO_AUTH_TOKEN")) as client:
+        removed = migrate_canonical_ids(client, canonical_paper)
+    logger.info(f"Added canonical ids, merged {removed} duplicate papers")
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    _main()
@@ -0,0 +1,27 @@
+"""
+Adds the full-text index behind the website's /search to a database created
+before it, and indexes the stored papers.
+
+    python migrate_fts.py
+"""
+import logging
+import os
+
+import libsql_client
+from dotenv import load_dotenv
+
+from db import migrate_fts
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _main() -> None:
+    with libsql_client.create_client_sync(url=os.getenv("TURSO_URL"), auth_token=os.getenv("TURSO_AUTH_TOKEN")) as client:
+        indexed = migrate_fts(client)
+    logger.info(f"Added the full-text index, indexed {indexed} papers")
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    _main()
@@ -0,0 +1,44 @@
+import re
+from typing import Optional, Tuple
+from urllib.parse import urlparse
+
+# arXiv abs/pdf/html pages on any mirror, and Hugging Face paper pages, which
+# use the arXiv id. The version and any .pdf suffix are not part of the id.
+ARXIV_RE = re.compile(
+    r"(?:arxiv\.org/(?:abs|pdf|html)|huggingface\.co/papers)/"
+    r"((?:[a-z\-]+(?:\.[A-Z]{2})?/\d{7})|(?:\d{4}\.\d{4,5}))(?:v\d+)?",
+    re.IGNORECASE)
+
+META_RE = re.compile(r"(?:ai\.meta\.com/research|research\.facebook\.com)/publications/([^/?#]+)", re.IGNORECASE)
+
+
+def extract_arxiv_id(url: str) -> Optional[str]:
+    """
+    Returns the versionless arXiv id of an arXiv or Hugging Face paper url, or
+    None if the url is not an arXiv paper.
+    """
+    match = ARXIV_RE.search(url)
+    return match.group(1) if match else None
+
+
+def canonical_paper(url: str) -> Tuple[str, str]:
+    """
+    Returns the canonical id of the paper a url points to, and the url to
+    fetch and store it under. Every url variant of the same paper maps to the
+    same id: "arxiv:<id>" for arXiv and Hugging Face links, "meta:<slug>" for
+    Meta publications and "url:<host/path>" for anything else.
+    """
+    arxiv_id = extract_arxiv_id(url)
+    if arxiv_id:
+        return f"arxiv:{arxiv_id}", f"https://arxiv.org/abs/{arxiv_id}"
+
+    match = META_RE.search(url)
+    if match:
+        slug = match.group(1).lower()
+        return f"meta:{slug}", f"https://ai.meta.com/research/publications/{slug}/"
+
+    parsed = urlparse(url)
+    host = parsed.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return f"url:{host}{parsed.path.rstrip('/')}", url
@@ -0,0 +1,57 @@
+import multiprocessing
+from time import sleep, time
+
+# Seconds all workers pause after the first throttle, doubling per throttle in a row
+BACKOFF_BASE = 60
+BACKOFF_MAX = 30 * 60
+
+
+class SharedRateLimiter:
+    """
+    Token bucket of Twitter page loads shared by every backfill process, plus
+    a shared pause that all of them respect after Twitter throttles one.
+    Pass it to the workers when they start, it lives in shared memory.
+    """
+
+    def __init__(self, per_minute: float, burst: int):
+        self.per_minute = per_minute
+        self.burst = burst
+        self.lock = multiprocessing.Lock()
+        self.tokens = multiprocessing.Value("d", burst, lock=False)
+        self.updated = multiprocessing.Value("d", time(), lock=False)
+        self.paused_until = multiprocessing.Value("d", 0.0, lock=False)
+        self.throttles = multiprocessing.Value("i", 0, lock=False)
+
+    def acquire(self) -> None:
+        """
+        Blocks until a page load fits in the budget and no pause is in effect
+        """
+        while True:
+            with self.lock:
+                now = time()
+                wait = self.paused_until.value - now
+                if wait <= 0:
+                    elapsed = now - self.updated.value
+                    self.tokens.value = min(self.burst, self.tokens.value + elapsed * self.per_minute / 60)
+                    self.updated.value = now
+                    if self.tokens.value >= 1:
+                        self.tokens.value -= 1
+                        return
+                    wait = (1 - self.tokens.value) * 60 / self.per_minute
+            sleep(wait)
+
+    def backoff(self) -> float:
+        """
+        Pauses every worker after a throttle, returning the pause in seconds
+        """
+        with self.lock:
+            self.throttles.value += 1
+            delay = min(BACKOFF_BASE * 2 ** (self.throttles.value - 1), BACKOFF_MAX)
+            self.paused_until.value = max(self.paused_until.value, time() + delay)
+            # Restart slowly once the pause is over
+            self.tokens.value = 0
+        return delay
+
+    def succeeded(self) -> None:
+        with self.lock:
+            self.throttles.value = 0
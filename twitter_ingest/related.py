@@ -0,0 +1,297 @@
+"""
+Related papers by TF-IDF cosine similarity of their title and abstract.
+
+The index keeps the term counts of every paper as a sparse matrix in .npy
+files, so it is memory mapped on load and only new papers are tokenized.
+Neighbors are precomputed at ingest and written to the related_papers table,
+so the website only looks them up.
+
+    python related.py            # index papers added since the last run
+    python related.py --rebuild  # recompute every paper's neighbors
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+from collections import Counter
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import libsql_client
+import numpy as np
+from dotenv import load_dotenv
+from scipy import sparse
+
+from db import BATCH_SIZE, CREATE_RELATED_PAPERS_SQL, chunks, related_statements
+
+logger = logging.getLogger(__name__)
+
+# Where the index is kept between runs
+RELATED_DIR = "/tmp/ingest_related"
+
+# Related papers kept per paper
+RELATED_K = 5
+
+# Papers compared at once. Each batch materializes a dense row of scores
+# against every paper, 128 x 100k papers is 50 MB.
+QUERY_BATCH = 128
+
+# Terms in more than this fraction of papers say little about a paper's topic
+MAX_DF = 0.5
+
+# Highest weighted terms kept per paper. Comparing papers costs the square of
+# how many papers share each term, and dropping the low weighted, common terms
+# cuts most of it while barely moving the top neighbors.
+TERMS_PER_PAPER = 32
+
+TOKEN_RE = re.compile(r"[a-z][a-z0-9]*(?:-[a-z0-9]+)*")
+
+STOPWORDS = frozenset("""
+about above after again against all also among and any are based because been before being between both but can
+could did does doing done due each either for from further had has have having here how however into its itself
+may more most much must not now off once only other our ours out over own paper per propose proposed same should
+show shows since some such than that the their them then there these they this those through thus under until upon
+use used using very via was way well were what when where whether which while who whom why will with within without
+would yet you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_RE.findall(text.lower()) if len(token) > 2 and token not in STOPWORDS]
+
+
+def top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the columns and values of the k highest scores of each row, best
+    first. Columns of scores that are not positive are -1.
+    """
+    k = min(k, scores.shape[1])
+    columns = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    values = np.take_along_axis(scores, columns, axis=1)
+    order = np.argsort(-values, axis=1)
+    columns = np.take_along_axis(columns, order, axis=1)
+    values = np.take_along_axis(values, order, axis=1)
+    columns[values <= 0] = -1
+    return columns.astype(np.int32), np.maximum(values, 0).astype(np.float32)
+
+
+class RelatedIndex:
+    """
+    Term counts, document frequencies and precomputed neighbors of every
+    indexed paper. Term weights are recomputed from the counts whenever new
+    papers are added, but older papers' neighbors are only revisited when a
+    new paper beats one of them, so the whole index is recomputed once it
+    has doubled since it was last built.
+    """
+
+    ARRAYS = ("indptr", "indices", "counts", "df", "rowids", "neighbors", "scores")
+
+    def __init__(self, path: Optional[str] = RELATED_DIR, k: int = RELATED_K):
+        self.path = path
+        self.k = k
+        self.vocabulary: List[str] = []
+        self.links: List[str] = []
+        self.built_rows = 0
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int32)
+        self.counts = np.zeros(0, dtype=np.float32)
+        self.df = np.zeros(0, dtype=np.int32)
+        self.rowids = np.zeros(0, dtype=np.int64)
+        self.neighbors = np.zeros((0, k), dtype=np.int32)
+        self.scores = np.zeros((0, k), dtype=np.float32)
+        if path and os.path.exists(os.path.join(path, "meta.json")):
+            self._load()
+
+    def _load(self) -> None:
+        with open(os.path.join(self.path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta["k"] != self.k:
+            logger.info(f"Related index has {meta['k']} neighbors per paper, not {self.k}, rebuilding it")
+            return
+        self.vocabulary = meta["vocabulary"]
+        self.links = meta["links"]
+        self.built_rows = meta["built_rows"]
+        for name in self.ARRAYS:
+            setattr(self, name, np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r"))
+
+    def save(self) -> None:
+        """
+        Writes the index to a new directory and swaps it in, so a crash never
+        leaves a mix of two versions
+        """
+        tmp_path = f"{self.path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name in self.ARRAYS:
+            np.save(os.path.join(tmp_path, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump({"k": self.k, "built_rows": self.built_rows, "vocabulary": self.vocabulary,
+                       "links": self.links}, f)
+        old_path = f"{self.path}.old"
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.exists(self.path):
+            os.rename(self.path, old_path)
+        os.rename(tmp_path, self.path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    @property
+    def rows(self) -> int:
+        return len(self.rowids)
+
+    @property
+    def last_rowid(self) -> int:
+        return int(self.rowids[-1]) if self.rows else 0
+
+    def term_matrix(self) -> sparse.csr_matrix:
+        return sparse.csr_matrix((self.counts, self.indices, self.indptr), shape=(self.rows, len(self.vocabulary)))
+
+    def vectors(self) -> sparse.csr_matrix:
+        """
+        Returns the unit length TF-IDF vectors of every paper over its
+        TERMS_PER_PAPER highest weighted terms. Terms in a single paper or in
+        too many papers are left out.
+        """
+        idf = np.log((1 + self.rows) / (1 + self.df)) + 1
+        idf[(self.df < 2) | (self.df > MAX_DF * self.rows)] = 0
+        weights = np.asarray(self.counts) * idf[self.indices].astype(np.float32)
+
+        rows = np.repeat(np.arange(self.rows), np.diff(self.indptr))
+        order = np.lexsort((-weights, rows))
+        rank = np.arange(len(order)) - np.asarray(self.indptr)[rows[order]]
+        keep = order[(rank < TERMS_PER_PAPER) & (weights[order] > 0)]
+        keep.sort()
+        vectors = sparse.csr_matrix((weights[keep], (rows[keep], np.asarray(self.indices)[keep])),
+                                    shape=(self.rows, len(self.vocabulary)), dtype=np.float32)
+        norms = np.sqrt(np.asarray(vectors.multiply(vectors).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sparse.csr_matrix(sparse.diags(1 / norms) @ vectors, dtype=np.float32)
+
+    def _append_terms(self, texts: Iterable[str]) -> None:
+        terms = {term: i for i, term in enumerate(self.vocabulary)}
+        indptr, indices, counts = [], [], []
+        for text in texts:
+            tokens = Counter(tokenize(text))
+            indices += [terms.setdefault(term, len(terms)) for term in tokens]
+            counts += tokens.values()
+            indptr.append(len(indices))
+        self.vocabulary = list(terms)
+
+        indices = np.array(indices, dtype=np.int32)
+        # Sublinear term frequency, a term repeated ten times is not ten times as telling
+        counts = 1 + np.log(np.array(counts, dtype=np.float32))
+        self.indptr = np.concatenate([self.indptr, int(self.indptr[-1]) + np.array(indptr, dtype=np.int64)])
+        self.indices = np.concatenate([self.indices, indices])
+        self.counts = np.concatenate([self.counts, counts])
+        df = np.zeros(len(self.vocabulary), dtype=np.int32)
+        df[:len(self.df)] = self.df
+        np.add.at(df, indices, 1)
+        self.df = df
+
+    def add(self, rowids: Sequence[int], links: Sequence[str], texts: Sequence[str]) -> np.ndarray:
+        """
+        Indexes new papers and updates the neighbors they change. Returns the
+        index rows whose neighbors changed.
+        """
+        old_rows = self.rows
+        self._append_terms(texts)
+        self.rowids = np.concatenate([self.rowids, np.array(rowids, dtype=np.int64)])
+        self.links = self.links + list(links)
+
+        if old_rows == 0 or self.rows >= 2 * self.built_rows:
+            return self.rebuild()
+
+        vectors = self.vectors()
+        transposed = vectors.T.tocsr()
+        neighbors = np.concatenate([self.neighbors, np.full((self.rows - old_rows, self.k), -1, np.int32)])
+        scores = np.concatenate([self.scores, np.zeros((self.rows - old_rows, self.k), np.float32)])
+        changed = np.zeros(self.rows, dtype=bool)
+        changed[old_rows:] = True
+        for start in range(old_rows, self.rows, QUERY_BATCH):
+            batch = np.arange(start, min(start + QUERY_BATCH, self.rows))
+            similarity = self._similarity(vectors, transposed, batch)
+            neighbors[batch], scores[batch] = top_k(similarity, self.k)
+
+            # Older papers a new paper beats the weakest neighbor of
+            beaten = np.flatnonzero((similarity[:, :old_rows] > scores[:old_rows, -1]).any(axis=0))
+            if len(beaten):
+                candidates = np.concatenate([scores[beaten], similarity[:, beaten].T], axis=1)
+                candidate_rows = np.concatenate([neighbors[beaten], np.broadcast_to(batch, (len(beaten), len(batch)))],
+                                                axis=1)
+                columns, scores[beaten] = top_k(candidates, self.k)
+                neighbors[beaten] = np.where(columns >= 0, np.take_along_axis(candidate_rows, columns.clip(0), axis=1),
+                                             -1)
+                changed[beaten] = True
+        self.neighbors, self.scores = neighbors, scores
+        return np.flatnonzero(changed)
+
+    def rebuild(self) -> np.ndarray:
+        """
+        Recomputes the neighbors of every paper, returning all rows
+        """
+        vectors = self.vectors()
+        transposed = vectors.T.tocsr()
+        self.neighbors = np.full((self.rows, self.k), -1, np.int32)
+        self.scores = np.zeros((self.rows, self.k), np.float32)
+        for start in range(0, self.rows, QUERY_BATCH):
+            batch = np.arange(start, min(start + QUERY_BATCH, self.rows))
+            self.neighbors[batch], self.scores[batch] = top_k(self._similarity(vectors, transposed, batch), self.k)
+        self.built_rows = self.rows
+        return np.arange(self.rows)
+
+    @staticmethod
+    def _similarity(vectors: sparse.csr_matrix, transposed: sparse.csr_matrix, batch: np.ndarray) -> np.ndarray:
+        """
+        Cosine similarity of a batch of papers to every paper, excluding themselves
+        """
+        similarity = (vectors[batch] @ transposed).toarray()
+        similarity[np.arange(len(batch)), batch] = 0
+        return similarity
+
+    def related(self, row: int) -> List[Tuple[str, float]]:
+        return [(self.links[neighbor], float(score))
+                for neighbor, score in zip(self.neighbors[row], self.scores[row]) if neighbor >= 0]
+
+
+def update_related(client, index: RelatedIndex, batch_size: int = BATCH_SIZE) -> int:
+    """
+    Indexes the papers stored since the last update and writes the related
+    papers that changed. Returns the number of papers whose related papers
+    were written.
+    """
+    client.execute(CREATE_RELATED_PAPERS_SQL)
+    rows = client.execute("SELECT rowid, paper_link, title, abstract FROM papers WHERE rowid > ? ORDER BY rowid",
+                          [index.last_rowid])
+    if not rows:
+        return 0
+    changed = index.add([row[0] for row in rows], [row[1] for row in rows],
+                        [f"{row[2]} {row[3]}" for row in rows])
+    for chunk in chunks(changed, batch_size):
+        client.batch(related_statements((index.links[row], index.related(row)) for row in chunk))
+    # Saved only once written, so a failed write is retried on the next run
+    index.save()
+    logger.info(f"Indexed {len(rows)} new papers, wrote related papers of {len(changed)}")
+    return len(changed)
+
+
+def update_related_papers(rebuild: bool = False) -> int:
+    """
+    Updates the related papers in the database at TURSO_URL
+    """
+    if rebuild:
+        shutil.rmtree(RELATED_DIR, ignore_errors=True)
+    with libsql_client.create_client_sync(url=os.getenv("TURSO_URL"), auth_token=os.getenv("TURSO_AUTH_TOKEN")) as client:
+        return update_related(client, RelatedIndex())
+
+
+def _main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rebuild", action="store_true", help="index every paper from scratch")
+    args = parser.parse_args()
+    update_related_papers(args.rebuild)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+    _main()
@@ -0,0 +1,275 @@
+import json
+import os
+import threading
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterable, List, Optional
+
+import requests
+from lxml import html as lxml_html
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.common.by import By
+
+from arxiv_api import API_URL, ATOM
+from paper_ids import extract_arxiv_id
+from tweets import EXTRACT_ARTICLES_JS, LAST_ARTICLE_JS, Article
+
+INDEX_FILE = "index.json"
+RESOLVED_FILE = "resolved.json"
+
+
+class Recorder:
+    """
+    Captures page snapshots during a real crawl into a corpus directory:
+    the page HTML after each navigation and scroll, the articles extracted
+    from it, arXiv API responses and resolved short links.
+    """
+
+    def __init__(self, corpus_dir: str):
+        self.corpus_dir = corpus_dir
+        os.makedirs(corpus_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.index: Dict[str, List[Dict[str, Optional[str]]]] = {}
+        index_path = os.path.join(corpus_dir, INDEX_FILE)
+        if os.path.exists(index_path):
+            # Add to an existing corpus
+            with open(index_path) as f:
+                self.index = json.load(f)
+        self.count = sum(len(entries) for entries in self.index.values())
+
+    def _write(self, name: str, data) -> str:
+        mode = "wb" if isinstance(data, bytes) else "w"
+        with open(os.path.join(self.corpus_dir, name), mode) as f:
+            f.write(data)
+        return name
+
+    def record_page(self, url: str, page_source: str, articles: Optional[List[dict]] = None) -> None:
+        with self.lock:
+            self.count += 1
+            entry = {"html": self._write(f"{self.count:05d}.html", page_source), "articles": None}
+            if articles is not None:
+                entry["articles"] = self._write(f"{self.count:05d}.json", json.dumps(articles))
+            self.index.setdefault(url, []).append(entry)
+            self._write(INDEX_FILE, json.dumps(self.index, indent=1))
+
+    def record_response(self, url: str, content: bytes) -> None:
+        self.record_page(url, content.decode("utf-8", errors="replace"))
+
+    def record_resolved(self, resolved: Dict[str, str]) -> None:
+        with self.lock:
+            self._write(RESOLVED_FILE, json.dumps(resolved, indent=1))
+
+
+class RecordingSession(requests.Session):
+    """
+    Session that records every response body, for capturing API calls
+    """
+
+    def __init__(self, recorder: Recorder):
+        super().__init__()
+        self.recorder = recorder
+
+    def request(self, method, url, *args, **kwargs):
+        response = super().request(method, url, *args, **kwargs)
+        # Record under the url as requested, before any redirects
+        request = response.history[0].request if response.history else response.request
+        self.recorder.record_response(request.url, response.content)
+        return response
+
+
+class Corpus:
+    def __init__(self, corpus_dir: str):
+        self.corpus_dir = corpus_dir
+        with open(os.path.join(corpus_dir, INDEX_FILE)) as f:
+            self.index: Dict[str, List[Dict[str, Optional[str]]]] = json.load(f)
+
+    def read(self, name: str) -> str:
+        with open(os.path.join(self.corpus_dir, name)) as f:
+            return f.read()
+
+    def articles(self, entry: Dict[str, Optional[str]]) -> List[dict]:
+        return json.loads(self.read(entry["articles"]))
+
+    def all_articles(self) -> List[Article]:
+        return [Article(**data) for entries in self.index.values()
+                for entry in entries if entry["articles"] for data in self.articles(entry)]
+
+    def resolved(self) -> Dict[str, str]:
+        path = os.path.join(self.corpus_dir, RESOLVED_FILE)
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+
+class ReplayElement:
+    def __init__(self, element):
+        self.element = element
+
+    @property
+    def text(self) -> str:
+        lines = (" ".join(line.split()) for line in self.element.text_content().split("\n"))
+        return "\n".join(line for line in lines if line)
+
+    def get_attribute(self, name: str) -> Optional[str]:
+        return self.element.get(name)
+
+    def find_element(self, by: str, value: str) -> "ReplayElement":
+        return _find_element(self.element, by, value)
+
+    def find_elements(self, by: str, value: str) -> List["ReplayElement"]:
+        return _find_elements(self.element, by, value)
+
+
+def _xpath(by: str, value: str) -> str:
+    if by == By.TAG_NAME:
+        return f".//{value}"
+    if by == By.NAME:
+        return f".//*[@name='{value}']"
+    if by == By.XPATH:
+        return value
+    raise NotImplementedError(f"Replay does not support locating by {by}")
+
+
+def _find_elements(root, by: str, value: str) -> List[ReplayElement]:
+    return [ReplayElement(e) for e in root.xpath(_xpath(by, value))]
+
+
+def _find_element(root, by: str, value: str) -> ReplayElement:
+    elements = _find_elements(root, by, value)
+    if not elements:
+        raise NoSuchElementException(f"No element {by}={value} in replayed page")
+    return elements[0]
+
+
+class ReplayWebDriver:
+    """
+    Stands in for Chrome by serving a recorded corpus: navigation loads the
+    first snapshot of the url, article extraction steps through the recorded
+    scroll batches and element lookups run against the snapshot HTML.
+    """
+
+    def __init__(self, corpus: Corpus):
+        self.corpus = corpus
+        self.current_url = None
+        self.entries: List[Dict[str, Optional[str]]] = []
+        self.cursor = 0
+        self.tree = None
+
+    def _load(self, cursor: int) -> None:
+        self.cursor = cursor
+        self.tree = None
+
+    @property
+    def page_source(self) -> str:
+        if not self.entries:
+            return "<html></html>"
+        return self.corpus.read(self.entries[self.cursor]["html"])
+
+    def _root(self):
+        if self.tree is None:
+            self.tree = lxml_html.fromstring(self.page_source)
+        return self.tree
+
+    def _next_batch(self) -> Optional[int]:
+        for i in range(self.cursor + 1, len(self.entries)):
+            if self.entries[i]["articles"]:
+                return i
+        return None
+
+    def get(self, url: str) -> None:
+        self.current_url = url
+        self.entries = self.corpus.index.get(url, [])
+        self._load(0)
+
+    def execute_script(self, script: str, *args):
+        batch = self._next_batch()
+        if script == EXTRACT_ARTICLES_JS:
+            if batch is None:
+                # End of the recording, repeat the last batch like a page that stopped loading
+                if self.entries and self.entries[self.cursor]["articles"]:
+                    return self.corpus.articles(self.entries[self.cursor])
+                return []
+            self._load(batch)
+            return self.corpus.articles(self.entries[batch])
+        if script == LAST_ARTICLE_JS:
+            articles = self.corpus.articles(self.entries[batch]) if batch is not None else []
+            # Without a next batch, return a key no batch contains to end the scroll wait right away
+            return Article(**articles[-1]).key if articles else object()
+        raise NotImplementedError("Replay only supports the article extraction scripts")
+
+    def find_element(self, by: str, value: str) -> ReplayElement:
+        return _find_element(self._root(), by, value)
+
+    def find_elements(self, by: str, value: str) -> List[ReplayElement]:
+        return _find_elements(self._root(), by, value)
+
+    def maximize_window(self) -> None:
+        pass
+
+    def quit(self) -> None:
+        pass
+
+
+class ReplayResolver:
+    """
+    Resolves short links from the ones recorded with the corpus
+    """
+
+    def __init__(self, resolved: Dict[str, str]):
+        self.resolved = resolved
+        self.hits = 0
+        self.misses = 0
+
+    def resolve_many(self, urls: Iterable[str]) -> Dict[str, str]:
+        return {url: self.resolve(url) for url in urls}
+
+    def resolve(self, url: str) -> str:
+        if url in self.resolved:
+            self.hits += 1
+            return self.resolved[url]
+        self.misses += 1
+        return url
+
+    def close(self) -> None:
+        pass
+
+
+class ReplaySession:
+    """
+    Serves recorded API responses in place of a requests session
+    """
+
+    def __init__(self, corpus: Corpus):
+        self.corpus = corpus
+
+    def _arxiv_feed(self, arxiv_ids: List[str]) -> Optional[bytes]:
+        """
+        Builds an export API response for the ids out of every recorded one,
+        since a replay can batch the ids differently than the recorded run
+        """
+        recorded = {}
+        for url, entries in self.corpus.index.items():
+            if url.startswith(API_URL):
+                root = ET.fromstring(self.corpus.read(entries[0]["html"]).encode("utf-8"))
+                for entry in root.iter(ATOM + "entry"):
+                    recorded[extract_arxiv_id(entry.findtext(ATOM + "id") or "")] = entry
+        if not all(arxiv_id in recorded for arxiv_id in arxiv_ids):
+            return None
+        feed = ET.Element(ATOM + "feed")
+        feed.extend(recorded[arxiv_id] for arxiv_id in arxiv_ids)
+        return ET.tostring(feed)
+
+    def get(self, url: str, params=None, **kwargs) -> requests.Response:
+        full_url = requests.Request("GET", url, params=params).prepare().url
+        entries = self.corpus.index.get(full_url)
+        content = self.corpus.read(entries[0]["html"]).encode("utf-8") if entries else None
+        if content is None and url == API_URL and params and params.get("id_list"):
+            content = self._arxiv_feed(params["id_list"].split(","))
+        if content is None:
+            raise requests.ConnectionError(f"{full_url} is not in the replayed corpus")
+
+        response = requests.Response()
+        response.status_code = 200
+        response.url = full_url
+        response._content = content
+        return response
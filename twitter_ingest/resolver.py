@@ -0,0 +1,120 @@
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+from typing import Dict, Iterable, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import Retry
+
+logger = logging.getLogger(__name__)
+
+# Where resolved short links are kept between runs
+CACHE_PATH = "/tmp/ingest_url_cache.db"
+
+# Short links are effectively permanent, but keep entries bounded
+CACHE_TTL = 7 * 24 * 60 * 60
+
+# Concurrent resolutions, also the connection pool size
+MAX_WORKERS = 8
+
+REQUEST_TIMEOUT = 10
+
+
+class UrlResolver:
+    """
+    Resolves short links (t.co) to their final url with one pooled session,
+    a thread pool for resolving a batch of links concurrently, and a
+    persistent on-disk cache with TTL eviction.
+    """
+
+    def __init__(self, cache_path: Optional[str] = CACHE_PATH, ttl: int = CACHE_TTL, max_workers: int = MAX_WORKERS):
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers,
+                              max_retries=Retry(total=2, backoff_factor=1, allowed_methods=None,
+                                                status_forcelist=[429, 500, 502, 503, 504]))
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="resolver")
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        self.lock = threading.Lock()
+        self.memory: Dict[str, str] = {}
+        self.conn = sqlite3.connect(cache_path or ":memory:", check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS urls (short_url text primary key, url text not null, resolved_at real not null)")
+        self.conn.execute("DELETE FROM urls WHERE resolved_at < ?", (time() - ttl,))
+        self.conn.commit()
+
+    def _cached(self, url: str) -> Optional[str]:
+        if url in self.memory:
+            return self.memory[url]
+
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT url FROM urls WHERE short_url = ? AND resolved_at >= ?", (url, time() - self.ttl)).fetchone()
+        if row:
+            self.memory[url] = row[0]
+            return row[0]
+        return None
+
+    def _store(self, resolved: Dict[str, str]) -> None:
+        self.memory.update(resolved)
+        now = time()
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO urls VALUES (?, ?, ?)",
+                                  [(short, url, now) for short, url in resolved.items()])
+            self.conn.commit()
+
+    def _fetch(self, url: str) -> Optional[str]:
+        """
+        Follows redirects with HEAD so no bodies are downloaded, falling back to
+        a streamed GET for servers that don't support HEAD.
+        """
+        try:
+            r = self.session.head(url, allow_redirects=True, timeout=REQUEST_TIMEOUT)
+            if r.status_code >= 400:
+                r = self.session.get(url, allow_redirects=True, stream=True, timeout=REQUEST_TIMEOUT)
+                r.close()
+            return r.url
+        except Exception as e:
+            logger.warning(f"Cannot connect to {url}: {e}")
+            return None
+
+    def resolve_many(self, urls: Iterable[str]) -> Dict[str, str]:
+        """
+        Resolves all urls concurrently, returning a map of url to final url.
+        Urls that cannot be resolved map to themselves and are not cached.
+        """
+        result = {}
+        pending = []
+        for url in set(urls):
+            cached = self._cached(url)
+            if cached:
+                result[url] = cached
+                self.hits += 1
+            else:
+                pending.append(url)
+
+        if pending:
+            self.misses += len(pending)
+            logger.debug(f"Resolving {len(pending)} urls, {len(result)} cached")
+            resolved = {url: final for url, final in zip(pending, self.executor.map(self._fetch, pending)) if final}
+            self._store(resolved)
+            result.update(resolved)
+            for url in pending:
+                result.setdefault(url, url)
+
+        return result
+
+    def resolve(self, url: str) -> str:
+        return self.resolve_many([url])[url]
+
+    def close(self) -> None:
+        self.executor.shutdown()
+        self.session.close()
+        self.conn.close()
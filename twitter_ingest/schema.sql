@@ -7,7 +7,54 @@ CREATE TABLE papers (
     abstract text not null,
     authors text not null,
     title text not null,
-    created_at timestamp not null
+    created_at timestamp not null,
+    -- Same for every url variant of a paper, see paper_ids.py.
+    -- Databases created before this column: python migrate_canonical_ids.py
+    canonical_id text
 );
 
-create unique index idx_papers_paper_link on papers (paper_link);
\ No newline at end of file
+create unique index idx_papers_paper_link on papers (paper_link);
+
+create unique index idx_papers_canonical_id on papers (canonical_id);
+
+-- Every tweet linking a paper, papers.views is the sum of their views
+create table paper_tweets (
+    tweet text primary key,
+    canonical_id text not null,
+    user text not null,
+    profile_image text,
+    views integer default 0
+);
+
+create index idx_paper_tweets_canonical_id on paper_tweets (canonical_id, views);
+
+create index idx_papers_created_at_views on papers (created_at, views);
+
+-- Most similar papers by title and abstract, written by related.py
+create table related_papers (
+    paper_link text not null,
+    rank integer not null,
+    related_link text not null,
+    score real not null,
+    primary key (paper_link, rank)
+);
+
+-- Full-text index over papers, kept in sync by the triggers below.
+-- Databases created before it: python migrate_fts.py
+create virtual table papers_fts using fts5(
+    title, abstract, authors,
+    content='papers', content_rowid='rowid'
+);
+
+create trigger papers_fts_insert after insert on papers begin
+    insert into papers_fts(rowid, title, abstract, authors) values (new.rowid, new.title, new.abstract, new.authors);
+end;
+
+create trigger papers_fts_delete after delete on papers begin
+    insert into papers_fts(papers_fts, rowid, title, abstract, authors) values ('delete', old.rowid, old.title, old.abstract, old.authors);
+end;
+
+create trigger papers_fts_update after update of title, abstract, authors on papers begin
+    insert into papers_fts(papers_fts, rowid, title, abstract, authors) values ('delete', old.rowid, old.title, old.abstract, old.authors);
+    insert into papers_fts(rowid, title, abstract, authors) values (new.rowid, new.title, new.abstract, new.authors);
+end;
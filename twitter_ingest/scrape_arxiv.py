@@ -1,8 +1,10 @@
-from selenium.webdriver import Chrome
 from selenium.webdriver.common.by import By
-from time import sleep
+from selenium.webdriver.support import expected_conditions as EC
 from dataclasses import dataclass
-from typing import List
+
+# Page readiness conditions for Driver.go_link
+ARXIV_READY = EC.presence_of_element_located((By.TAG_NAME, "blockquote"))
+META_READY = EC.presence_of_element_located((By.TAG_NAME, "h1"))
 
 @dataclass
 class ArxivPaper:
@@ -11,7 +13,7 @@ class ArxivPaper:
     authors: str
 
 def scrape_arxiv_abstract(driver, arxiv_link: str):
-    driver.go_link(arxiv_link, 5)
+    driver.go_link(arxiv_link, 15, ARXIV_READY)
 
     title = driver.driver.find_element(By.XPATH, "//h1[contains(@class, 'title')]").text
     abstract = driver.driver.find_element(By.TAG_NAME, "blockquote").text
@@ -21,7 +23,7 @@ def scrape_arxiv_abstract(driver, arxiv_link: str):
 
 
 def scrape_meta_abstract(driver, meta_link: str):
-    driver.go_link(meta_link, 5)
+    driver.go_link(meta_link, 15, META_READY)
 
     title = driver.driver.find_element(By.TAG_NAME, "h1").text
     abstract = driver.driver.find_element(By.XPATH, "//h2/following-sibling::p").text
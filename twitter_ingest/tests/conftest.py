@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The ingest modules import each other as top level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Recorded search and show more pages, see replay.py
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
@@ -0,0 +1,40 @@
+from arxiv_api import fetch_arxiv_metadata, parse_atom_feed
+from conftest import CORPUS_DIR
+from replay import Corpus, ReplaySession
+
+ERROR_FEED = b"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <entry>
+    <id>http://arxiv.org/api/errors#incorrect_id_format_for_2308.x</id>
+    <title>Error</title>
+    <summary>incorrect id format for 2308.x</summary>
+  </entry>
+</feed>
+"""
+
+
+def recorded_feed(corpus: Corpus, ids: str) -> bytes:
+    url = f"http://export.arxiv.org/api/query?id_list={ids}&max_results={len(ids.split('%2C'))}"
+    return corpus.read(corpus.index[url][0]["html"]).encode("utf-8")
+
+
+def test_parse_atom_feed():
+    papers = parse_atom_feed(recorded_feed(Corpus(CORPUS_DIR), "2308.00001%2C2308.00002"))
+    assert sorted(papers) == ["2308.00001", "2308.00002"]
+    # Whitespace from line wrapping is collapsed
+    assert papers["2308.00001"].title == "Scaling Laws for Tiny Transformers"
+    assert papers["2308.00001"].abstract == "We measure how small transformers scale with data and compute."
+    assert papers["2308.00001"].authors == "Ada Lovelace, Charles Babbage"
+
+
+def test_parse_atom_feed_skips_errors():
+    assert parse_atom_feed(ERROR_FEED) == {}
+
+
+def test_fetch_arxiv_metadata_from_recorded_responses():
+    # The ids span two recorded responses, replayed as one request
+    papers = fetch_arxiv_metadata(["2308.00003", "2308.00001"], ReplaySession(Corpus(CORPUS_DIR)))
+    assert papers["2308.00003"].authors == "Grace Hopper"
+    assert papers["2308.00001"].title == "Scaling Laws for Tiny Transformers"
+    # Ids the corpus has no response for fail like a network error
+    assert fetch_arxiv_metadata(["2308.09999"], ReplaySession(Corpus(CORPUS_DIR))) == {}
@@ -0,0 +1,69 @@
+import multiprocessing
+from datetime import date
+from time import perf_counter, time
+
+import backfill
+import rate_limit
+from backfill import BackfillLog, backfill_days, days_between
+from rate_limit import SharedRateLimiter
+
+
+def test_backfill_retries_days_until_done(monkeypatch):
+    attempts = []
+
+    def ingest_day(day):
+        attempts.append(day)
+        # The second day is throttled once, the third always fails
+        if day == "2023-08-03" or (day == "2023-08-02" and attempts.count(day) == 1):
+            return day, "throttled", 0
+        return day, "done", 10
+
+    monkeypatch.setattr(backfill, "_ingest_day", ingest_day)
+    log = BackfillLog(None)
+    days = days_between(date(2023, 8, 1), date(2023, 8, 3))
+    assert days == ["2023-08-01", "2023-08-02", "2023-08-03"]
+
+    assert backfill_days(days, log) == ["2023-08-03"]
+    assert attempts.count("2023-08-01") == 1
+    assert attempts.count("2023-08-02") == 2
+    assert attempts.count("2023-08-03") == backfill.MAX_ATTEMPTS
+    # A rerun of the range only crawls the day left
+    assert log.done() == {"2023-08-01", "2023-08-02"}
+
+
+def test_rate_limiter_spends_burst_then_waits():
+    limiter = SharedRateLimiter(per_minute=600, burst=2)
+    start = perf_counter()
+    limiter.acquire()
+    limiter.acquire()
+    assert perf_counter() - start < 0.05
+    limiter.acquire()
+    assert perf_counter() - start >= 0.09
+
+
+def test_rate_limiter_backs_off_every_worker():
+    limiter = SharedRateLimiter(per_minute=600, burst=2)
+    assert limiter.backoff() == rate_limit.BACKOFF_BASE
+    assert limiter.backoff() == 2 * rate_limit.BACKOFF_BASE
+    assert limiter.paused_until.value > time() + rate_limit.BACKOFF_BASE
+    assert limiter.tokens.value == 0
+    limiter.succeeded()
+    assert limiter.backoff() == rate_limit.BACKOFF_BASE
+
+
+def acquire(limiter: SharedRateLimiter, times: int) -> None:
+    for _ in range(times):
+        limiter.acquire()
+
+
+def test_rate_limiter_is_shared_across_processes():
+    limiter = SharedRateLimiter(per_minute=600, burst=2)
+    start = perf_counter()
+    workers = [multiprocessing.Process(target=acquire, args=(limiter, 3)) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    # Six page loads, two from the burst and four at ten per second
+    assert perf_counter() - start >= 0.38
+    assert all(worker.exitcode == 0 for worker in workers)
@@ -0,0 +1,71 @@
+import json
+import shutil
+from datetime import datetime
+
+import ingest_scrape
+from checkpoint import CrawlCheckpoint
+from conftest import CORPUS_DIR
+from ingest_scrape import (TWEETS_READY, Driver, DriverPool, crawl_tweets, ingest_searches, replay_database,
+                           replay_searches)
+from metadata_cache import MetadataCache
+from replay import Corpus, ReplayResolver, ReplaySession, ReplayWebDriver
+
+SEARCH_URL = ("https://twitter.com/search?q=llms%20filter%3Alinks%20until%3A2023-08-02%20since%3A2023-08-01"
+              "&src=typed_query&f=top")
+
+
+def crawl(url: str):
+    corpus = Corpus(CORPUS_DIR)
+    driver = Driver(ReplayWebDriver(corpus))
+    driver.go_link(url, 1, TWEETS_READY)
+    return crawl_tweets(driver, ["arxiv.org", "huggingface.co"], ReplayResolver(corpus.resolved()))
+
+
+def test_crawl_follows_show_more():
+    tweets = {tweet.canonical_id: tweet for tweet in crawl(SEARCH_URL)}
+    assert sorted(tweets) == ["arxiv:2308.00001", "arxiv:2308.00002", "arxiv:2308.00003"]
+    assert tweets["arxiv:2308.00001"].views == 1200
+    # The show more tweet is parsed from its status page, with the views shown there
+    assert tweets["arxiv:2308.00002"].user == "alan"
+    assert tweets["arxiv:2308.00002"].views == 3456
+    assert tweets["arxiv:2308.00002"].paper_url == "https://arxiv.org/abs/2308.00002"
+    # Replies on the status page are crawled too, with their own views
+    assert tweets["arxiv:2308.00003"].user == "grace"
+    assert tweets["arxiv:2308.00003"].views == 250
+
+
+def test_replay_writes_to_local_database():
+    corpus = Corpus(CORPUS_DIR)
+    pool = DriverPool([Driver(ReplayWebDriver(corpus))])
+    with replay_database() as client:
+        pipeline = ingest_searches(pool, ReplayResolver(corpus.resolved()), datetime(2023, 8, 1),
+                                   replay_searches(corpus), ReplaySession(corpus), CrawlCheckpoint(None), client,
+                                   MetadataCache(None))
+        rows = client.execute("SELECT canonical_id, title, views FROM papers ORDER BY canonical_id")
+    assert pipeline.written == 3
+    assert [tuple(row) for row in rows] == [
+        ("arxiv:2308.00001", "Scaling Laws for Tiny Transformers", 1200),
+        ("arxiv:2308.00002", "Reasoning in Language Models", 3456),
+        ("arxiv:2308.00003", "Daily Papers, Reviewed", 250),
+    ]
+
+
+def test_crawl_skips_empty_show_more_page(tmp_path, monkeypatch):
+    shutil.copytree(CORPUS_DIR, tmp_path, dirs_exist_ok=True)
+    (tmp_path / "empty.html").write_text("<html><body></body></html>")
+    index = json.loads((tmp_path / "index.json").read_text())
+    index["https://twitter.com/alan/status/1002"] = [{"html": "empty.html", "articles": None}]
+    (tmp_path / "index.json").write_text(json.dumps(index))
+
+    corpus = Corpus(str(tmp_path))
+    driver = Driver(ReplayWebDriver(corpus))
+    driver.go_link(SEARCH_URL, 1, TWEETS_READY)
+    # The empty page never gets ready, don't wait it out
+    monkeypatch.setattr(ingest_scrape, "TWEETS_READY", lambda driver: True)
+    checkpoint = CrawlCheckpoint(None)
+    tweets = crawl_tweets(driver, ["arxiv.org", "huggingface.co"], ReplayResolver(corpus.resolved()),
+                          checkpoint.search(SEARCH_URL))
+    assert [tweet.canonical_id for tweet in tweets] == ["arxiv:2308.00001"]
+    # The show more tweet is done with, so a resumed run does not visit it again
+    progress = checkpoint.search(SEARCH_URL)
+    assert progress.done and not progress.show_more
@@ -0,0 +1,102 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+from db import SCHEMA_PATH, LocalClient, migrate_canonical_ids, migrate_fts, write_papers_batch
+from paper_ids import canonical_paper
+
+# Papers table of a database from before canonical ids
+OLD_PAPERS_SQL = """
+CREATE TABLE papers (
+    user text not null, profile_image text, paper_link text not null, views integer default 0,
+    source text not null, abstract text not null, authors text not null, title text not null,
+    created_at timestamp not null
+);
+CREATE UNIQUE INDEX idx_papers_paper_link ON papers (paper_link);
+"""
+
+
+def old_database() -> LocalClient:
+    """
+    A papers database from before the full-text index
+    """
+    client = LocalClient()
+    with open(SCHEMA_PATH) as f:
+        client.executescript(f.read().split("-- Full-text index")[0])
+    client.execute("INSERT INTO papers (user, paper_link, source, abstract, authors, title, created_at) "
+                   "VALUES ('ada', 'https://arxiv.org/abs/2308.00001', 'arxiv.org', 'Tiny transformers scale', "
+                   "'Ada Lovelace', 'Scaling Laws', 0)")
+    return client
+
+
+def search(client: LocalClient, query: str):
+    return [row[0] for row in client.execute(
+        "SELECT papers.paper_link FROM papers_fts JOIN papers ON papers.rowid = papers_fts.rowid "
+        "WHERE papers_fts MATCH ? ORDER BY papers.rowid", [query])]
+
+
+def test_migrate_fts_indexes_stored_and_new_papers():
+    client = old_database()
+    assert migrate_fts(client) == 1
+    assert search(client, "transformers") == ["https://arxiv.org/abs/2308.00001"]
+
+    client.execute("INSERT INTO papers (user, paper_link, source, abstract, authors, title, created_at) "
+                   "VALUES ('alan', 'https://arxiv.org/abs/2308.00002', 'arxiv.org', 'Reasoning in transformers', "
+                   "'Alan Turing', 'Reasoning', 0)")
+    client.execute("UPDATE papers SET abstract = 'Small models scale' WHERE user = 'ada'")
+    assert search(client, "transformers") == ["https://arxiv.org/abs/2308.00002"]
+
+    # Running it again keeps one index entry per paper
+    assert migrate_fts(client) == 2
+    assert search(client, "scale") == ["https://arxiv.org/abs/2308.00001"]
+
+
+def papers(client: LocalClient):
+    return [tuple(row) for row in client.execute(
+        "SELECT canonical_id, paper_link, user, views FROM papers ORDER BY canonical_id")]
+
+
+def test_migrate_canonical_ids_merges_url_variants():
+    client = LocalClient()
+    client.executescript(OLD_PAPERS_SQL)
+    for user, link, views in [("ada", "https://arxiv.org/pdf/2308.00001v2.pdf", 500),
+                              ("bob", "https://huggingface.co/papers/2308.00001", 900),
+                              ("alan", "https://arxiv.org/abs/2308.00002", 100)]:
+        client.execute("INSERT INTO papers (user, paper_link, views, source, abstract, authors, title, created_at) "
+                       "VALUES (?, ?, ?, 'arxiv.org', '', '', '', 0)", [user, link, views])
+
+    assert migrate_canonical_ids(client, canonical_paper) == 1
+    # The most viewed row is kept under the canonical url, with the views of both
+    assert papers(client) == [
+        ("arxiv:2308.00001", "https://arxiv.org/abs/2308.00001", "bob", 1400),
+        ("arxiv:2308.00002", "https://arxiv.org/abs/2308.00002", "alan", 100),
+    ]
+    assert client.execute("SELECT count(*) FROM paper_tweets WHERE tweet LIKE 'legacy:%'")[0][0] == 3
+
+    # Running it again changes nothing
+    assert migrate_canonical_ids(client, canonical_paper) == 0
+    assert papers(client)[0] == ("arxiv:2308.00001", "https://arxiv.org/abs/2308.00001", "bob", 1400)
+
+
+def tweet(key: str, user: str, views: int, metadata: bool = True):
+    return SimpleNamespace(
+        key=key, user=user, views=views, canonical_id="arxiv:2308.00001", paper_url="https://arxiv.org/abs/2308.00001",
+        profile_image_url=None, source="arxiv.org",
+        metadata=SimpleNamespace(title="Scaling Laws", abstract="", authors="Ada Lovelace") if metadata else None)
+
+
+def test_write_papers_batch_sums_views_and_upserts_recrawls():
+    client = LocalClient()
+    with open(SCHEMA_PATH) as f:
+        client.executescript(f.read())
+    now = datetime(2023, 8, 1)
+
+    # Tweets after the first of a paper come without metadata and only add views
+    assert write_papers_batch(client, [tweet("t1", "ada", 100), tweet("t2", "bob", 300, False),
+                                       tweet("t3", "cat", 50, False)], now, batch_size=2) == 2
+    assert papers(client) == [("arxiv:2308.00001", "https://arxiv.org/abs/2308.00001", "bob", 450)]
+
+    # A re-crawled tweet counts once, with the most views seen
+    write_papers_batch(client, [tweet("t1", "ada", 400, False)], now)
+    assert papers(client) == [("arxiv:2308.00001", "https://arxiv.org/abs/2308.00001", "ada", 750)]
+    write_papers_batch(client, [tweet("t1", "ada", 10, False)], now)
+    assert papers(client)[0][3] == 750
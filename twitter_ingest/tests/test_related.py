@@ -0,0 +1,64 @@
+import numpy as np
+
+from db import SCHEMA_PATH, LocalClient
+from related import RelatedIndex, update_related
+
+PAPERS = [
+    ("Transformer attention", "Scaling attention in transformer language models"),
+    ("Attention for translation", "Transformer attention improves language translation"),
+    ("Protein folding", "Predicting protein structure from folding dynamics"),
+    ("Folding molecules", "Protein structure of folding molecules"),
+    ("Robot grasping", "Grasping objects with robot manipulation control"),
+    ("Robot policies", "Learning robot manipulation control policies"),
+]
+
+
+def database() -> LocalClient:
+    client = LocalClient()
+    with open(SCHEMA_PATH) as f:
+        client.executescript(f.read())
+    return client
+
+
+def add_papers(client: LocalClient, papers) -> None:
+    for title, abstract in papers:
+        rowid = client.execute("SELECT count(*) FROM papers")[0][0] + 1
+        client.execute("INSERT INTO papers (user, paper_link, source, abstract, authors, title, created_at) "
+                       "VALUES ('ada', ?, 'arxiv.org', ?, 'Ada Lovelace', ?, 0)",
+                       [f"https://arxiv.org/abs/2308.{rowid:05d}", abstract, title])
+
+
+def related(client: LocalClient, link: str):
+    return [row[0] for row in client.execute(
+        "SELECT related_link FROM related_papers WHERE paper_link = ? ORDER BY rank", [link])]
+
+
+def link(rowid: int) -> str:
+    return f"https://arxiv.org/abs/2308.{rowid:05d}"
+
+
+def test_related_index_builds_saves_and_adds(tmp_path):
+    client = database()
+    path = str(tmp_path / "related")
+    add_papers(client, PAPERS[:4])
+    assert update_related(client, RelatedIndex(path, k=2)) == 4
+    assert related(client, link(1))[0] == link(2)
+    assert related(client, link(3))[0] == link(4)
+
+    # The saved index is memory mapped, and only the new papers are indexed
+    index = RelatedIndex(path, k=2)
+    assert isinstance(index.counts, np.memmap)
+    assert index.last_rowid == 4 and index.built_rows == 4
+    add_papers(client, PAPERS[4:])
+    assert update_related(client, index) >= 2
+    assert index.rows == 6 and index.built_rows == 4
+    assert related(client, link(5))[0] == link(6)
+    assert related(client, link(6))[0] == link(5)
+    assert related(client, link(1))[0] == link(2)
+    # Nothing new to index
+    assert update_related(client, RelatedIndex(path, k=2)) == 0
+
+    # Adding papers gives the same neighbors as building from scratch
+    rebuilt = RelatedIndex(None, k=2)
+    rebuilt.add(list(range(1, 7)), [link(i) for i in range(1, 7)], [f"{t} {a}" for t, a in PAPERS])
+    assert [rebuilt.related(row)[0][0] for row in range(6)] == [index.related(row)[0][0] for row in range(6)]
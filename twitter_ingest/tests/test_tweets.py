@@ -0,0 +1,69 @@
+from paper_ids import canonical_paper, extract_arxiv_id
+from replay import ReplayResolver
+from tweets import Article, parse_tweet, parse_views
+
+SOURCES = ["arxiv.org", "ai.meta.com/research/publications"]
+
+
+def article(text: str, links, show_more: bool = False) -> Article:
+    return Article(text=text, images=["https://pbs.twimg.com/profile.jpg", "https://pbs.twimg.com/figure.jpg"],
+                   links=links, show_more=show_more, status_link="https://twitter.com/ada/status/1")
+
+
+def test_parse_views_list_view():
+    assert parse_views(["Ada", "@ada", "text", "3", "4", "950"], True) == 950
+    assert parse_views(["Ada", "@ada", "text", "1,234"], True) == 1234
+    assert parse_views(["Ada", "@ada", "text", "1.2K"], True) == 1200
+    assert parse_views(["Ada", "@ada", "text", "3.4M"], True) == 3400000
+
+
+def test_parse_views_status_view():
+    lines = ["Ada", "@ada", "text", "10:00 AM · Aug 1, 2023", "·", "3,456", "Views"]
+    assert parse_views(lines, False) == 3456
+
+
+def test_parse_tweet_resolves_short_links():
+    resolver = ReplayResolver({"https://t.co/abc": "https://arxiv.org/abs/2308.00001v2"})
+    tweet = parse_tweet(article("Ada\n@ada\n·\nAug 1\nNew paper https://t.co/abc\n1\n2\n3\n1.5K",
+                                ["https://t.co/abc"]), SOURCES, True, resolver)
+    assert tweet.user == "ada"
+    assert tweet.views == 1500
+    assert tweet.paper_url == "https://arxiv.org/abs/2308.00001"
+    assert tweet.canonical_id == "arxiv:2308.00001"
+    assert tweet.profile_image_url == "https://pbs.twimg.com/profile.jpg"
+    assert tweet.embedded_image_url == "https://pbs.twimg.com/figure.jpg"
+    assert resolver.hits == 1
+
+
+def test_parse_tweet_without_paper():
+    resolver = ReplayResolver({})
+    assert parse_tweet(article("Ada\n@ada\nblog https://example.com/post\n5", ["https://example.com/post"]),
+                       SOURCES, True, resolver) is None
+    # A source host alone is not a paper
+    assert parse_tweet(article("Ada\n@ada\nhome https://arxiv.org\n5", ["https://arxiv.org/"]),
+                       SOURCES, True, resolver) is None
+    assert parse_tweet(article("Promoted", []), SOURCES, True, resolver) is None
+
+
+def test_canonical_paper_arxiv_variants():
+    expected = ("arxiv:2308.00001", "https://arxiv.org/abs/2308.00001")
+    for url in ["https://arxiv.org/abs/2308.00001", "http://arxiv.org/abs/2308.00001v3",
+                "https://arxiv.org/pdf/2308.00001v2.pdf", "https://export.arxiv.org/html/2308.00001",
+                "https://huggingface.co/papers/2308.00001"]:
+        assert canonical_paper(url) == expected
+    assert canonical_paper("https://arxiv.org/abs/cs.AI/0701001v1") == (
+        "arxiv:cs.AI/0701001", "https://arxiv.org/abs/cs.AI/0701001")
+
+
+def test_canonical_paper_other_sources():
+    assert canonical_paper("https://research.facebook.com/publications/Llama-2/") == (
+        "meta:llama-2", "https://ai.meta.com/research/publications/llama-2/")
+    assert canonical_paper("https://www.example.com/paper/") == ("url:example.com/paper", "https://www.example.com/paper/")
+
+
+def test_extract_arxiv_id():
+    # The export API's entry ids use the same urls
+    assert extract_arxiv_id("http://arxiv.org/abs/2308.00001v1") == "2308.00001"
+    assert extract_arxiv_id("https://huggingface.co/papers/2308.00001") == "2308.00001"
+    assert extract_arxiv_id("http://arxiv.org/api/errors#incorrect_id_format_for_2308.x") is None
+    assert extract_arxiv_id("https://ai.meta.com/research/publications/llama-2/") is None
@@ -0,0 +1,158 @@
+import logging
+from dataclasses import dataclass
+from typing import List, Optional
+from urllib.parse import urlparse
+
+from paper_ids import canonical_paper
+from scrape_arxiv import ArxivPaper
+
+logger = logging.getLogger(__name__)
+
+# Extracts every article on the page in a single WebDriver round trip.
+# When called with true, also scrolls the last article into view so the next
+# batch starts loading.
+EXTRACT_ARTICLES_JS = """
+var articles = Array.from(document.querySelectorAll("article"));
+var data = articles.map(function (article) {
+  var time = article.querySelector("time");
+  var status = time && time.parentElement.tagName === "A" ? time.parentElement.href : null;
+  return {
+    text: article.innerText,
+    images: Array.from(article.querySelectorAll("img"), function (img) { return img.src; }),
+    links: Array.from(article.querySelectorAll("a"), function (a) { return a.href; }),
+    show_more: Array.from(article.querySelectorAll("span")).some(function (span) {
+      return span.textContent.trim() === "Show more";
+    }),
+    status_link: status
+  };
+});
+if (arguments[0] && articles.length) {
+  articles[articles.length - 1].scrollIntoView();
+}
+return data;
+"""
+
+# Status link (or text) of the last article, to detect that a scroll loaded more
+LAST_ARTICLE_JS = """
+var articles = document.querySelectorAll("article");
+if (!articles.length) return null;
+var article = articles[articles.length - 1];
+var time = article.querySelector("time");
+return time && time.parentElement.tagName === "A" ? time.parentElement.href : article.innerText;
+"""
+
+
+@dataclass
+class Article:
+    """
+    Plain data extracted from a tweet article element
+    """
+    text: str
+    images: List[str]
+    links: List[str]
+    show_more: bool
+    status_link: Optional[str]
+
+    @property
+    def key(self) -> str:
+        return self.status_link or self.text
+
+
+@dataclass
+class Tweet:
+    text: str
+    profile_image_url: str
+    embedded_image_url: Optional[str]
+    paper_url: str
+    user: str
+    source: str
+    views: int
+    metadata: ArxivPaper
+    # Same for every url variant of a paper, see paper_ids.canonical_paper
+    canonical_id: Optional[str] = None
+    status_link: Optional[str] = None
+
+    @property
+    def key(self) -> str:
+        """
+        Identifies the tweet itself, so each tweet's views count once per paper
+        """
+        return self.status_link or f"{self.user}:{self.text}"
+
+
+def parse_views(lines: List[str], list_view: bool) -> int:
+    view_str = lines[-1].strip()
+    if not str(view_str[0]).isdigit():
+        # In the per tweet status view, need to find the views line
+        found_views = False
+        for line in reversed(lines):
+            if found_views:
+                view_str = line
+                break
+
+            if line.strip() == "Views":
+                found_views = True
+
+    view_str = view_str.replace(",", "")
+    if view_str.endswith("K"):
+        # Replace decimal and append 00
+        view_str = view_str.replace(".", "")
+        view_str = view_str[0:-1] + "00"
+
+    if view_str.endswith("M"):
+        # Replace decimal and append 00
+        view_str = view_str.replace(".", "")
+        view_str = view_str[0:-1] + "00000"
+
+    return int(view_str)
+
+def has_enough_parts(url: str) -> bool:
+    parsed = urlparse(url)
+    return len(parsed.path[1:].split("/")) > 1
+
+
+def parse_tweet(article: Article, sources: List[str], list_view: bool, resolver) -> Optional[Tweet]:
+    text = article.text
+    lines = text.split("\n")
+    if len(lines) == 1:
+        logger.warn("Found a unexpected tweet: " + text)
+        return None
+
+    user = lines[1][1:]  # remove @
+    images = article.images
+    profile_image = ""
+    if len(images) > 0:
+        profile_image = images[0]
+    embedded_image = None
+    if len(images) > 1:
+        embedded_image = images[1]
+
+    paper_url = None
+    found_source = None
+
+    for url in article.links:
+        if "t.co" in url:
+            url = resolver.resolve(url)
+
+        for source in sources:
+            if source in url and has_enough_parts(url):
+                paper_url = url
+                found_source = source
+                break
+
+    if not paper_url:
+        return None
+
+    views = parse_views(lines, list_view)
+    canonical_id, paper_url = canonical_paper(paper_url)
+
+    return Tweet(text=text,
+                 user=user,
+                 views=views,
+                 paper_url=paper_url,
+                 profile_image_url=profile_image,
+                 source=found_source,
+                 embedded_image_url=embedded_image,
+                 metadata=None,
+                 canonical_id=canonical_id,
+                 status_link=article.status_link)
@@ -1,9 +1,15 @@
 import os
+from dotenv import load_dotenv
 from flask import Flask
 from flask_cors import CORS
 
+load_dotenv()
+
 # Initialize CORS
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 app.secret_key = os.urandom(24)
+
+from app.metrics import init_app
+init_app(app)
 from app import routes
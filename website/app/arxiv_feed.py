@@ -0,0 +1,96 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Dict, List, Optional, Sequence, Tuple, Union
+
+from app.cache import FeedCache, Validators
+from app.metrics import metrics
+
+API_URL = 'http://export.arxiv.org/api/query'
+
+# Papers per category on each index page
+PAGE_SIZE = 25
+
+ATOM = '{http://www.w3.org/2005/Atom}'
+
+
+def parse_arxiv_id(link: str):
+    return link.split("/")[-1]
+
+
+def parse_feed(source: Union[bytes, IO[bytes]]) -> List[Dict]:
+    """
+    Parses an Atom feed incrementally, clearing each entry once read so
+    memory stays flat regardless of the feed size.
+    """
+    # Imported on first use, like requests below, so workers start faster
+    from lxml import etree
+
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+
+    papers = []
+    for _, entry in etree.iterparse(source, events=('end',), tag=ATOM + 'entry'):
+        link = entry.findtext(ATOM + 'id')
+        papers.append({
+            'id': parse_arxiv_id(link),
+            'title': entry.findtext(ATOM + 'title'),
+            'summary': entry.findtext(ATOM + 'summary'),
+            'authors': [name.text for name in entry.iterfind(f'{ATOM}author/{ATOM}name')],
+            'published': entry.findtext(ATOM + 'published'),
+            'link': link,
+        })
+        entry.clear()
+        while entry.getprevious() is not None:
+            del entry.getparent()[0]
+    return papers
+
+
+def fetch_feed(category: str, start: int = 0, max_results: int = PAGE_SIZE,
+               validators: Optional[Validators] = None) -> Optional[Tuple[List[Dict], Validators]]:
+    """
+    Fetches one page of the newest papers in category, parsing the response
+    as it streams in. Returns None when the validators are still current.
+    """
+    params = {
+        'search_query': f'cat:{category}',
+        'sortBy': 'submittedDate',
+        'sortOrder': 'descending',
+        'start': start,
+        'max_results': max_results,
+    }
+    import requests
+
+    headers = validators.headers() if validators else {}
+    with metrics.timer("arxiv", "feed"), \
+            requests.get(API_URL, params=params, headers=headers, stream=True, timeout=30) as response:
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        response.raw.decode_content = True
+        papers = parse_feed(response.raw)
+    return papers, Validators(response.headers.get('ETag'), response.headers.get('Last-Modified'))
+
+
+def page_key(category: str, page: int) -> str:
+    return f'{category}@{page}'
+
+
+def fetch_page(key: str, validators: Validators) -> Optional[Tuple[List[Dict], Validators]]:
+    category, page = key.rsplit('@', 1)
+    return fetch_feed(category, int(page) * PAGE_SIZE, PAGE_SIZE, validators)
+
+
+feed_cache = FeedCache('arxiv', fetch_page)
+executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='arxiv')
+
+
+def get_papers(categories: Sequence[str], page: int = 0) -> List[Dict]:
+    """
+    Returns a page of papers from all categories, fetched concurrently and
+    merged by id, newest first
+    """
+    pages = executor.map(lambda category: feed_cache.get(page_key(category, page)) or [], categories)
+    papers = {}
+    for paper in (p for papers in pages for p in papers):
+        papers.setdefault(paper['id'], paper)
+    return sorted(papers.values(), key=lambda p: p['published'], reverse=True)
@@ -0,0 +1,207 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.files import FileLock, write_atomic
+
+logger = logging.getLogger(__name__)
+
+# Shared by all gunicorn workers on the machine
+CACHE_DIR = os.getenv("ARXIVY_CACHE_DIR", "/tmp/arxivy_cache")
+
+# Seconds a cached feed is served before it is revalidated
+CACHE_TTL = int(os.getenv("ARXIVY_CACHE_TTL", "600"))
+
+# Seconds after which another worker's refresh lock is considered abandoned
+LOCK_TIMEOUT = 60
+
+# Seconds a cold miss waits for another worker fetching the same key, about
+# the upstream's request timeout, before fetching it too
+MISS_WAIT = 30
+
+# Seconds between checks of the disk tier while waiting on another worker
+MISS_POLL = 0.1
+
+
+class Validators:
+    """
+    Conditional GET state of a cached response
+    """
+
+    def __init__(self, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+# Fetches a key given the validators of the cached value. Returns None when
+# the upstream reports the cached value is still current, otherwise the new
+# value and its validators.
+Fetcher = Callable[[str, Validators], Optional[Tuple[Any, Validators]]]
+
+
+class FeedCache:
+    """
+    Stale-while-revalidate cache. Values live in process memory and in a
+    shared on-disk tier, so a value fetched by one worker serves all of them.
+    Fresh values are served directly. Stale values are served while a
+    background refresh revalidates them with a conditional GET, and only a
+    key never fetched before blocks on the upstream, fetched by one worker
+    while the others wait for it.
+    """
+
+    def __init__(self, name: str, fetch: Fetcher, ttl: int = CACHE_TTL, cache_dir: str = CACHE_DIR):
+        self.name = name
+        self.fetch = fetch
+        self.ttl = ttl
+        self.cache_dir = os.path.join(cache_dir, name)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.memory: Dict[str, Dict[str, Any]] = {}
+        # Refresh lock of each key, shared with the other workers
+        self.refresh_locks: Dict[str, FileLock] = {}
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "not_modified": 0, "errors": 0}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key.replace("/", "_") + ".json")
+
+    def _read_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key: str, entry: Dict[str, Any]) -> None:
+        write_atomic(self._path(key), json.dumps(entry))
+
+    def _entry(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the newest entry from memory or disk
+        """
+        entry = self.memory.get(key)
+        if entry and self._is_fresh(entry):
+            return entry
+        disk = self._read_disk(key)
+        if disk and (not entry or disk["fetched_at"] > entry["fetched_at"]):
+            self.memory[key] = entry = disk
+        return entry
+
+    def warm(self) -> int:
+        """
+        Loads every entry of the disk tier into memory, returning how many.
+        Stale entries are served until their first request refreshes them.
+        """
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".json"):
+                key = name[:-len(".json")]
+                entry = self._read_disk(key)
+                if entry:
+                    self.memory[key] = entry
+        return len(self.memory)
+
+    def _is_fresh(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - entry["fetched_at"] < self.ttl
+
+    def _count(self, stat: str) -> None:
+        with self.lock:
+            self.stats[stat] += 1
+
+    def _refresh_lock(self, key: str) -> FileLock:
+        with self.lock:
+            if key not in self.refresh_locks:
+                self.refresh_locks[key] = FileLock(self._path(key) + ".lock", LOCK_TIMEOUT)
+            return self.refresh_locks[key]
+
+    def _acquire_refresh(self, key: str) -> bool:
+        """
+        Claims the refresh of key across threads and worker processes
+        """
+        return self._refresh_lock(key).acquire()
+
+    def _release_refresh(self, key: str) -> None:
+        self._refresh_lock(key).release()
+
+    def refresh(self, key: str, entry: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Revalidates key against the upstream, returning the current entry
+        """
+        validators = Validators(entry.get("etag"), entry.get("last_modified")) if entry else Validators()
+        self._count("refreshes")
+        try:
+            result = self.fetch(key, validators)
+        except Exception:
+            logger.exception(f"Failed refreshing {self.name} cache for {key}")
+            self._count("errors")
+            return entry
+
+        if result is None and entry:
+            self._count("not_modified")
+            entry = {**entry, "fetched_at": time.time()}
+        elif result is not None:
+            value, validators = result
+            entry = {"value": value, "etag": validators.etag, "last_modified": validators.last_modified,
+                     "fetched_at": time.time()}
+        else:
+            return None
+
+        self.memory[key] = entry
+        self._write_disk(key, entry)
+        return entry
+
+    def _refresh_in_background(self, key: str, entry: Dict[str, Any]) -> None:
+        if not self._acquire_refresh(key):
+            return
+
+        def run():
+            try:
+                self.refresh(key, entry)
+            finally:
+                self._release_refresh(key)
+
+        threading.Thread(target=run, name=f"refresh-{self.name}-{key}", daemon=True).start()
+
+    def get(self, key: str) -> Any:
+        entry = self._entry(key)
+        if entry and self._is_fresh(entry):
+            self._count("hits")
+            return entry["value"]
+
+        if entry:
+            self._count("stale_hits")
+            self._refresh_in_background(key, entry)
+            return entry["value"]
+
+        self._count("misses")
+        entry = self._fetch_missing(key)
+        return entry["value"] if entry else None
+
+    def _fetch_missing(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Fetches a key no worker has cached, or waits for the worker already
+        fetching it and reads its result from the disk tier
+        """
+        deadline = time.time() + MISS_WAIT
+        while not self._acquire_refresh(key):
+            time.sleep(MISS_POLL)
+            entry = self._entry(key)
+            if entry:
+                return entry
+            if time.time() > deadline:
+                logger.warning(f"Gave up waiting on another worker fetching {self.name} cache for {key}")
+                return self.refresh(key)
+        try:
+            # Another worker may have written it since the miss
+            return self._entry(key) or self.refresh(key)
+        finally:
+            self._release_refresh(key)
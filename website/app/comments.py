@@ -0,0 +1,77 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List
+
+from app.cache import CACHE_DIR
+from app.files import write_atomic
+
+# Seconds comments are cached before they are fetched again
+COMMENTS_TTL = 30
+
+
+class CommentCache:
+    """
+    Short-lived per-worker cache of comments keyed by post id. Misses for any
+    number of posts are fetched with a single query. Posting a comment
+    invalidates its post in every worker: it stamps a file per post in the
+    shared cache directory, and entries fetched before the stamp are
+    fetched again.
+    """
+
+    def __init__(self, fetch_many: Callable[[List[str]], List[Dict]], ttl: int = COMMENTS_TTL,
+                 cache_dir: str = CACHE_DIR):
+        self.fetch_many = fetch_many
+        self.ttl = ttl
+        self.cache_dir = os.path.join(cache_dir, "comments")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.entries: Dict[str, tuple] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, post_ids: Iterable[str]) -> Dict[str, List[Dict]]:
+        now = time.time()
+        comments = {}
+        missing = []
+        with self.lock:
+            for post_id in dict.fromkeys(str(p) for p in post_ids):
+                entry = self.entries.get(post_id)
+                if entry and entry[0] > now and entry[2] > self._invalidated_at(post_id):
+                    comments[post_id] = entry[1]
+                else:
+                    missing.append(post_id)
+            self.hits += len(comments)
+            self.misses += len(missing)
+
+        if missing:
+            fetched = {post_id: [] for post_id in missing}
+            for comment in self.fetch_many(missing):
+                fetched[str(comment["post_id"])].append(comment)
+            with self.lock:
+                for post_id, post_comments in fetched.items():
+                    self.entries[post_id] = (now + self.ttl, post_comments, now)
+            comments.update(fetched)
+
+        return comments
+
+    def get(self, post_id: str) -> List[Dict]:
+        return self.get_many([post_id])[str(post_id)]
+
+    def _stamp_path(self, post_id: str) -> str:
+        return os.path.join(self.cache_dir, post_id.replace("/", "_") + ".stamp")
+
+    def _invalidated_at(self, post_id: str) -> float:
+        # The time is kept in the file, mtimes are too coarse to order it
+        # against a fetch a moment earlier
+        try:
+            with open(self._stamp_path(post_id)) as f:
+                return float(f.read())
+        except (OSError, ValueError):
+            return 0.0
+
+    def invalidate(self, post_id: str) -> None:
+        post_id = str(post_id)
+        write_atomic(self._stamp_path(post_id), str(time.time()))
+        with self.lock:
+            self.entries.pop(post_id, None)
@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Any, List, Optional, Tuple
+
+from app.metrics import metrics
+
+if TYPE_CHECKING:
+    import libsql_client
+
+logger = logging.getLogger(__name__)
+
+# Seconds between health checks of an idle connection
+HEALTH_CHECK_INTERVAL = 30
+
+# Read the primary through the libsql async client, shared by the threads of
+# a gthread worker, see gunicorn.conf.py. Off by default.
+ASYNC_DB = os.getenv("ARXIVY_ASYNC_DB") == "1"
+
+
+class Database:
+    """
+    One libsql client per worker process, created on first use and shared by
+    all requests. The connection is health checked when it has been idle and
+    reconnected after a failure or a fork.
+    """
+
+    # Statements are run one at a time, the sync client awaits one query at a
+    # time on its own thread
+    concurrent = False
+
+    def __init__(self, url: Optional[str], auth_token: Optional[str], upstream: str = "turso"):
+        self.url = url
+        self.auth_token = auth_token
+        # Label of this database's latency in the metrics
+        self.upstream = upstream
+        self.lock = threading.Lock()
+        self.client: Optional["libsql_client.ClientSync"] = None
+        self.pid = None
+        self.last_used = 0.0
+        self.connects = 0
+
+    def _connect(self) -> "libsql_client.ClientSync":
+        # Imported on first use, it pulls in aiohttp and is slow to import
+        import libsql_client
+        self.reset()
+        self.client = libsql_client.create_client_sync(url=self.url, auth_token=self.auth_token)
+        self.pid = os.getpid()
+        self.connects += 1
+        return self.client
+
+    def _healthy(self) -> bool:
+        try:
+            self.client.execute("SELECT 1")
+            return True
+        except Exception as e:
+            logger.warning(f"Database health check failed, reconnecting: {e}")
+            return False
+
+    def client_sync(self) -> "libsql_client.ClientSync":
+        with self.lock:
+            if self.client is None or self.pid != os.getpid():
+                return self._connect()
+            if time.time() - self.last_used > HEALTH_CHECK_INTERVAL and not self._healthy():
+                return self._connect()
+            return self.client
+
+    def execute(self, sql: str, args=None) -> "libsql_client.ResultSet":
+        import libsql_client
+        with metrics.timer(self.upstream, "execute"):
+            try:
+                result = self.client_sync().execute(sql, args)
+            except libsql_client.LibsqlError:
+                raise
+            except Exception as e:
+                # The connection dropped, retry once on a new one
+                logger.warning(f"Database connection failed, reconnecting: {e}")
+                with self.lock:
+                    self._connect()
+                result = self.client_sync().execute(sql, args)
+        self.last_used = time.time()
+        return result
+
+    def reset(self) -> None:
+        """
+        Drops the current connection, the next query reconnects. The sync
+        client runs a non-daemon thread, so a process exits only once its
+        connection is dropped.
+        """
+        if self.client is not None and self.pid == os.getpid():
+            try:
+                self.client.close()
+            except Exception:
+                pass
+        self.client = None
+
+
+class AsyncDatabase:
+    """
+    One libsql async client per worker process, on an event loop in a thread
+    of its own, started on first use and again after a fork. Any request
+    thread can submit statements to it, and unlike the sync client, which
+    runs one query at a time, they all run concurrently: the statements of a
+    request overlap, and so do the requests of a threaded worker. The
+    connection is health checked when it has been idle and reconnected after
+    a failure.
+    """
+
+    concurrent = True
+
+    def __init__(self, url: Optional[str], auth_token: Optional[str], upstream: str = "turso"):
+        self.url = url
+        self.auth_token = auth_token
+        self.upstream = upstream
+        self.lock = threading.Lock()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        # Only used on the loop's thread
+        self.client: Optional["libsql_client.Client"] = None
+        self.pid = None
+        self.last_used = 0.0
+        self.connects = 0
+
+    def _event_loop(self) -> asyncio.AbstractEventLoop:
+        with self.lock:
+            if self.loop is None or self.pid != os.getpid():
+                self.loop = asyncio.new_event_loop()
+                self.client = None
+                self.pid = os.getpid()
+                threading.Thread(target=self.loop.run_forever, name="libsql-async", daemon=True).start()
+            return self.loop
+
+    async def _connect(self) -> "libsql_client.Client":
+        import libsql_client
+        await self._close()
+        self.client = libsql_client.create_client(url=self.url, auth_token=self.auth_token)
+        self.connects += 1
+        self.last_used = time.time()
+        return self.client
+
+    async def _close(self) -> None:
+        client, self.client = self.client, None
+        if client is not None:
+            try:
+                await client.close()
+            except Exception:
+                pass
+
+    async def _client(self) -> "libsql_client.Client":
+        if self.client is None:
+            return await self._connect()
+        if time.time() - self.last_used > HEALTH_CHECK_INTERVAL:
+            # Set first, so the requests waiting meanwhile don't check it too
+            self.last_used = time.time()
+            try:
+                await self.client.execute("SELECT 1")
+            except Exception as e:
+                logger.warning(f"Database health check failed, reconnecting: {e}")
+                return await self._connect()
+        return self.client
+
+    async def _execute(self, sql: str, args=None) -> "libsql_client.ResultSet":
+        import libsql_client
+        with metrics.timer(self.upstream, "execute_async"):
+            client = await self._client()
+            try:
+                result = await client.execute(sql, args)
+            except libsql_client.LibsqlError:
+                raise
+            except Exception as e:
+                # The connection dropped, retry once on a new one, unless a
+                # concurrent query reconnected already
+                logger.warning(f"Database connection failed, reconnecting: {e}")
+                if self.client is client:
+                    await self._connect()
+                result = await (await self._client()).execute(sql, args)
+        self.last_used = time.time()
+        return result
+
+    def gather(self, *statements: Tuple[str, Any], return_exceptions: bool = False) -> List[Any]:
+        """
+        Runs (sql, args) statements concurrently and waits for all of them,
+        returning their results in order. With return_exceptions, a failed
+        statement's exception is returned in its place instead of raised.
+        """
+        async def run():
+            return await asyncio.gather(*(self._execute(sql, args) for sql, args in statements),
+                                        return_exceptions=return_exceptions)
+        return asyncio.run_coroutine_threadsafe(run(), self._event_loop()).result()
+
+    def execute(self, sql: str, args=None) -> "libsql_client.ResultSet":
+        return self.gather((sql, args))[0]
+
+    def reset(self) -> None:
+        """
+        Closes the connection and stops the event loop, the next query starts
+        both again
+        """
+        with self.lock:
+            loop, self.loop = self.loop, None
+            if loop is None or self.pid != os.getpid():
+                return
+        try:
+            asyncio.run_coroutine_threadsafe(self._close(), loop).result(timeout=5)
+        except Exception:
+            pass
+        loop.call_soon_threadsafe(loop.stop)
+
+
+database = Database(os.getenv("TURSO_URL"), os.getenv("TURSO_AUTH_TOKEN"))
+database_async = AsyncDatabase(os.getenv("TURSO_URL"), os.getenv("TURSO_AUTH_TOKEN")) if ASYNC_DB else None
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import threading
+import time
+from typing import Union
+
+
+def write_atomic(path: str, data: Union[str, bytes]) -> None:
+    """
+    Writes through a temporary file in the same directory, swapped in once
+    complete, so other workers never read a partial file
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb" if isinstance(data, bytes) else "w") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class FileLock:
+    """
+    Non-blocking lock shared by the threads of this process, through a flag,
+    and by the worker processes on the machine, through a lock file created
+    exclusively. A lock file older than timeout seconds was left by a worker
+    that died holding it, and is taken over.
+    """
+
+    def __init__(self, path: str, timeout: float):
+        self.path = path
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.held = False
+
+    def acquire(self) -> bool:
+        """
+        Claims the lock, returning False if a thread or worker holds it
+        """
+        with self.lock:
+            if self.held:
+                return False
+            self.held = True
+        try:
+            if time.time() - os.path.getmtime(self.path) > self.timeout:
+                os.remove(self.path)
+        except OSError:
+            pass
+        try:
+            os.close(os.open(self.path, os.O_CREAT | os.O_EXCL))
+            return True
+        except FileExistsError:
+            with self.lock:
+                self.held = False
+            return False
+
+    def release(self) -> None:
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+        with self.lock:
+            self.held = False
@@ -0,0 +1,218 @@
+import cProfile
+import glob
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+from flask import Flask, g, request
+
+from app.files import write_atomic
+
+logger = logging.getLogger(__name__)
+
+# Each worker writes its metrics here and /metrics sums them, so any worker
+# can answer for the whole machine
+METRICS_DIR = os.getenv("ARXIVY_METRICS_DIR", "/tmp/arxivy_metrics")
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Fraction of requests run under the profiler, off by default
+PROFILE_SAMPLE = float(os.getenv("ARXIVY_PROFILE_SAMPLE", "0"))
+
+# Sampled requests slower than this many seconds keep their profile
+SLOW_REQUEST = float(os.getenv("ARXIVY_SLOW_REQUEST", "1.0"))
+
+# Newest profiles kept on disk
+MAX_PROFILES = 50
+
+HELP = {
+    "arxivy_request_seconds": "Latency of requests by route.",
+    "arxivy_requests_total": "Requests by route and status.",
+    "arxivy_upstream_seconds": "Latency of calls to arXiv, Turso and Supabase.",
+    "arxivy_upstream_errors_total": "Failed calls to arXiv, Turso and Supabase.",
+    "arxivy_slow_profiles_total": "Sampled slow requests whose profile was saved.",
+    "arxivy_replica_reads_total": "Reads served by the local replica or the primary.",
+    "arxivy_replica_lag_seconds": "Seconds since the local replica was synced from the primary.",
+}
+
+
+def label_string(labels: Dict[str, str]) -> str:
+    return ",".join(f'{name}="{value}"' for name, value in labels.items())
+
+
+class Metrics:
+    """
+    Counters and latency histograms of one worker process. The totals are
+    written to a file per pid after every request, and /metrics sums the
+    files of all workers. Files of exited workers are kept, so counts
+    never go backwards while the machine is up.
+    """
+
+    def __init__(self, metrics_dir: str = METRICS_DIR):
+        self.metrics_dir = metrics_dir
+        os.makedirs(metrics_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.counters: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        # Per labels: cumulative bucket counts, then sum and count
+        self.histograms: Dict[str, Dict[str, list]] = defaultdict(dict)
+        # Read when rendered, by whichever worker answers /metrics
+        self.gauges: Dict[str, Callable[[], Optional[float]]] = {}
+
+    def inc(self, name: str, labels: Dict[str, str], value: float = 1) -> None:
+        with self.lock:
+            self.counters[name][label_string(labels)] += value
+
+    def observe(self, name: str, labels: Dict[str, str], seconds: float) -> None:
+        key = label_string(labels)
+        with self.lock:
+            series = self.histograms[name].setdefault(key, [0] * len(LATENCY_BUCKETS) + [0.0, 0])
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    series[i] += 1
+            series[-2] += seconds
+            series[-1] += 1
+
+    def gauge(self, name: str, read: Callable[[], Optional[float]]) -> None:
+        """
+        Registers a machine-wide value, left out while read returns None
+        """
+        self.gauges[name] = read
+
+    @contextmanager
+    def timer(self, upstream: str, operation: str) -> Iterator[None]:
+        """
+        Times a call to an upstream service, counting it as an error if it raises
+        """
+        labels = {"upstream": upstream, "operation": operation}
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc("arxivy_upstream_errors_total", labels)
+            raise
+        finally:
+            self.observe("arxivy_upstream_seconds", labels, time.perf_counter() - start)
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.metrics_dir, f"{pid}.json")
+
+    def flush(self) -> None:
+        with self.lock:
+            data = json.dumps({"counters": self.counters, "histograms": self.histograms})
+        write_atomic(self._path(os.getpid()), data)
+
+    def collect(self):
+        """
+        Sums the metrics files of every worker
+        """
+        self.flush()
+        counters: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        histograms: Dict[str, Dict[str, list]] = defaultdict(dict)
+        for path in glob.glob(os.path.join(self.metrics_dir, "*.json")):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, series in data["counters"].items():
+                for key, value in series.items():
+                    counters[name][key] += value
+            for name, series in data["histograms"].items():
+                for key, values in series.items():
+                    total = histograms[name].setdefault(key, [0] * len(values))
+                    for i, value in enumerate(values):
+                        total[i] += value
+        return counters, histograms
+
+    def render(self) -> str:
+        """
+        Returns the metrics of all workers in the Prometheus text format
+        """
+        counters, histograms = self.collect()
+        lines = []
+        for name, series in sorted(histograms.items()):
+            lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} histogram"]
+            for key, values in sorted(series.items()):
+                prefix = key + "," if key else ""
+                for bound, count in zip(LATENCY_BUCKETS, values):
+                    lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {values[-1]}')
+                lines.append(f"{name}_sum{{{key}}} {values[-2]:.6f}")
+                lines.append(f"{name}_count{{{key}}} {values[-1]}")
+        for name, series in sorted(counters.items()):
+            lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} counter"]
+            lines += [f"{name}{{{key}}} {value:g}" for key, value in sorted(series.items())]
+        for name, read in sorted(self.gauges.items()):
+            value = read()
+            if value is not None:
+                lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} gauge", f"{name} {value:.3f}"]
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def save_profile(profiler: cProfile.Profile, route: str, seconds: float) -> None:
+    profile_dir = os.path.join(METRICS_DIR, "profiles")
+    os.makedirs(profile_dir, exist_ok=True)
+    name = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+    path = os.path.join(profile_dir, f"{time.time():.0f}-{os.getpid()}-{name}-{seconds * 1000:.0f}ms.prof")
+    profiler.dump_stats(path)
+    logger.info(f"Saved profile of slow request to {route} to {path}")
+
+    profiles = sorted(glob.glob(os.path.join(profile_dir, "*.prof")), key=os.path.getmtime)
+    for old in profiles[:-MAX_PROFILES]:
+        os.remove(old)
+
+
+def init_app(app: Flask) -> None:
+    """
+    Records the latency and status of every request, profiling a sample of
+    them when ARXIVY_PROFILE_SAMPLE is set
+    """
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+        if PROFILE_SAMPLE and random.random() < PROFILE_SAMPLE:
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def record_status(response):
+        g.response_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def record_request(exc):
+        start = g.pop("request_start", None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        status = g.pop("response_status", 500)
+
+        profiler = g.pop("profiler", None)
+        if profiler:
+            profiler.disable()
+            if elapsed > SLOW_REQUEST:
+                try:
+                    save_profile(profiler, route, elapsed)
+                    metrics.inc("arxivy_slow_profiles_total", {"route": route})
+                except OSError:
+                    logger.exception("Failed saving profile")
+
+        metrics.observe("arxivy_request_seconds", {"route": route, "method": request.method}, elapsed)
+        metrics.inc("arxivy_requests_total", {"route": route, "method": request.method, "status": str(status)})
+        try:
+            metrics.flush()
+        except OSError:
+            logger.exception("Failed writing metrics")
@@ -0,0 +1,26 @@
+from typing import Dict, List, Tuple
+
+# Related papers are precomputed at ingest, see twitter_ingest/related.py
+RELATED_SQL = """
+SELECT related_papers.paper_link, related_papers.related_link, papers.title
+FROM related_papers JOIN papers ON papers.paper_link = related_papers.related_link
+WHERE related_papers.paper_link IN ({links})
+ORDER BY related_papers.paper_link, related_papers.rank
+"""
+
+
+def related_query(feed: List[Dict]) -> Tuple[str, List[str]]:
+    """
+    Returns the query for the related papers of every paper in the feed
+    """
+    links = [paper["paper_link"] for day in feed for paper in day["papers"]]
+    return RELATED_SQL.format(links=",".join("?" * len(links))), links
+
+
+def attach_related(feed: List[Dict], rows) -> None:
+    related: Dict[str, List[Dict]] = {}
+    for row in rows:
+        related.setdefault(row["paper_link"], []).append({"paper_link": row["related_link"], "title": row["title"]})
+    for day in feed:
+        for paper in day["papers"]:
+            paper["related"] = related.get(paper["paper_link"], [])
@@ -0,0 +1,225 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, List, Optional, Tuple
+
+from app.db import AsyncDatabase, Database, database, database_async
+from app.files import FileLock
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Local SQLite copy of the tables the website reads, off when unset
+REPLICA_PATH = os.getenv("ARXIVY_REPLICA_PATH")
+
+# Seconds after a sync before reads start a new one in the background
+REPLICA_SYNC_INTERVAL = int(os.getenv("ARXIVY_REPLICA_SYNC_INTERVAL", "3600"))
+
+# Seconds after a sync past which reads go to the primary instead
+REPLICA_MAX_LAG = int(os.getenv("ARXIVY_REPLICA_MAX_LAG", str(26 * 60 * 60)))
+
+# Seconds after which another worker's sync lock is considered abandoned
+SYNC_LOCK_TIMEOUT = 600
+
+# Seconds between checks of another worker's sync lock
+SYNC_LOCK_POLL = 1
+
+# Rows copied per query from the primary
+SYNC_PAGE = 2000
+
+# Tables copied to the replica, with their indexes and the full-text index
+REPLICA_TABLES = ("papers", "related_papers")
+
+
+class Replica:
+    """
+    Read-only copy of the primary's papers in a local SQLite file, shared by
+    the workers on the machine. A sync copies the tables into a new file and
+    swaps it in, and the file's mtime is when it was synced. Reads older than
+    the sync interval start a sync in the background, and reads go to the
+    primary while there is no replica or it lags too far behind, through
+    primary_async when it is given.
+    """
+
+    def __init__(self, path: Optional[str], primary: Database, primary_async: Optional[AsyncDatabase] = None,
+                 sync_interval: int = REPLICA_SYNC_INTERVAL, max_lag: int = REPLICA_MAX_LAG):
+        self.path = path
+        self.primary = primary
+        self.primary_async = primary_async
+        self.sync_interval = sync_interval
+        self.max_lag = max_lag
+        self.local = Database(f"file://{path}", None, upstream="replica") if path else None
+        # Inode and mtime of the file the local client has open
+        self.version = None
+        self.sync_lock = FileLock(path + ".lock", SYNC_LOCK_TIMEOUT) if path else None
+
+    def lag(self) -> Optional[float]:
+        """
+        Returns the seconds since the last sync, or None without a replica
+        """
+        try:
+            return time.time() - os.path.getmtime(self.path)
+        except (OSError, TypeError):
+            return None
+
+    def _readable(self) -> Optional[Database]:
+        """
+        Returns the local database if it is recent enough to read from
+        """
+        if not self.path:
+            return None
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            self.sync_in_background()
+            return None
+        lag = time.time() - stat.st_mtime
+        if lag > self.sync_interval:
+            self.sync_in_background()
+        if lag > self.max_lag:
+            return None
+
+        version = (stat.st_ino, stat.st_mtime_ns)
+        if version != self.version:
+            # A sync swapped the file, read the new one
+            with self.local.lock:
+                self.local.reset()
+            self.version = version
+        return self.local
+
+    @property
+    def concurrent(self) -> bool:
+        """
+        Whether reads go to the async primary now, where gathered statements
+        run at once
+        """
+        if self.primary_async is None:
+            return False
+        lag = self.lag()
+        return lag is None or lag > self.max_lag
+
+    def execute(self, sql: str, args=None):
+        local = self._readable()
+        if local:
+            try:
+                result = local.execute(sql, args)
+                metrics.inc("arxivy_replica_reads_total", {"source": "replica"})
+                return result
+            except Exception:
+                logger.exception("Replica read failed, reading from the primary")
+        metrics.inc("arxivy_replica_reads_total", {"source": "primary"})
+        return (self.primary_async or self.primary).execute(sql, args)
+
+    def gather(self, *statements: Tuple[str, Any], return_exceptions: bool = False) -> List[Any]:
+        """
+        Runs statements concurrently on the async primary, see concurrent
+        """
+        metrics.inc("arxivy_replica_reads_total", {"source": "primary"}, len(statements))
+        return self.primary_async.gather(*statements, return_exceptions=return_exceptions)
+
+    def sync(self) -> bool:
+        """
+        Copies the primary into the replica, returning False if another
+        worker is syncing already
+        """
+        if not self.path or not self.sync_lock.acquire():
+            return False
+        try:
+            with metrics.timer("replica", "sync"):
+                self._copy()
+            return True
+        finally:
+            self.sync_lock.release()
+
+    def sync_in_background(self, wait: float = 0) -> None:
+        """
+        Copies the primary into the replica in a thread. A sync running
+        already is skipped, or with wait, waited for up to wait seconds and
+        followed by a new one, so the copy sees every write made before the
+        call.
+        """
+        if not self.path or (not wait and not self.sync_lock.acquire()):
+            return
+
+        def run():
+            if wait and not self._wait_for_lock(wait):
+                logger.warning(f"Gave up syncing the replica after waiting {wait}s for another sync")
+                return
+            try:
+                with metrics.timer("replica", "sync"):
+                    self._copy()
+            except Exception:
+                logger.exception("Failed syncing the replica")
+            finally:
+                self.sync_lock.release()
+
+        threading.Thread(target=run, name="replica-sync", daemon=True).start()
+
+    def _wait_for_lock(self, wait: float) -> bool:
+        deadline = time.monotonic() + wait
+        while not self.sync_lock.acquire():
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(SYNC_LOCK_POLL)
+        return True
+
+    def _copy(self) -> None:
+        start = time.perf_counter()
+        schema = self.primary.execute("SELECT type, name, tbl_name, sql FROM sqlite_master WHERE sql IS NOT NULL")
+        tables = [row for row in schema if row["type"] == "table" and row["name"] in REPLICA_TABLES]
+        indexes = [row for row in schema if row["type"] == "index" and row["tbl_name"] in REPLICA_TABLES]
+        virtual = [row for row in schema if row["type"] == "table" and row["sql"].upper().startswith("CREATE VIRTUAL")]
+
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        conn = sqlite3.connect(tmp_path)
+        try:
+            rows = 0
+            for table in tables:
+                conn.execute(table["sql"])
+                rows += self._copy_table(conn, table["name"])
+            # Indexes and the full-text index are built once the rows are in
+            for index in indexes:
+                conn.execute(index["sql"])
+            for table in virtual:
+                conn.execute(table["sql"])
+                conn.execute(f"INSERT INTO {table['name']}({table['name']}) VALUES ('rebuild')")
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp_path, self.path)
+        logger.info(f"Synced {rows} rows to the replica in {time.perf_counter() - start:.1f}s")
+
+    def _copy_table(self, conn: sqlite3.Connection, table: str) -> int:
+        last_rowid = -1
+        copied = 0
+        while True:
+            result = self.primary.execute(
+                f"SELECT rowid AS replica_rowid, * FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                [last_rowid, SYNC_PAGE])
+            if not len(result):
+                return copied
+            columns: List[str] = ["rowid"] + list(result.columns[1:])
+            conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                             [row.astuple() for row in result])
+            copied += len(result)
+            last_rowid = result[-1][0]
+
+
+def close_databases() -> None:
+    """
+    Closes the primary's and the replica's clients, which a process must do
+    before it exits, see Database.reset
+    """
+    database.reset()
+    if database_async:
+        database_async.reset()
+    if replica.local:
+        replica.local.reset()
+
+
+replica = Replica(REPLICA_PATH, database, database_async)
+metrics.gauge("arxivy_replica_lag_seconds", replica.lag)
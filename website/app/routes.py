@@ -1,31 +1,97 @@
 import datetime
+import functools
+import hmac
 import os
+from typing import Optional
 
 import pytz
-import libsql_client
-import requests
-from bs4 import BeautifulSoup
-from dotenv import load_dotenv
-from flask import jsonify, redirect, render_template, request, session, url_for
-from supabase import Client, create_client
+from flask import Response, abort, jsonify, redirect, render_template, request, session, url_for
 
 from app import app
-
-load_dotenv()
+from app.arxiv_feed import feed_cache, get_papers
+from app.comments import CommentCache
+from app.db import database
+from app.metrics import metrics
+from app.related import RELATED_SQL, attach_related, related_query
+from app.replica import close_databases, replica
+from app.search import SEARCH_SQL, build_results, fts_query, search_args
+from app.snapshot import snapshots
 
 url: str = os.environ.get("SUPABASE_URL")
 key: str = os.environ.get("SUPABASE_KEY")
-turso_url = os.getenv("TURSO_URL")
-turso_auth_token = os.getenv("TURSO_AUTH_TOKEN")
-supabase: Client = create_client(url, key)
+categories = os.getenv("ARXIV_CATEGORIES", "cs.AI").split(",")
+# Deepest page of the arXiv feed on /, each page is fetched and cached on disk
+MAX_PAGE = 20
+# Most posts the batch comments endpoint accepts per request
+MAX_COMMENT_POSTS = 100
+
+PACIFIC = pytz.timezone("US/Pacific")
+# Papers need more views than this to show up on /twitter
+MIN_VIEWS = 300
+# Days shown per /twitter page by default, and at most
+DAYS_PER_PAGE = 7
+MAX_DAYS_PER_PAGE = 31
+# Papers shown per day on /twitter
+TOP_PER_DAY = 30
+# Cursor for the first /twitter page
+MAX_TIMESTAMP = 2 ** 62
+# Lets ingest ask for a new /twitter snapshot, the hook is off when unset
+SNAPSHOT_TOKEN = os.getenv("ARXIVY_SNAPSHOT_TOKEN")
+# Media types of the /twitter snapshots
+RESPONSE_TYPES = {"twitter.html": "text/html", "twitter.json": "application/json"}
+# Seconds the ingest hook's replica sync waits for a sync running already,
+# which may have started before the new day was written
+SYNC_WAIT = 15 * 60
+
+
+@functools.lru_cache(maxsize=None)
+def get_supabase():
+    """
+    Creates the Supabase client on first use. Importing and building it is a
+    large share of startup, and most requests never need it.
+    """
+    from supabase import create_client
+    return create_client(url, key)
 
 
 @app.route('/')
 def index():
-    category = 'cs.AI'  # to choose a different category
-    xml_data = fetch_arxiv_papers(category)
-    papers = parse_arxiv_papers(xml_data)
-    return render_template('index.html', papers=papers)
+    page = min(max(request.args.get('page', 0, type=int), 0), MAX_PAGE)
+    papers = get_papers(categories, page)
+    try:
+        comments = comment_cache.get_many(paper['id'] for paper in papers)
+    except Exception:
+        app.logger.exception("Failed fetching comments")
+        comments = {}
+    return render_template('index.html', papers=papers, page=page, max_page=MAX_PAGE, comments=comments)
+
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify({"pid": os.getpid(), "arxiv": feed_cache.stats,
+                    "comments": {"hits": comment_cache.hits, "misses": comment_cache.misses}})
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/search')
+def search():
+    query = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 0, type=int), 0)
+    results, has_more = [], False
+    if fts_query(query):
+        try:
+            rows = replica.execute(SEARCH_SQL, search_args(query, page))
+        except Exception:
+            # Say the database predates the full-text index, see migrate_fts.py in twitter_ingest
+            app.logger.exception("Failed searching papers")
+            return render_template('search.html', query=query, results=[], page=page, has_more=False,
+                                   unavailable=True), 503
+        results, has_more = build_results([row.asdict() for row in rows])
+    return render_template('search.html', query=query, results=results, page=page, has_more=has_more)
 
 
 @app.route('/sign_up')
@@ -47,7 +113,8 @@ def logout():
 @app.route('/login', methods=['POST'])
 def login():
     data = request.get_json()
-    result = supabase.auth.sign_in_with_password(data)
+    with metrics.timer("supabase", "sign_in"):
+        result = get_supabase().auth.sign_in_with_password(data)
     if result.user:  # Check if user exists in result
         user_obj = result.user  # Access user object
         user_dict = {
@@ -72,7 +139,8 @@ def login():
 @app.route('/register', methods=['POST'])
 def register():
     data = request.get_json()
-    result = supabase.auth.sign_up(data)
+    with metrics.timer("supabase", "sign_up"):
+        result = get_supabase().auth.sign_up(data)
     if result.user:  # Check if user exists in result
         user_obj = result.user  # Access user object
         user_dict = {
@@ -91,76 +159,221 @@ def register():
 
 @app.route('/comments', methods=['POST'])
 def create_comment():
-    data = request.get_json()
-    result = supabase.table("comments").insert(data).execute()
-    return jsonify(result), 201
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not data.get("post_id") or not data.get("text"):
+        return jsonify({"message": "A comment needs a post_id and a text"}), 400
+    with metrics.timer("supabase", "insert_comment"):
+        result = get_supabase().table("comments").insert(data).execute()
+    comment_cache.invalidate(data["post_id"])
+    return jsonify(result.data), 201
+
+
+@app.route('/comments', methods=['GET'])
+def get_comments_batch():
+    post_ids = [p for p in request.args.get('post_ids', '').split(',') if p]
+    if len(post_ids) > MAX_COMMENT_POSTS:
+        return jsonify({"message": f"At most {MAX_COMMENT_POSTS} post ids per request"}), 400
+    return jsonify(comment_cache.get_many(post_ids))
 
 
-@app.route('/comments/<int:post_id>', methods=['GET'])
+@app.route('/comments/<post_id>', methods=['GET'])
 def get_comments(post_id):
-    result = supabase.table("comments").select().filter(
-        "post_id", "eq", post_id).execute()
-    return jsonify(result)
-
-
-@app.route('/twitter')
-def twitter():
-    days = fetch_twitter_papers()
-    return render_template('twitter.html', days=days)
-
-
-def parse_arxiv_id(link: str):
-    return link.split("/")[-1]
-
-
-def fetch_twitter_papers():
-    days = []
-    with libsql_client.create_client_sync(url=turso_url, auth_token=turso_auth_token) as client:
-        result = client.execute(
-            "SELECT * FROM papers WHERE views > 300 ORDER BY created_at DESC")
-
-        papers = []
-        last_date = ""
-        for row in result:
-            r_dict = row.asdict()
-            d = datetime.datetime.fromtimestamp(int(row["created_at"]) / 1000.0, tz=pytz.timezone("US/Pacific"))
-            r_dict["created_at"] = d
-            papers.append(r_dict)
-            new_date = d.strftime("%Y-%m-%d")
-            if last_date != new_date:
-                papers.sort(key=lambda x: x["views"], reverse=True)
-                day = {
-                    "day": new_date,
-                    "papers": papers
-                }
-                if last_date != "":
-                    papers = []
-                days.append(day)
-
-            last_date = new_date
-
-        papers.sort(key=lambda x: x["views"], reverse=True)
-
-    return days
-
-
-def fetch_arxiv_papers(category: str):
-    url = f'http://export.arxiv.org/api/query?search_query=cat:{category}&sortBy=submittedDate&sortOrder=descending'
-    response = requests.get(url)
-    return response.content
-
-
-def parse_arxiv_papers(xml_data):
-    soup = BeautifulSoup(xml_data, 'lxml')
-    papers = []
-    for entry in soup.find_all('entry'):
-        paper = {
-            'id': parse_arxiv_id(entry.id.text),
-            'title': entry.title.text,
-            'summary': entry.summary.text,
-            'authors': [author.text for author in entry.find_all('name')],
-            'published': entry.published.text,
-            'link': entry.id.text,
-        }
-        papers.append(paper)
-    return papers
+    return jsonify(comment_cache.get(post_id))
+
+
+def fetch_comments(post_ids):
+    with metrics.timer("supabase", "select_comments"):
+        return get_supabase().table("comments").select("*").in_("post_id", post_ids).execute().data
+
+
+comment_cache = CommentCache(fetch_comments)
+
+
+def twitter_args():
+    before = request.args.get('before', type=parse_day)
+    days = min(max(request.args.get('days', DAYS_PER_PAGE, type=int), 1), MAX_DAYS_PER_PAGE)
+    return before, days
+
+
+def render_twitter(feed, next_before, days):
+    return render_template('twitter.html', days=feed, next_before=next_before, page_days=days)
+
+
+def twitter_json(feed, next_before):
+    return app.json.dumps({"days": feed, "next_before": next_before})
+
+
+def export_twitter_snapshots(feed, next_before) -> None:
+    """
+    Renders the first /twitter page, as HTML and JSON, to static snapshots
+    """
+    with app.test_request_context('/twitter'):
+        html = render_twitter(feed, next_before, DAYS_PER_PAGE)
+    snapshots.write("twitter.html", html.encode())
+    snapshots.write("twitter.json", twitter_json(feed, next_before).encode())
+
+
+def serve_twitter(name, mimetype, feed=None, next_before=None):
+    """
+    Serves the first /twitter page from its snapshot, exporting it first from
+    the feed when there is no current snapshot. Other pages are served live.
+    """
+    if request.args:
+        return None
+    if feed is not None:
+        try:
+            export_twitter_snapshots(feed, next_before)
+        except OSError:
+            app.logger.exception("Failed exporting /twitter snapshots")
+    return snapshots.serve(name, mimetype, request)
+
+
+def twitter_response(name, feed, next_before, days):
+    response = serve_twitter(name, RESPONSE_TYPES[name], feed, next_before)
+    if response:
+        return response
+    if name == "twitter.json":
+        return Response(twitter_json(feed, next_before), mimetype=RESPONSE_TYPES[name])
+    return render_twitter(feed, next_before, days)
+
+
+@app.route('/twitter', endpoint='twitter', defaults={'name': 'twitter.html'})
+@app.route('/twitter.json', endpoint='twitter_json', defaults={'name': 'twitter.json'})
+def twitter(name):
+    response = serve_twitter(name, RESPONSE_TYPES[name])
+    if response:
+        return response
+    before, days = twitter_args()
+    return twitter_response(name, *fetch_twitter_papers(before, days), days)
+
+
+@app.route('/twitter/snapshot', methods=['POST'])
+def export_twitter_snapshot_hook():
+    """
+    Called by ingest once it has written a day, so the replica and the
+    snapshots pick it up. The snapshots are exported from the primary, which
+    has the day already, and the replica copy runs after the response, since
+    a full copy can outlast the worker timeout.
+    """
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not SNAPSHOT_TOKEN or not hmac.compare_digest(token, SNAPSHOT_TOKEN):
+        abort(403)
+    export_twitter_snapshots(*fetch_twitter_papers(source=database))
+    replica.sync_in_background(wait=SYNC_WAIT)
+    return jsonify({"exported": ["twitter.html", "twitter.json"]})
+
+
+@app.cli.command('sync-replica')
+def sync_replica_command():
+    """Copy the primary database into the local replica."""
+    try:
+        synced = replica.sync()
+    finally:
+        close_databases()
+    if not synced:
+        raise SystemExit("ARXIVY_REPLICA_PATH is not set or another sync is running")
+
+
+@app.cli.command('export-snapshots')
+def export_snapshots_command():
+    """Export the first /twitter page to static snapshots."""
+    try:
+        export_twitter_snapshots(*fetch_twitter_papers())
+    finally:
+        close_databases()
+
+
+def parse_day(day: str) -> datetime.date:
+    return datetime.datetime.strptime(day, "%Y-%m-%d").date()
+
+
+def day_start_ms(day: datetime.date) -> int:
+    """
+    Milliseconds since epoch of midnight Pacific on day
+    """
+    midnight = PACIFIC.localize(datetime.datetime.combine(day, datetime.time()))
+    return int(midnight.timestamp() * 1000)
+
+
+# Ingest stores one created_at per crawled day, so days are ranked by
+# partitioning on it. The days CTE picks the newest days with papers before
+# the cursor, and the range scan over (created_at, views) only touches them.
+TWITTER_FEED_SQL = """
+WITH days AS (
+    SELECT DISTINCT created_at FROM papers
+    WHERE created_at < :before AND views > :min_views
+    ORDER BY created_at DESC
+    LIMIT :days
+)
+SELECT user, paper_link, views, abstract, authors, title, created_at FROM (
+    SELECT user, paper_link, views, abstract, authors, title, created_at,
+           ROW_NUMBER() OVER (PARTITION BY created_at ORDER BY views DESC) AS rank
+    FROM papers
+    WHERE created_at >= (SELECT MIN(created_at) FROM days) AND created_at < :before AND views > :min_views
+)
+WHERE rank <= :top
+ORDER BY created_at DESC, views DESC
+"""
+
+# Related papers of the feed's papers, found by the query itself, so it runs
+# at the same time as the feed query when they are gathered
+RELATED_FEED_SQL = RELATED_SQL.format(links=f"SELECT paper_link FROM ({TWITTER_FEED_SQL})")
+
+
+def fetch_twitter_papers(before: Optional[datetime.date] = None, days: int = DAYS_PER_PAGE, top: int = TOP_PER_DAY,
+                         source=replica):
+    """
+    Returns up to `days` days with papers before the `before` date, each with
+    its `top` most viewed papers and their related papers, and the cursor for
+    the next page. Reads the replica unless given another source. A source
+    running statements concurrently gets both queries at once, otherwise the
+    related papers are looked up by the feed's links.
+    """
+    args = twitter_feed_args(before, days, top)
+    related = None
+    if source.concurrent:
+        result, related = source.gather((TWITTER_FEED_SQL, args), (RELATED_FEED_SQL, args), return_exceptions=True)
+        if isinstance(result, Exception):
+            raise result
+    else:
+        result = source.execute(TWITTER_FEED_SQL, args)
+    feed, next_before = build_twitter_feed(result, days)
+    try:
+        if related is None:
+            related = source.execute(*related_query(feed))
+        elif isinstance(related, Exception):
+            raise related
+        attach_related(feed, related)
+    except Exception:
+        # Related papers are optional, say ingest has not built them yet
+        app.logger.exception("Failed fetching related papers")
+        attach_related(feed, [])
+    return feed, next_before
+
+
+def twitter_feed_args(before: Optional[datetime.date], days: int, top: int = TOP_PER_DAY):
+    return {
+        "before": day_start_ms(before) if before else MAX_TIMESTAMP,
+        "min_views": MIN_VIEWS,
+        "days": days,
+        "top": top,
+    }
+
+
+def build_twitter_feed(result, days: int):
+    """
+    Groups feed rows into days, returning the days and the next page cursor
+    """
+    feed = []
+    last_created_at = None
+    for row in result:
+        paper = row.asdict()
+        if row["created_at"] != last_created_at:
+            last_created_at = row["created_at"]
+            created_at = datetime.datetime.fromtimestamp(int(last_created_at) / 1000.0, tz=PACIFIC)
+            feed.append({"day": created_at.strftime("%Y-%m-%d"), "papers": []})
+        paper["created_at"] = created_at
+        feed[-1]["papers"].append(paper)
+
+    next_before = feed[-1]["day"] if len(feed) == days else None
+    return feed, next_before
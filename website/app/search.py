@@ -0,0 +1,62 @@
+from typing import Dict, List, Tuple
+
+from markupsafe import Markup, escape
+
+# Results per search page
+SEARCH_PAGE_SIZE = 20
+
+# Marks matches in snippets, replaced with <mark> after escaping
+MATCH_START = '\x02'
+MATCH_END = '\x03'
+
+# Newest matches ranked per search. BM25 scores every row it ranks, so
+# ranking all matches of a common term grows with the table.
+SEARCH_CANDIDATES = 2000
+
+# Ranks the newest matches with BM25, weighting title matches over authors
+# over abstract. The bound is the rowid of the oldest candidate, found by
+# walking the index newest first, and joined in first so FTS5 only visits
+# rows past it.
+SEARCH_SQL = f"""
+SELECT papers.user, papers.paper_link, papers.views, papers.title, papers.authors, papers.created_at,
+       snippet(papers_fts, 1, '{MATCH_START}', '{MATCH_END}', '…', 32) AS snippet
+FROM (
+    SELECT min(rowid) AS oldest FROM (
+        SELECT rowid FROM papers_fts WHERE papers_fts MATCH :query ORDER BY rowid DESC LIMIT :candidates
+    )
+) AS bound
+CROSS JOIN papers_fts
+JOIN papers ON papers.rowid = papers_fts.rowid
+WHERE papers_fts MATCH :query AND papers_fts.rowid >= bound.oldest
+ORDER BY bm25(papers_fts, 10.0, 1.0, 5.0)
+LIMIT :limit OFFSET :offset
+"""
+
+
+def fts_query(query: str) -> str:
+    """
+    Turns user input into an FTS5 query matching all terms, quoting each so
+    FTS5 operators and punctuation are matched literally
+    """
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+def highlight(snippet: str) -> Markup:
+    return Markup(str(escape(snippet)).replace(MATCH_START, "<mark>").replace(MATCH_END, "</mark>"))
+
+
+def search_args(query: str, page: int) -> Dict:
+    # Fetch one extra row to know whether there is a next page
+    return {"query": fts_query(query), "limit": SEARCH_PAGE_SIZE + 1, "offset": page * SEARCH_PAGE_SIZE,
+            "candidates": SEARCH_CANDIDATES}
+
+
+def build_results(rows: List[Dict]) -> Tuple[List[Dict], bool]:
+    """
+    Returns a page of results with highlighted snippets, and whether there is
+    a next page
+    """
+    results = rows[:SEARCH_PAGE_SIZE]
+    for result in results:
+        result["snippet"] = highlight(result["snippet"])
+    return results, len(rows) > SEARCH_PAGE_SIZE
@@ -0,0 +1,143 @@
+import glob
+import gzip
+import hashlib
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from flask import Request, Response
+
+from app.files import write_atomic
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Shared by all gunicorn workers on the machine
+SNAPSHOT_DIR = os.getenv("ARXIVY_SNAPSHOT_DIR", "/tmp/arxivy_snapshots")
+
+# Seconds a snapshot is served without a new export. Ingest exports once a
+# day, so this only matters when its export hook failed.
+SNAPSHOT_MAX_AGE = int(os.getenv("ARXIVY_SNAPSHOT_MAX_AGE", str(26 * 60 * 60)))
+
+# Content codings stored next to each snapshot, in order of preference
+ENCODINGS = ("br", "gzip")
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=11)
+    return gzip.compress(body, compresslevel=9, mtime=0)
+
+
+class SnapshotStore:
+    """
+    Pre-rendered responses on disk, each kept uncompressed and precompressed
+    with every available coding. A snapshot is written as a new version
+    named by its content hash, and a pointer file is swapped in last, so
+    workers never serve a mix of two exports. Versions are cached in memory
+    by hash, and serving one only reads the pointer.
+    """
+
+    def __init__(self, snapshot_dir: str = SNAPSHOT_DIR, max_age: int = SNAPSHOT_MAX_AGE):
+        self.snapshot_dir = snapshot_dir
+        self.max_age = max_age
+        os.makedirs(snapshot_dir, exist_ok=True)
+        # Per snapshot name: the version hash and its body per coding
+        self.memory: Dict[str, Tuple[str, Dict[str, bytes]]] = {}
+
+    def _pointer_path(self, name: str) -> str:
+        return os.path.join(self.snapshot_dir, f"{name}.current")
+
+    def _version_path(self, name: str, digest: str, encoding: Optional[str] = None) -> str:
+        suffix = f".{encoding}" if encoding else ""
+        return os.path.join(self.snapshot_dir, f"{name}.{digest}{suffix}")
+
+    def write(self, name: str, body: bytes) -> str:
+        """
+        Stores a new version of a snapshot, returning its content hash
+        """
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        write_atomic(self._version_path(name, digest), body)
+        for encoding in self.encodings():
+            write_atomic(self._version_path(name, digest, encoding), compress(body, encoding))
+        write_atomic(self._pointer_path(name), digest.encode())
+
+        for path in glob.glob(os.path.join(self.snapshot_dir, f"{name}.*")):
+            if not path.endswith(".current") and f".{digest}" not in path:
+                os.remove(path)
+        logger.info(f"Exported {name} snapshot {digest} of {len(body)} bytes")
+        return digest
+
+    @staticmethod
+    def encodings():
+        return [encoding for encoding in ENCODINGS if encoding != "br" or brotli]
+
+    def _current(self, name: str) -> Optional[str]:
+        """
+        Returns the hash of the current version, if it is recent enough
+        """
+        try:
+            with open(self._pointer_path(name)) as f:
+                digest = f.read().strip()
+            age = time.time() - os.path.getmtime(self._pointer_path(name))
+        except OSError:
+            return None
+        return digest if age < self.max_age else None
+
+    def _load(self, name: str, digest: str) -> Optional[Dict[str, bytes]]:
+        cached = self.memory.get(name)
+        if cached and cached[0] == digest:
+            return cached[1]
+        bodies = {}
+        try:
+            with open(self._version_path(name, digest), "rb") as f:
+                bodies["identity"] = f.read()
+        except OSError:
+            # Replaced by a newer export since the pointer was read
+            return None
+        for encoding in self.encodings():
+            try:
+                with open(self._version_path(name, digest, encoding), "rb") as f:
+                    bodies[encoding] = f.read()
+            except OSError:
+                pass
+        self.memory[name] = (digest, bodies)
+        return bodies
+
+    def warm(self, names: List[str]) -> None:
+        """
+        Loads the current version of each snapshot into memory
+        """
+        for name in names:
+            digest = self._current(name)
+            if digest:
+                self._load(name, digest)
+
+    def serve(self, name: str, mimetype: str, request: Request) -> Optional[Response]:
+        """
+        Returns the snapshot in the best coding the client accepts, with a
+        strong ETag per coding and a 304 when the client's copy is current.
+        Returns None when there is no current snapshot.
+        """
+        digest = self._current(name)
+        bodies = self._load(name, digest) if digest else None
+        if not bodies:
+            return None
+
+        encoding = next((encoding for encoding in self.encodings()
+                         if encoding in bodies and encoding in request.accept_encodings), "identity")
+        response = Response(bodies[encoding], mimetype=mimetype)
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+        response.set_etag(digest if encoding == "identity" else f"{digest}-{encoding}")
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+
+snapshots = SnapshotStore()
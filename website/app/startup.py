@@ -0,0 +1,22 @@
+import logging
+import time
+
+from app.arxiv_feed import feed_cache
+from app.routes import RESPONSE_TYPES
+from app.snapshot import snapshots
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up() -> None:
+    """
+    Loads the feed cache and the /twitter snapshots from disk. Run in the
+    gunicorn master before it forks, so every worker starts with them in
+    memory and the first requests after a cold start are served from them,
+    stale or not, instead of waiting on arXiv and Turso.
+    """
+    start = time.perf_counter()
+    entries = feed_cache.warm()
+    snapshots.warm(list(RESPONSE_TYPES))
+    logger.info(f"Warmed {entries} feed cache entries and the snapshots in "
+                f"{(time.perf_counter() - start) * 1000:.0f} ms")
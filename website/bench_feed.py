@@ -0,0 +1,84 @@
+"""
+Compares the streaming Atom parser against the BeautifulSoup parser on a
+large feed, reporting parse time and peak memory.
+
+    python bench_feed.py [recorded_feed.xml] [--entries 20000]
+"""
+import argparse
+import gc
+import tracemalloc
+from time import perf_counter
+
+from bs4 import BeautifulSoup
+
+from app.arxiv_feed import parse_arxiv_id, parse_feed
+
+
+def parse_with_soup(xml_data):
+    soup = BeautifulSoup(xml_data, 'lxml')
+    papers = []
+    for entry in soup.find_all('entry'):
+        paper = {
+            'id': parse_arxiv_id(entry.id.text),
+            'title': entry.title.text,
+            'summary': entry.summary.text,
+            'authors': [author.text for author in entry.find_all('name')],
+            'published': entry.published.text,
+            'link': entry.id.text,
+        }
+        papers.append(paper)
+    return papers
+
+
+def synthetic_feed(entries: int) -> bytes:
+    entry = '''<entry>
+    <id>http://arxiv.org/abs/2308.{i:05d}v1</id>
+    <updated>2023-08-24T17:59:59Z</updated>
+    <published>2023-08-24T17:59:59Z</published>
+    <title>A Study of Large Language Models, Part {i}</title>
+    <summary>{summary}</summary>
+    <author><name>Ada Lovelace</name></author>
+    <author><name>Alan Turing</name></author>
+    <author><name>Grace Hopper</name></author>
+    <link href="http://arxiv.org/abs/2308.{i:05d}v1" rel="alternate" type="text/html"/>
+    <category term="cs.AI" scheme="http://arxiv.org/schemas/atom"/>
+  </entry>'''
+    summary = 'We study how language models behave when scaled. ' * 30
+    body = '\n  '.join(entry.format(i=i, summary=summary) for i in range(entries))
+    return f'''<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <title type="html">ArXiv Query</title>
+  {body}
+</feed>'''.encode('utf-8')
+
+
+def measure(name: str, parse, xml_data: bytes) -> None:
+    gc.collect()
+    tracemalloc.start()
+    start = perf_counter()
+    papers = parse(xml_data)
+    elapsed = perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{name:<14} {len(papers):>7} papers  {elapsed * 1000:10.1f} ms  peak {peak / 2 ** 20:8.1f} MiB')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('feed', nargs='?', help='recorded Atom feed, a synthetic one is generated otherwise')
+    parser.add_argument('--entries', type=int, default=20000)
+    args = parser.parse_args()
+
+    if args.feed:
+        with open(args.feed, 'rb') as f:
+            xml_data = f.read()
+    else:
+        xml_data = synthetic_feed(args.entries)
+    print(f'Feed size {len(xml_data) / 2 ** 20:.1f} MiB')
+
+    measure('iterparse', parse_feed, xml_data)
+    measure('beautifulsoup', parse_with_soup, xml_data)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Measures /search query latency on a local SQLite copy of the schema as the
+papers table grows.
+
+    python bench_search.py --sizes 10000,50000,150000
+"""
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+from time import perf_counter
+
+from app.search import SEARCH_SQL, search_args
+
+SCHEMA = os.path.join(os.path.dirname(__file__), "..", "twitter_ingest", "schema.sql")
+# Common words of paper titles and abstracts, the head of the vocabulary
+COMMON = ("language model transformer attention diffusion reinforcement learning agent benchmark retrieval "
+          "alignment reasoning vision multimodal instruction tuning scaling sparse mixture experts quantization "
+          "inference latency memory graph neural robust evaluation dataset synthetic prompt chain thought").split()
+# Words in the vocabulary, most of them rare like real technical terms
+VOCABULARY = 50000
+# Exponent of the Zipf distribution word frequencies follow in text
+ZIPF_S = 1.1
+QUERIES = ["model", "transformer", "diffusion model", "mixture experts", "chain thought reasoning",
+           "quantization latency", "term4000", "term20000 term300"]
+
+
+def zipf_words(rng: random.Random):
+    """
+    Returns a sampler of words whose frequencies follow Zipf's law, so common
+    terms match most papers and rare ones a handful, as in real abstracts
+    """
+    words = COMMON + [f"term{i}" for i in range(len(COMMON), VOCABULARY)]
+    weights = list(itertools.accumulate(1 / rank ** ZIPF_S for rank in range(1, len(words) + 1)))
+    rng.shuffle(words[:len(COMMON)])
+    return lambda k: " ".join(rng.choices(words, cum_weights=weights, k=k))
+
+
+def add_papers(conn: sqlite3.Connection, start: int, count: int) -> None:
+    rng = random.Random(start)
+    sample = zipf_words(rng)
+    conn.executemany(
+        "INSERT INTO papers (user, profile_image, paper_link, views, source, abstract, authors, title, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        ((f"user{i}", "", f"https://arxiv.org/abs/{i}", rng.randint(0, 5000), "arxiv.org",
+          sample(150), "A. Author, B. Author", sample(8), 0)
+         for i in range(start, start + count)))
+    conn.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,50000,150000")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(os.path.join(tempfile.mkdtemp(), "papers.db"))
+    conn.row_factory = sqlite3.Row
+    with open(SCHEMA) as f:
+        conn.executescript(f.read())
+
+    rows = 0
+    for size in (int(s) for s in args.sizes.split(",")):
+        add_papers(conn, rows, size - rows)
+        rows = size
+        for query in QUERIES:
+            times = []
+            for _ in range(args.rounds):
+                start = perf_counter()
+                conn.execute(SEARCH_SQL, search_args(query, 0)).fetchall()
+                times.append(perf_counter() - start)
+            matches = conn.execute("SELECT count(*) FROM papers_fts WHERE papers_fts MATCH ?",
+                                   [search_args(query, 0)["query"]]).fetchone()[0]
+            print(f"{rows:>8} papers  {query!r:<26} {matches:>7} matches  median {statistics.median(times) * 1000:8.2f} ms  "
+                  f"p95 {sorted(times)[int(len(times) * 0.95) - 1] * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Measures cold start: how long importing the app takes, compared with
+importing the clients it now defers, and the time from launching gunicorn to
+the first byte of /twitter. The first byte is timed with the old command
+line, with the preloading config, and with the config once a snapshot is on
+disk, against a local SQLite stand-in for Turso.
+
+    python bench_startup.py --runs 5
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from statistics import median
+
+from bench_twitter import create_database
+
+IMPORT_APP = "import time; start = time.perf_counter(); import app; {extra}print(time.perf_counter() - start)"
+
+# The clients routes.py used to create at import time
+EAGER_IMPORTS = "import libsql_client, lxml.etree, requests, supabase; "
+
+
+def import_seconds(env, extra: str = "") -> float:
+    output = subprocess.check_output([sys.executable, "-c", IMPORT_APP.format(extra=extra)], env=env)
+    return float(output.decode().split()[-1])
+
+
+def first_byte_seconds(env, args, port: int) -> float:
+    start = time.perf_counter()
+    server = subprocess.Popen(["gunicorn", "--bind", f"127.0.0.1:{port}", *args, "app:app"], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/twitter", timeout=5) as response:
+                    response.read(1)
+                return time.perf_counter() - start
+            except OSError:
+                if server.poll() is not None:
+                    raise RuntimeError("gunicorn exited")
+                time.sleep(0.005)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--papers", type=int, default=5000)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "papers.db")
+    create_database(path, args.papers)
+    env = {**os.environ, "TURSO_URL": f"file://{path}", "ARXIVY_METRICS_DIR": tempfile.mkdtemp(),
+           "ARXIVY_CACHE_DIR": tempfile.mkdtemp()}
+    env.setdefault("SUPABASE_URL", "https://example.supabase.co")
+    env.setdefault("SUPABASE_KEY", "anon.key.unused")
+
+    imports = [import_seconds(env) for _ in range(args.runs)]
+    eager = [import_seconds(env, EAGER_IMPORTS) for _ in range(args.runs)]
+    print(f"import app:                    {median(imports) * 1000:8.1f} ms")
+    print(f"import app and its clients:    {median(eager) * 1000:8.1f} ms")
+
+    # A machine whose volume kept the snapshot exported before it stopped
+    snapshot_dir = tempfile.mkdtemp()
+    subprocess.check_call(["flask", "--app", "app", "export-snapshots"], env={**env, "ARXIVY_SNAPSHOT_DIR": snapshot_dir},
+                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    cases = [("-w 4, no snapshot", ["-w", "4"], None),
+             ("config, no snapshot", ["-c", "gunicorn.conf.py"], None),
+             ("config, snapshot on disk", ["-c", "gunicorn.conf.py"], snapshot_dir)]
+    for name, gunicorn_args, directory in cases:
+        timings = []
+        for _ in range(args.runs):
+            run_env = {**env, "ARXIVY_SNAPSHOT_DIR": directory or tempfile.mkdtemp()}
+            timings.append(first_byte_seconds(run_env, gunicorn_args, args.port))
+        print(f"first byte, {name + ':':<25} {median(timings) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Measures requests/sec on /twitter against a local SQLite stand-in for
+Turso, reconnecting per request (the old behaviour), with the shared
+per-worker client, and from the exported snapshot. Then compares the sync
+client with the async mode (ARXIVY_ASYNC_DB) for requests served by several
+threads of one worker, with a simulated round trip per query.
+
+    python bench_twitter.py --papers 20000 --requests 200 --latency 0.03 --threads 8
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+SCHEMA = os.path.join(os.path.dirname(__file__), "..", "twitter_ingest", "schema.sql")
+DAY_MS = 24 * 60 * 60 * 1000
+
+
+def create_database(path: str, papers: int) -> None:
+    conn = sqlite3.connect(path)
+    with open(SCHEMA) as f:
+        conn.executescript(f.read())
+    start = 1690848000000  # 2023-08-01
+    conn.executemany(
+        "INSERT INTO papers (user, profile_image, paper_link, views, source, abstract, authors, title, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+        (f"user{i}", "https://pbs.twimg.com/profile_images/x.jpg", f"https://arxiv.org/abs/2308.{i:05d}",
+         random.randint(0, 5000), "arxiv.org", "Abstract " * 100, "A. Author, B. Author", f"Paper {i}",
+         start + (i % 365) * DAY_MS)
+        for i in range(papers)])
+    conn.commit()
+    conn.close()
+
+
+def run(client, database, requests: int, reconnect: bool, url: str = "/twitter?days=7", headers=None,
+        status: int = 200) -> float:
+    start = perf_counter()
+    for _ in range(requests):
+        if reconnect:
+            database.reset()
+        response = client.get(url, headers=headers)
+        assert response.status_code == status, response.status_code
+    return requests / (perf_counter() - start)
+
+
+def run_threads(client, threads: int, requests: int, url: str = "/twitter?days=7") -> float:
+    def get(_):
+        assert client.get(url).status_code == 200
+
+    start = perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(get, range(requests)))
+    return requests / (perf_counter() - start)
+
+
+def simulate_latency(latency: float) -> None:
+    """
+    Delays every query of the libsql clients on a file url, inside the
+    client, like a round trip to Turso
+    """
+    from libsql_client.sqlite3 import Sqlite3Client
+    execute = Sqlite3Client.execute
+
+    async def remote_execute(self, stmt, args=None):
+        await asyncio.sleep(latency)
+        return await execute(self, stmt, args)
+
+    Sqlite3Client.execute = remote_execute
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--papers", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.03, help="simulated seconds per query round trip")
+    parser.add_argument("--threads", type=int, default=8, help="threads of the worker serving requests")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "papers.db")
+    create_database(path, args.papers)
+    os.environ["TURSO_URL"] = f"file://{path}"
+    os.environ["ARXIVY_SNAPSHOT_DIR"] = tempfile.mkdtemp()
+
+    from app import app
+    from app.db import AsyncDatabase, database
+    from app.replica import close_databases, replica
+
+    client = app.test_client()
+    client.get("/twitter?days=7")
+    print(f"reconnect per request: {run(client, database, args.requests, True):8.1f} req/s")
+    print(f"shared client:         {run(client, database, args.requests, False):8.1f} req/s")
+
+    # The ETag is per coding, so revalidation has to accept the same one
+    accept = {"Accept-Encoding": "br, gzip"}
+    etag = client.get("/twitter", headers=accept).headers["ETag"]
+    print(f"snapshot:              {run(client, database, args.requests, False, '/twitter'):8.1f} req/s")
+    print(f"snapshot, brotli:      "
+          f"{run(client, database, args.requests, False, '/twitter', {'Accept-Encoding': 'br'}):8.1f} req/s")
+    print(f"snapshot, 304:         "
+          f"{run(client, database, args.requests, False, '/twitter', {**accept, 'If-None-Match': etag}, 304):8.1f} req/s")
+
+    # The sync client runs one query at a time, the async one all of them
+    simulate_latency(args.latency)
+    requests = max(args.requests // 4, args.threads)
+    print(f"sync client, 1 thread:  {run(client, database, requests, False):8.1f} req/s")
+    print(f"sync client, {args.threads} threads: {run_threads(client, args.threads, requests):8.1f} req/s")
+    replica.primary_async = AsyncDatabase(os.environ["TURSO_URL"], None)
+    print(f"async mode, 1 thread:   {run(client, database, requests, False):8.1f} req/s")
+    print(f"async mode, {args.threads} threads:  {run_threads(client, args.threads, requests):8.1f} req/s")
+    replica.primary_async.reset()
+    close_databases()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+import os
+
+bind = "0.0.0.0:8080"
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+
+# Import the app once in the master and fork the workers from it, so they
+# share its memory and start serving without importing anything
+preload_app = True
+
+if os.getenv("ARXIVY_ASYNC_DB") == "1":
+    # Requests wait on the worker's async database client, which runs their
+    # queries concurrently, so one worker serves many of them with threads
+    worker_class = "gthread"
+    threads = int(os.getenv("WEB_THREADS", "16"))
+
+
+def on_starting(server):
+    # The app is loaded by now, and the socket is not listening yet
+    from app.startup import warm_up
+    warm_up()
+
+
+def worker_exit(server, worker):
+    # The database clients keep the worker from exiting until they are closed
+    from app.replica import close_databases
+    close_databases()
@@ -0,0 +1,20 @@
+import os
+import sys
+import tempfile
+
+# Importing app.* starts the Flask app, which reads its settings from the
+# environment and keeps caches, metrics and snapshots on disk
+_tmp = tempfile.mkdtemp(prefix="arxivy_tests_")
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "anon.key.unused")
+os.environ.setdefault("TURSO_URL", f"file://{os.path.join(_tmp, 'papers.db')}")
+for name in ("CACHE", "METRICS", "SNAPSHOT"):
+    os.environ.setdefault(f"ARXIVY_{name}_DIR", os.path.join(_tmp, name.lower()))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def pytest_sessionfinish(session, exitstatus):
+    # The database clients keep the process alive until they are closed
+    if "app.replica" in sys.modules:
+        sys.modules["app.replica"].close_databases()
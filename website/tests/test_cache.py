@@ -0,0 +1,47 @@
+import threading
+import time
+
+from app.cache import FeedCache, Validators
+
+
+def test_stale_entries_are_served_while_revalidating(tmp_path):
+    calls = []
+
+    def fetch(key, validators):
+        calls.append(validators.etag)
+        return None if validators.etag else ("value", Validators(etag='"v1"'))
+
+    cache = FeedCache("feed", fetch, ttl=0.2, cache_dir=str(tmp_path))
+    assert cache.get("page") == "value"
+    assert cache.get("page") == "value"
+    assert calls == [None]
+
+    time.sleep(0.25)
+    assert cache.get("page") == "value"
+    for _ in range(50):
+        if len(calls) == 2 and not cache.refresh_locks["page"].held:
+            break
+        time.sleep(0.01)
+    # Revalidated with a conditional GET, which found the value current
+    assert calls == [None, '"v1"']
+    assert cache.stats["not_modified"] == 1
+
+
+def test_cold_miss_is_fetched_once_across_workers(tmp_path):
+    calls = []
+
+    def fetch(key, validators):
+        calls.append(key)
+        time.sleep(0.3)
+        return f"{key} value", Validators()
+
+    # Each worker has its own cache in memory and shares the disk tier
+    workers = [FeedCache("feed", fetch, cache_dir=str(tmp_path)) for _ in range(4)]
+    values = []
+    threads = [threading.Thread(target=lambda cache=cache: values.append(cache.get("page"))) for cache in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert values == ["page value"] * 4
+    assert calls == ["page"]
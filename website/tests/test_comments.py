@@ -0,0 +1,53 @@
+from app.comments import CommentCache
+
+
+class Fetcher:
+    def __init__(self, comments):
+        self.comments = comments
+        self.calls = []
+
+    def __call__(self, post_ids):
+        self.calls.append(sorted(post_ids))
+        return [comment for comment in self.comments if comment["post_id"] in post_ids]
+
+
+def test_misses_are_fetched_in_one_query():
+    fetch = Fetcher([{"post_id": "1", "text": "a"}, {"post_id": "1", "text": "b"}, {"post_id": "2", "text": "c"}])
+    cache = CommentCache(fetch)
+    comments = cache.get_many(["1", "2", "3", "1"])
+    assert [c["text"] for c in comments["1"]] == ["a", "b"]
+    assert comments["3"] == []
+    assert fetch.calls == [["1", "2", "3"]]
+
+    # Posts without comments are cached too
+    assert cache.get("3") == []
+    assert cache.get_many(["2", "4"])["2"] == [{"post_id": "2", "text": "c"}]
+    assert fetch.calls == [["1", "2", "3"], ["4"]]
+    assert (cache.hits, cache.misses) == (2, 4)
+
+
+def test_entries_expire_and_invalidate():
+    fetch = Fetcher([{"post_id": "1", "text": "a"}])
+    cache = CommentCache(fetch, ttl=0)
+    cache.get("1")
+    cache.get("1")
+    assert len(fetch.calls) == 2
+
+    cache = CommentCache(fetch)
+    cache.get("1")
+    fetch.comments.append({"post_id": "1", "text": "b"})
+    cache.invalidate(1)
+    assert [c["text"] for c in cache.get("1")] == ["a", "b"]
+
+
+def test_invalidation_reaches_every_worker(tmp_path):
+    fetch = Fetcher([{"post_id": "1", "text": "a"}])
+    workers = [CommentCache(fetch, cache_dir=str(tmp_path)) for _ in range(2)]
+    for cache in workers:
+        cache.get("1")
+    fetch.comments.append({"post_id": "1", "text": "b"})
+    workers[0].invalidate("1")
+    # The other worker fetches the post again, and then caches it
+    assert [c["text"] for c in workers[1].get("1")] == ["a", "b"]
+    workers[1].get("1")
+    assert len(fetch.calls) == 3
@@ -0,0 +1,67 @@
+import asyncio
+import os
+import sqlite3
+import time
+
+import pytest
+from libsql_client.sqlite3 import Sqlite3Client
+
+from app.db import AsyncDatabase, Database
+from app.routes import fetch_twitter_papers
+
+SCHEMA = os.path.join(os.path.dirname(__file__), "..", "..", "twitter_ingest", "schema.sql")
+DAY_MS = 24 * 60 * 60 * 1000
+
+
+@pytest.fixture
+def url(tmp_path):
+    path = str(tmp_path / "papers.db")
+    conn = sqlite3.connect(path)
+    with open(SCHEMA) as f:
+        conn.executescript(f.read())
+    conn.executemany(
+        "INSERT INTO papers (user, paper_link, views, source, abstract, authors, title, created_at) "
+        "VALUES ('ada', ?, ?, 'arxiv.org', '', 'Ada Lovelace', ?, ?)",
+        [(f"https://arxiv.org/abs/2308.{i:05d}", 1000 + i, f"Paper {i}", 1690848000000 + (i % 3) * DAY_MS)
+         for i in range(9)])
+    conn.executemany("INSERT INTO related_papers VALUES (?, 0, ?, 0.5)",
+                     [(f"https://arxiv.org/abs/2308.{i:05d}", f"https://arxiv.org/abs/2308.{(i + 1) % 9:05d}")
+                      for i in range(9)])
+    conn.commit()
+    conn.close()
+    return f"file://{path}"
+
+
+def test_async_database_runs_statements_concurrently(url, monkeypatch):
+    execute = Sqlite3Client.execute
+
+    async def remote_execute(self, stmt, args=None):
+        await asyncio.sleep(0.2)
+        return await execute(self, stmt, args)
+
+    monkeypatch.setattr(Sqlite3Client, "execute", remote_execute)
+    database = AsyncDatabase(url, None)
+    try:
+        start = time.perf_counter()
+        counts, missing = database.gather(("SELECT count(*) FROM papers", None), ("SELECT * FROM missing", None),
+                                          return_exceptions=True)
+        assert time.perf_counter() - start < 0.35
+        assert counts[0][0] == 9
+        assert isinstance(missing, Exception)
+        assert database.execute("SELECT count(*) FROM related_papers")[0][0] == 9
+        assert database.connects == 1
+    finally:
+        database.reset()
+
+
+def test_twitter_feed_is_the_same_from_the_async_client(url):
+    database, database_async = Database(url, None), AsyncDatabase(url, None)
+    try:
+        feed, next_before = fetch_twitter_papers(days=2, source=database)
+        assert fetch_twitter_papers(days=2, source=database_async) == (feed, next_before)
+    finally:
+        database.reset()
+        database_async.reset()
+    assert [len(day["papers"]) for day in feed] == [3, 3]
+    assert next_before == feed[-1]["day"]
+    assert feed[0]["papers"][0]["related"] == [{"paper_link": "https://arxiv.org/abs/2308.00000", "title": "Paper 0"}]
@@ -0,0 +1,32 @@
+import os
+import time
+
+from app.files import FileLock, write_atomic
+
+
+def test_write_atomic_leaves_no_temporary_files(tmp_path):
+    path = str(tmp_path / "entry.json")
+    write_atomic(path, "{}")
+    write_atomic(path, b"[]")
+    with open(path) as f:
+        assert f.read() == "[]"
+    assert os.listdir(tmp_path) == ["entry.json"]
+
+
+def test_file_lock_is_shared_by_workers(tmp_path):
+    path = str(tmp_path / "sync.lock")
+    # One lock per worker process, on the same lock file
+    first, second = FileLock(path, timeout=60), FileLock(path, timeout=60)
+    assert first.acquire()
+    assert not first.acquire()
+    assert not second.acquire()
+    first.release()
+    assert second.acquire()
+
+
+def test_abandoned_file_lock_is_taken_over(tmp_path):
+    path = str(tmp_path / "sync.lock")
+    assert FileLock(path, timeout=60).acquire()
+    old = time.time() - 120
+    os.utime(path, (old, old))
+    assert FileLock(path, timeout=60).acquire()
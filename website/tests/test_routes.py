@@ -0,0 +1,72 @@
+import pytest
+
+from app import app, routes
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+@pytest.fixture
+def feed(monkeypatch):
+    pages = []
+
+    def get_papers(categories, page):
+        pages.append(page)
+        return [{"id": "2308.00001", "title": "Scaling Laws", "summary": "", "authors": ["Ada Lovelace"],
+                 "published": "2023-08-01T00:00:00Z", "link": "http://arxiv.org/abs/2308.00001v1"}]
+
+    monkeypatch.setattr(routes, "get_papers", get_papers)
+    monkeypatch.setattr(routes.comment_cache, "get_many", lambda post_ids: {})
+    return pages
+
+
+def test_index_pages_are_capped(client, feed):
+    response = client.get("/?page=3")
+    assert b"page=4" in response.data
+    response = client.get("/?page=100000")
+    assert response.status_code == 200
+    assert feed == [3, routes.MAX_PAGE]
+    assert f"page={routes.MAX_PAGE + 1}".encode() not in response.data
+
+
+def test_embedded_comments_show_their_text(client, feed, monkeypatch):
+    monkeypatch.setattr(routes.comment_cache, "get_many",
+                        lambda post_ids: {"2308.00001": [{"post_id": "2308.00001", "text": "Great read"}]})
+    assert b"<li>Great read</li>" in client.get("/").data
+
+
+def test_comment_without_post_id_is_rejected(client, monkeypatch):
+    def get_supabase():
+        raise AssertionError("nothing should be inserted")
+
+    monkeypatch.setattr(routes, "get_supabase", get_supabase)
+    assert client.post("/comments", json={"text": "Great read"}).status_code == 400
+    assert client.post("/comments", json={"post_id": "2308.00001"}).status_code == 400
+    assert client.post("/comments", data="not json").status_code == 400
+
+
+def test_search_without_full_text_index(client):
+    # The test database has no papers_fts, like one created before it
+    response = client.get("/search?q=transformers")
+    assert response.status_code == 503
+    assert b"Search is unavailable" in response.data
+    assert client.get("/search").status_code == 200
+
+
+def test_snapshot_hook_exports_from_the_primary(client, monkeypatch):
+    sources, syncs = [], []
+
+    def fetch_twitter_papers(source):
+        sources.append(source)
+        return [], None
+
+    monkeypatch.setattr(routes, "SNAPSHOT_TOKEN", "secret")
+    monkeypatch.setattr(routes, "fetch_twitter_papers", fetch_twitter_papers)
+    monkeypatch.setattr(routes.replica, "sync_in_background", lambda wait: syncs.append(wait))
+    assert client.post("/twitter/snapshot").status_code == 403
+    response = client.post("/twitter/snapshot", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    assert sources == [routes.database]
+    assert syncs == [routes.SYNC_WAIT]
@@ -0,0 +1,33 @@
+from flask import Flask
+
+from app.snapshot import SnapshotStore
+
+app = Flask(__name__)
+
+
+def serve(store: SnapshotStore, headers):
+    with app.test_request_context("/twitter", headers=headers) as context:
+        return store.serve("twitter.html", "text/html", context.request)
+
+
+def test_revalidation_is_per_coding(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    store.write("twitter.html", b"<html>papers</html>" * 100)
+
+    gzip = serve(store, {"Accept-Encoding": "gzip"})
+    assert gzip.status_code == 200
+    assert gzip.headers["Content-Encoding"] == "gzip"
+    etag = gzip.headers["ETag"]
+
+    assert serve(store, {"Accept-Encoding": "gzip", "If-None-Match": etag}).status_code == 304
+    # A client that no longer accepts the coding gets the body it can read
+    identity = serve(store, {"If-None-Match": etag})
+    assert identity.status_code == 200
+    assert identity.headers.get("Content-Encoding") is None
+
+
+def test_missing_or_expired_snapshot(tmp_path):
+    assert serve(SnapshotStore(str(tmp_path)), {}) is None
+    store = SnapshotStore(str(tmp_path), max_age=0)
+    store.write("twitter.html", b"<html></html>")
+    assert serve(store, {}) is None